@@ -35,6 +35,7 @@ try:
     django.setup()
     from django.core.management import call_command
     from django.conf import settings
+    from teammanager import backup_catalog, backup_stream, db_fingerprint
 except ImportError:
     print("Error: Django could not be imported. Make sure Django is installed.")
     sys.exit(1)
@@ -78,16 +79,14 @@ def pull_from_git():
             
             # Check if it has content
             try:
-                with open(deployment_db_path, 'r') as f:
-                    data = json.load(f)
-                    record_count = len(data)
-                    
-                    # Only save if it has meaningful content
-                    if record_count > 0:
-                        timestamp = time.strftime('%Y%m%d_%H%M%S')
-                        backup_path = backup_dir / f"deployment_db_pre_pull_{timestamp}.json"
-                        shutil.copy2(deployment_db_path, backup_path)
-                        print(f"Deployment backup saved to {backup_path}")
+                record_count = sum(backup_stream.model_counts(deployment_db_path).values())
+                
+                # Only save if it has meaningful content
+                if record_count > 0:
+                    timestamp = time.strftime('%Y%m%d_%H%M%S')
+                    backup_path = backup_dir / f"deployment_db_pre_pull_{timestamp}.json"
+                    shutil.copy2(deployment_db_path, backup_path)
+                    print(f"Deployment backup saved to {backup_path}")
             except Exception as e:
                 print(f"Error reading deployment_db.json, not backing up: {str(e)}")
     except Exception as e:
@@ -111,11 +110,9 @@ def pull_from_git():
         else:
             # Verify content
             try:
-                with open(deployment_db_path, 'r') as f:
-                    data = json.load(f)
-                    if len(data) == 0:
-                        print("Deployment backup is empty after pull, will restore from backup")
-                        should_restore = True
+                if not backup_stream.model_counts(deployment_db_path):
+                    print("Deployment backup is empty after pull, will restore from backup")
+                    should_restore = True
             except:
                 print("Error reading deployment backup after pull, will restore from backup")
                 should_restore = True
@@ -129,19 +126,17 @@ def pull_from_git():
                 
                 # Check backup content
                 try:
-                    with open(latest_backup, 'r') as f:
-                        data = json.load(f)
-                        record_count = len(data)
+                    record_count = sum(backup_stream.model_counts(latest_backup).values())
+                    
+                    if record_count > 0:
+                        print(f"Restoring deployment_db.json from pre-pull backup: {latest_backup}")
+                        shutil.copy2(latest_backup, deployment_db_path)
                         
-                        if record_count > 0:
-                            print(f"Restoring deployment_db.json from pre-pull backup: {latest_backup}")
-                            shutil.copy2(latest_backup, deployment_db_path)
-                            
-                            # Verify restoration
-                            if deployment_db_path.exists() and deployment_db_path.stat().st_size > 100:
-                                print("Pre-pull backup successfully restored")
-                            else:
-                                print("Failed to restore pre-pull backup")
+                        # Verify restoration
+                        if deployment_db_path.exists() and deployment_db_path.stat().st_size > 100:
+                            print("Pre-pull backup successfully restored")
+                        else:
+                            print("Failed to restore pre-pull backup")
                 except Exception as e:
                     print(f"Error reading backup {latest_backup}, not restoring: {str(e)}")
         
@@ -165,53 +160,43 @@ def check_deployment_backup():
         print(f"Deployment directory not found: {deployment_dir}")
         return None
     
-    # Check for deployment_db.json
-    deployment_db_path = deployment_dir / 'deployment_db.json'
-    if deployment_db_path.exists():
-        file_size = deployment_db_path.stat().st_size
-        print(f"Found deployment_db.json, size: {file_size} bytes")
-        
-        if file_size < 100:
-            print("Warning: Deployment backup is too small, might be corrupted")
-            return None
-        
-        # Verify JSON content
-        try:
-            with open(deployment_db_path, 'r') as f:
-                data = json.load(f)
-                record_count = len(data)
-                
-                # Count important models
-                teams = len([x for x in data if x.get('model') == 'teammanager.team'])
-                players = len([x for x in data if x.get('model') == 'teammanager.player'])
-                users = len([x for x in data if x.get('model') == 'auth.user'])
-                
-                print(f"Backup contains: {teams} teams, {players} players, {users} users")
-                
-                if record_count > 0:
-                    return str(deployment_db_path)
-                else:
-                    print("Error: Backup file is empty (no records)")
-                    return None
-        except json.JSONDecodeError:
-            print("Error: Invalid JSON in deployment backup")
-            return None
-        except Exception as e:
-            print(f"Error reading backup: {str(e)}")
-            return None
-    else:
-        print("deployment_db.json not found")
-        
-        # Look for other deployment backups
-        json_backups = list(deployment_dir.glob('*.json'))
-        if json_backups:
-            # Sort by modification time, newest first
-            json_backups.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-            print(f"Found alternative backup: {json_backups[0].name}")
-            return str(json_backups[0])
-        else:
-            print("No suitable backup files found")
-            return None
+    # Catalogue new or replaced backups (a one-time read of each such file)
+    backup_catalog.refresh([deployment_dir], log=print)
+    
+    # Only the sidecars are read from here on; no backup file is opened.
+    # Prefers deployment_db.jsonl.gz (streaming format), then deployment_db.json, then the newest backup
+    entry = backup_catalog.deployment_backup([deployment_dir])
+    if entry is None:
+        print("No suitable backup files found")
+        return None
+    print(f"Found {Path(entry.path).name}, size: {entry.size} bytes, created {entry.manifest['created_at']}")
+    
+    # Count important models
+    teams = entry.count('teammanager.team')
+    players = entry.count('teammanager.player')
+    users = entry.count('auth.user')
+    print(f"Backup contains: {teams} teams, {players} players, {users} users")
+    return entry.path
+
+def database_matches_deployment_backup():
+    """Check whether the database already holds exactly what the deployment backup holds"""
+    deployment_dir = Path(settings.BASE_DIR).parent / 'deployment'
+    if not deployment_dir.exists():
+        return False
+    try:
+        backup_catalog.refresh([deployment_dir], log=print)
+        entry = backup_catalog.deployment_backup([deployment_dir])
+        if entry is None:
+            return False
+        found = db_fingerprint.differences(entry.manifest)
+    except Exception as e:
+        print(f"Could not compare the database with the deployment backup: {str(e)}")
+        return False
+    if found:
+        print(f"Database differs from {Path(entry.path).name}: {'; '.join(found[:5])}")
+        return False
+    print(f"Database already matches {Path(entry.path).name}")
+    return True
 
 def restore_backup(backup_path):
     """Restore the database from backup"""
@@ -296,7 +281,10 @@ def restore_backup(backup_path):
         
         # Load data from backup
         print("Loading data from backup...")
-        call_command('loaddata', backup_path)
+        if backup_stream.is_stream_backup(backup_path):
+            backup_stream.load_backup(backup_path)
+        else:
+            call_command('loaddata', backup_path)
         
         print("Restoration successful!")
         return True
@@ -351,22 +339,23 @@ def check_backup_content(backup_path):
     """Check if a backup has minimum required content"""
     try:
         print(f"Checking backup content in {backup_path}...")
-        with open(backup_path, 'r') as f:
-            data = json.load(f)
-            
-            # Count important models
-            teams = len([x for x in data if x.get('model') == 'teammanager.team'])
-            players = len([x for x in data if x.get('model') == 'teammanager.player'])
-            users = len([x for x in data if x.get('model') == 'auth.user'])
-            
-            print(f"Backup contains: {teams} teams, {players} players, {users} users")
-            
-            # Production backups should have reasonable content
-            if teams < 1 or players < 5:
-                print("Warning: Backup contains very few records, might not be suitable for production")
-                return False
-            
-            return True
+        # The catalog entry written by check_deployment_backup has the counts
+        manifest = backup_catalog.read_sidecar(backup_path)
+        counts = manifest['models'] if manifest and 'error' not in manifest else backup_stream.model_counts(backup_path)
+        
+        # Count important models
+        teams = counts.get('teammanager.team', 0)
+        players = counts.get('teammanager.player', 0)
+        users = counts.get('auth.user', 0)
+        
+        print(f"Backup contains: {teams} teams, {players} players, {users} users")
+        
+        # Production backups should have reasonable content
+        if teams < 1 or players < 5:
+            print("Warning: Backup contains very few records, might not be suitable for production")
+            return False
+        
+        return True
     except Exception as e:
         print(f"Error checking backup content: {str(e)}")
         return False
@@ -514,6 +503,11 @@ def main():
     print(f"Current database contains: {current_db_state['teams']} teams, "
           f"{current_db_state['players']} players, {current_db_state['users']} users")
     
+    # Fast path: nothing to pull or restore when the database already matches the deployment backup
+    if database_matches_deployment_backup():
+        print("Skipping the restore: row counts, highest ids and migrations match the backup")
+        return True
+    
     # Create a safety backup of the current database
     safety_backup = create_safety_backup()
     if safety_backup:
@@ -19,7 +19,6 @@ Run this script BEFORE auto_restore_after_deploy.py in the deployment process.
 
 import os
 import sys
-import json
 import subprocess
 import shutil
 import time
@@ -51,6 +50,7 @@ try:
     from django.conf import settings
     from django.contrib.auth.models import User
     from teammanager.models import Team, Player, Match
+    from teammanager import backup_stream
 except ImportError:
     logger.error("Error: Django could not be imported. Make sure Django is installed.")
     sys.exit(1)
@@ -80,24 +80,24 @@ def check_deployment_backup_content():
         return False, {}
     
     try:
-        with open(deployment_path, 'r') as f:
-            data = json.load(f)
-            
-            # Count key entities
-            backup_stats = {
-                'teams': len([x for x in data if x.get('model') == 'teammanager.team']),
-                'players': len([x for x in data if x.get('model') == 'teammanager.player']),
-                'matches': len([x for x in data if x.get('model') == 'teammanager.match']),
-                'users': len([x for x in data if x.get('model') == 'auth.user']),
-                'total': len(data),
-            }
-            
-            # Check for minimum content
-            if backup_stats['teams'] < 1 or backup_stats['players'] < 5:
-                logger.warning("Deployment backup has insufficient content")
-                return False, backup_stats
-            
-            return True, backup_stats
+        # Streams the file (or reads just the manifest) instead of loading it whole
+        counts = backup_stream.model_counts(deployment_path)
+        
+        # Count key entities
+        backup_stats = {
+            'teams': counts.get('teammanager.team', 0),
+            'players': counts.get('teammanager.player', 0),
+            'matches': counts.get('teammanager.match', 0),
+            'users': counts.get('auth.user', 0),
+            'total': sum(counts.values()),
+        }
+        
+        # Check for minimum content
+        if backup_stats['teams'] < 1 or backup_stats['players'] < 5:
+            logger.warning("Deployment backup has insufficient content")
+            return False, backup_stats
+        
+        return True, backup_stats
     except Exception as e:
         logger.error(f"Error checking deployment backup: {str(e)}")
         return False, {}
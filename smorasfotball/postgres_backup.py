@@ -7,14 +7,19 @@ It performs the following steps:
 1. Verifies PostgreSQL is properly configured
 2. Dumps all data using Django's dumpdata management command
 3. Creates SQL backups using pg_dump if available
-4. Stores backups in multiple locations for redundancy
+4. Stores backups in multiple locations for redundancy (each backup is
+   written once and then linked or copied to every location, see
+   teammanager/backup_fanout.py)
 
 Usage:
-    python postgres_backup.py [--deployment]
+    python postgres_backup.py [--deployment] [--incremental]
 
 Options:
     --deployment    If specified, creates a backup in the deployment directory
                    for redeployment purposes.
+    --incremental   Instead of a full JSON dump, add only the rows changed since
+                   the last backup to the chain in each directory's
+                   incremental/ folder (see teammanager/incremental_backup.py).
 """
 
 import os
@@ -34,6 +39,8 @@ from django.core.management import call_command
 from django.db import connections
 from django.conf import settings
 
+from teammanager import backup_catalog, backup_fanout
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="Create PostgreSQL database backups")
@@ -45,6 +52,8 @@ def parse_args():
                       help='Create only SQL backup (no JSON export)')
     parser.add_argument('--output-dir', 
                       help='Custom output directory for backups')
+    parser.add_argument('--incremental', action='store_true',
+                      help='Back up only rows changed since the last backup (JSON)')
     return parser.parse_args()
 
 def is_postgres_configured():
@@ -107,21 +116,52 @@ def get_backup_directories(is_deployment=False):
     return backup_dirs
 
 def create_json_backup(backup_dirs, timestamp):
-    """Create Django JSON backup using dumpdata"""
-    backup_files = []
+    """Create Django JSON backup using dumpdata, once, and copy it to every backup directory"""
+    filename = f'backup_postgres_{timestamp}.json'
     
-    for backup_dir in backup_dirs:
-        backup_file = os.path.join(backup_dir, f'backup_postgres_{timestamp}.json')
-        
-        print(f"Creating JSON backup: {backup_file}")
-        try:
-            call_command('dumpdata', '--exclude=contenttypes', '--exclude=auth.permission', 
-                         '--indent=2', output=backup_file)
-            backup_files.append(backup_file)
-            print(f"JSON backup created: {backup_file}")
-        except Exception as e:
-            print(f"Error creating JSON backup: {e}")
+    print(f"Creating JSON backup {filename} for {len(backup_dirs)} location(s)")
+    try:
+        placed, failed = backup_fanout.write_once(filename, backup_dirs, lambda path: call_command(
+            'dumpdata', '--exclude=contenttypes', '--exclude=auth.permission',
+            '--exclude=teammanager.backupchange', '--natural-foreign', '--indent=2', output=path
+        ))
+    except Exception as e:
+        print(f"Error creating JSON backup: {e}")
+        return []
     
+    for backup_file, error in failed.items():
+        print(f"Error writing JSON backup {backup_file}: {error}")
+    for backup_file, method in placed.items():
+        print(f"JSON backup created: {backup_file} ({method}, verified)")
+    return list(placed)
+
+def create_incremental_backups(backup_dirs):
+    """
+    Add an increment to the backup chain (a base backup if there is none).
+    There is one chain, kept in every directory: each file is written once
+    and placed in all of them.
+    """
+    from teammanager import incremental_backup
+
+    chain_dirs = [os.path.join(backup_dir, 'incremental') for backup_dir in backup_dirs]
+    backup_files = []
+    try:
+        kind, entry = incremental_backup.create_backup(chain_dirs[0], copies=chain_dirs[1:])
+        if entry is None:
+            print("No changes since the last backup")
+        else:
+            for chain_dir in chain_dirs:
+                backup_file = os.path.join(chain_dir, entry['file'])
+                if os.path.exists(backup_file):
+                    backup_files.append(backup_file)
+                    print(f"{kind.capitalize()} backup created: {backup_file}")
+                else:
+                    print(f"Could not place {entry['file']} in {chain_dir}; it is copied there with the next backup")
+    except Exception as e:
+        print(f"Error creating incremental backup: {e}")
+
+    # Drop change log entries every copy of the chain has already captured
+    incremental_backup.prune_changes(chain_dirs)
     return backup_files
 
 def create_pg_dump_backup(backup_dirs, timestamp):
@@ -141,27 +181,31 @@ def create_pg_dump_backup(backup_dirs, timestamp):
         print("DATABASE_URL not set, skipping SQL backup")
         return backup_files
     
-    for backup_dir in backup_dirs:
-        backup_file = os.path.join(backup_dir, f'backup_postgres_{timestamp}.sql')
-        
-        print(f"Creating SQL backup: {backup_file}")
-        try:
-            command = [
-                'pg_dump',
-                '--dbname', db_url,
-                '--format', 'plain',
-                '--file', backup_file
-            ]
-            
-            result = subprocess.run(command, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                backup_files.append(backup_file)
-                print(f"SQL backup created: {backup_file}")
-            else:
-                print(f"Error creating SQL backup: {result.stderr}")
-        except Exception as e:
-            print(f"Error running pg_dump: {e}")
+    filename = f'backup_postgres_{timestamp}.sql'
+    
+    def run_pg_dump(path):
+        command = [
+            'pg_dump',
+            '--dbname', db_url,
+            '--format', 'plain',
+            '--file', path
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+    
+    print(f"Creating SQL backup {filename} for {len(backup_dirs)} location(s)")
+    try:
+        placed, failed = backup_fanout.write_once(filename, backup_dirs, run_pg_dump)
+    except Exception as e:
+        print(f"Error creating SQL backup: {e}")
+        return backup_files
+    
+    for backup_file, error in failed.items():
+        print(f"Error writing SQL backup {backup_file}: {error}")
+    for backup_file, method in placed.items():
+        backup_files.append(backup_file)
+        print(f"SQL backup created: {backup_file} ({method}, verified)")
     
     return backup_files
 
@@ -184,6 +228,7 @@ def cleanup_old_backups(backup_dirs, max_backups=5):
         for old_backup in json_backups[max_backups:]:
             try:
                 os.remove(os.path.join(backup_dir, old_backup))
+                backup_catalog.remove(os.path.join(backup_dir, old_backup))
                 print(f"Removed old JSON backup: {old_backup}")
             except Exception as e:
                 print(f"Failed to remove old backup {old_backup}: {e}")
@@ -192,10 +237,22 @@ def cleanup_old_backups(backup_dirs, max_backups=5):
         for old_backup in sql_backups[max_backups:]:
             try:
                 os.remove(os.path.join(backup_dir, old_backup))
+                backup_catalog.remove(os.path.join(backup_dir, old_backup))
                 print(f"Removed old SQL backup: {old_backup}")
             except Exception as e:
                 print(f"Failed to remove old backup {old_backup}: {e}")
 
+def dedupe_backups(backup_dirs):
+    """Hard link identical backups to one copy in the content-addressed store"""
+    from teammanager import backup_store
+
+    try:
+        linked, freed = backup_store.dedupe(backup_dirs, log=print)
+        if linked:
+            print(f"Linked {linked} duplicate backup(s) to the backup store, {freed} bytes freed")
+    except Exception as e:
+        print(f"Error deduplicating backups: {e}")
+
 def main():
     """Main backup function"""
     args = parse_args()
@@ -234,19 +291,24 @@ def main():
     sql_backups = []
     
     # 4. Create JSON backups (if not sql_only)
-    if not hasattr(args, 'sql_only') or not args.sql_only:
+    if args.incremental:
+        json_backups = create_incremental_backups(backup_dirs)
+    elif not hasattr(args, 'sql_only') or not args.sql_only:
         json_backups = create_json_backup(backup_dirs, timestamp)
     else:
         print("Skipping JSON backup creation (--sql-only specified).")
     
     # 5. Create SQL backups with pg_dump (if not json_only)
-    if not hasattr(args, 'json_only') or not args.json_only:
+    if args.incremental:
+        print("Skipping SQL backup creation (--incremental specified).")
+    elif not hasattr(args, 'json_only') or not args.json_only:
         sql_backups = create_pg_dump_backup(backup_dirs, timestamp)
     else:
         print("Skipping SQL backup creation (--json-only specified).")
     
-    # 6. Clean up old backups
+    # 6. Clean up old backups and store identical ones only once
     cleanup_old_backups(backup_dirs)
+    dedupe_backups(backup_dirs)
     
     # 7. Report results
     print("\n" + "=" * 80)
@@ -263,7 +325,9 @@ def main():
         for backup in sql_backups:
             print(f"  - {backup}")
     
-    if not json_backups and not sql_backups:
+    if args.incremental and not json_backups:
+        print("\nNothing changed since the last backup.")
+    elif not json_backups and not sql_backups:
         print("\nNo backups were created successfully.")
         sys.exit(1)
     
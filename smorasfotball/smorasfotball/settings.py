@@ -4,6 +4,7 @@ Generated by 'django-admin startproject' using Django 4.2.
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,13 +31,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'teammanager.query_budget.QueryCountMiddleware',  # Outermost, so it sees every query
+    'teammanager.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Add locale middleware for language selection
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'teammanager.roles.RolesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'teammanager.db_router.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'smorasfotball.urls'
@@ -52,6 +57,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'teammanager.roles.roles',
             ],
         },
     },
@@ -63,19 +69,32 @@ WSGI_APPLICATION = 'smorasfotball.wsgi.application'
 import os
 import dj_database_url
 
-# ALWAYS use PostgreSQL in production
-# Check for DATABASE_URL environment variable
-if os.environ.get('DATABASE_URL'):
-    print("PostgreSQL detected via DATABASE_URL")
-    
-    # PostgreSQL configuration with enhanced settings for deployment reliability
-    database_config = dj_database_url.config(
-        default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600,
-        conn_health_checks=True,
-    )
-    
-    # Add special options to enhance PostgreSQL connection reliability
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def postgres_database(url):
+    """
+    PostgreSQL settings for ``url``. Connections are reused across requests
+    instead of opening a new TLS connection for each one:
+
+    DB_POOL=1              use a psycopg 3 connection pool per worker process
+                           (needs the psycopg[pool] package; otherwise falls
+                           back to persistent connections)
+    DB_POOL_MIN_SIZE       connections kept open per worker (default 1)
+    DB_POOL_MAX_SIZE       most connections per worker (default 4)
+    DB_POOL_MAX_LIFETIME   seconds before a pooled connection is replaced (default 1800)
+    DB_POOL_MAX_IDLE       seconds an extra idle connection is kept (default 300)
+    DB_POOL_TIMEOUT        seconds to wait for a free connection (default 10)
+    DB_CONN_MAX_AGE        without a pool, seconds a connection is reused; 0
+                           reconnects for every request (default 600)
+    DB_CONN_HEALTH_CHECKS  check a reused connection before each request (default on)
+    """
+    database_config = dj_database_url.config(default=url)
+    # Add special options to enhance PostgreSQL connection reliability;
+    # options given in the URL (e.g. ?sslmode=disable for a local server) win
+    url_options = database_config.get('OPTIONS', {})
     database_config['OPTIONS'] = {
         'sslmode': 'require',
         'connect_timeout': 10,
@@ -83,109 +102,66 @@ if os.environ.get('DATABASE_URL'):
         'keepalives_idle': 30,
         'keepalives_interval': 10,
         'keepalives_count': 5,
+        **url_options,
     }
-    
-    # Log the database engine type (without sensitive info)
-    print(f"Database engine: {database_config.get('ENGINE', 'unknown')}")
-    
+    database_config['ATOMIC_REQUESTS'] = True  # Wrap requests in transactions
+
+    pool = None
+    if _env_flag('DB_POOL', 'false'):
+        try:
+            from psycopg_pool import ConnectionPool
+            pool = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+                'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+                'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                # Test each connection as it is handed out, replacing dead ones
+                'check': ConnectionPool.check_connection,
+            }
+        except ImportError:
+            pass  # bootstrap_database reports this; persistent connections are used instead
+
+    if pool:
+        # The pool hands out and takes back connections; Django must not keep them itself
+        database_config['OPTIONS']['pool'] = pool
+        database_config['CONN_MAX_AGE'] = 0
+        database_config['CONN_HEALTH_CHECKS'] = False
+    else:
+        database_config['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+        database_config['CONN_HEALTH_CHECKS'] = _env_flag('DB_CONN_HEALTH_CHECKS', 'true')
+    return database_config
+
+
+# ALWAYS use PostgreSQL in production.
+# Loading settings only reads the environment: provisioning a database, saving
+# its credentials and reporting on it is done by `manage.py bootstrap_database`.
+if os.environ.get('DATABASE_URL'):
     DATABASES = {
-        'default': database_config
+        'default': postgres_database(os.environ.get('DATABASE_URL'))
     }
-    
-    # Retry connection on failures (helps with Replit deployments)
-    DATABASES['default']['CONN_MAX_AGE'] = 0  # Reconnect for each request
-    DATABASES['default']['ATOMIC_REQUESTS'] = True  # Wrap requests in transactions
 else:
-    # If DATABASE_URL is not set, this is a critical error in production
-    # We'll still define a fallback SQLite database for testing purposes only
-    print("WARNING: No DATABASE_URL found! The application should always use PostgreSQL in production.")
-    print("This fallback should only be used for testing environments.")
-    
-    # Check for production environment marker
-    is_production = os.path.exists(os.path.join(os.path.dirname(BASE_DIR), 'deployment', 'IS_PRODUCTION_ENVIRONMENT'))
-    if is_production:
-        print("ERROR: This appears to be a production environment, but DATABASE_URL is not set!")
-        print("This is a critical configuration error that must be fixed.")
-        
-        # Since this is a production environment, automatically try to create a PostgreSQL database
-        try:
-            import subprocess
-            print("Attempting to create PostgreSQL database and fix configuration...")
-            
-            # First, try to run our automatic PostgreSQL creation script
-            script_path = os.path.join(os.path.dirname(BASE_DIR), 'create_postgres_db.py')
-            if os.path.exists(script_path):
-                result = subprocess.run(['python', script_path], capture_output=True, text=True)
-                print(result.stdout)
-                
-                # If that worked, DATABASE_URL should be set in environment
-                if os.environ.get('DATABASE_URL'):
-                    print("Successfully created PostgreSQL database!")
-                    
-                    # Construct database config from the updated environment variable
-                    import dj_database_url
-                    database_config = dj_database_url.config(
-                        default=os.environ.get('DATABASE_URL'),
-                        conn_max_age=600,
-                        conn_health_checks=True,
-                    )
-                    
-                    # Add special options to enhance PostgreSQL connection reliability
-                    database_config['OPTIONS'] = {
-                        'sslmode': 'require',
-                        'connect_timeout': 10,
-                        'keepalives': 1,
-                        'keepalives_idle': 30,
-                        'keepalives_interval': 10,
-                        'keepalives_count': 5,
-                    }
-                    
-                    print(f"Using dynamically created PostgreSQL database.")
-                    DATABASES = {
-                        'default': database_config
-                    }
-                    
-                    # Continue with normal initialization - don't use SQLite
-                    # This will skip the SQLite configuration below
-                    
-                    # Also save this URL for future use
-                    try:
-                        # Save credentials to deployment directory
-                        deployment_dir = os.path.join(os.path.dirname(BASE_DIR), 'deployment')
-                        os.makedirs(deployment_dir, exist_ok=True)
-                        
-                        creds_file = os.path.join(deployment_dir, 'postgres_credentials.json')
-                        
-                        # Save only the DATABASE_URL to avoid saving other sensitive credentials
-                        import json
-                        with open(creds_file, 'w') as f:
-                            json.dump({'DATABASE_URL': os.environ.get('DATABASE_URL')}, f)
-                        
-                        print(f"PostgreSQL credentials saved for future use")
-                    except Exception as e:
-                        print(f"Warning: Could not save PostgreSQL credentials: {e}")
-                    
-                    # Skip the SQLite configuration
-                    print("Automatically switched to PostgreSQL - no need for SQLite fallback")
-                    
-                    # We need to use this to tell the rest of the function to skip SQLite config
-                    _USING_POSTGRES_DYNAMIC = True
-        except Exception as e:
-            print(f"Error attempting to set up PostgreSQL: {e}")
-            _USING_POSTGRES_DYNAMIC = False
-    
-    # Only use SQLite if we didn't dynamically set up PostgreSQL above
-    if not locals().get('_USING_POSTGRES_DYNAMIC', False):
-        # Fallback to SQLite (for development or testing only)
-        DB_DIR = os.environ.get('DATABASE_DIR', os.path.join(os.path.dirname(BASE_DIR), 'deployment'))
-        os.makedirs(DB_DIR, exist_ok=True)
-        
-        DATABASES = {
-            'default': {
-                'ENGINE': 'django.db.backends.sqlite3',
-                'NAME': os.path.join(DB_DIR, 'db.sqlite3'),
-            }
+    # Fallback to SQLite (for development or testing only)
+    DB_DIR = os.environ.get('DATABASE_DIR', os.path.join(os.path.dirname(BASE_DIR), 'deployment'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(DB_DIR, 'db.sqlite3'),
         }
+    }
+
+# Optional read replica for statistics and exports (see teammanager/db_router.py)
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = postgres_database(os.environ.get('DATABASE_REPLICA_URL'))
+    DATABASES['replica']['ATOMIC_REQUESTS'] = False
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['teammanager.db_router.ReplicaRouter']
+# Seconds a client reads from the primary after a POST, while the replica catches up
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10))
+
+# Where each process writes its metrics for /metrics/ to merge (see teammanager/metrics.py);
+# the gunicorn workers must share it. Empty keeps metrics per process
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'smorasfotball-metrics'))
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -13,11 +13,13 @@ from django.contrib.auth.views import LoginView
 from .views import change_language
 from .views_documentation import documentation_index, download_pdf_documentation
 from teammanager.views_auth import CustomLoginView
+from teammanager.views_metrics import metrics_view
 
 urlpatterns = [
     path('i18n/', include('django.conf.urls.i18n')),
     path('set-language/<str:language>/', change_language, name='change_language'),
     path('rosetta/', include('rosetta.urls')),  # Translation interface
+    path('metrics/', metrics_view, name='metrics'),  # Prometheus scrape endpoint, superusers only
 ]
 
 # Configure admin site
@@ -127,7 +127,7 @@ if [ -f "$PRODUCTION_MARKER" ] || [ -f "$DEPLOYMENT_SQLITE" ] || [ -f "$DEPLOYME
     # Make a copy of existing database if it exists (just in case)
     if [ -f "db.sqlite3" ]; then
         TIMESTAMP=$(date +"%Y%m%d_%H%M%S")
-        cp "db.sqlite3" "db.sqlite3.${TIMESTAMP}.pre_restore"
+        python manage.py sqlite_backup "db.sqlite3" "db.sqlite3.${TIMESTAMP}.pre_restore"
         echo "Created safety copy of current database: db.sqlite3.${TIMESTAMP}.pre_restore"
     fi
     
@@ -138,19 +138,18 @@ if [ -f "$PRODUCTION_MARKER" ] || [ -f "$DEPLOYMENT_SQLITE" ] || [ -f "$DEPLOYME
     echo "Method 1: Using deployment_backup management command..."
     python manage.py deployment_backup --restore
     
-    # Method 2: Direct file copy for SQLite (most reliable method)
+    # Method 2: SQLite online restore (most reliable method)
     if [ -f "$DEPLOYMENT_SQLITE" ]; then
-        echo "Method 2: Using direct SQLite file copy (most reliable)..."
-        cp "$DEPLOYMENT_SQLITE" db.sqlite3
+        echo "Method 2: Using SQLite online restore (most reliable)..."
+        python manage.py sqlite_backup "$DEPLOYMENT_SQLITE" db.sqlite3 --restore
         chmod 644 db.sqlite3
-        echo "SQLite backup applied directly via file copy"
+        echo "SQLite backup applied via the online backup API"
     fi
     
     # Method 3: JSON restoration
     if [ -f "$DEPLOYMENT_JSON" ] && [ ! -f "$DEPLOYMENT_SQLITE" ]; then
         echo "Method 3: Using JSON restoration..."
-        python manage.py flush --no-input
-        python manage.py loaddata "$DEPLOYMENT_JSON"
+        python manage.py restore_database "$DEPLOYMENT_JSON" --force
         echo "JSON backup restored"
     fi
     
@@ -199,8 +198,8 @@ if [ ! -z "$LATEST_BACKUP" ]; then
     
     if [ "$BACKUP_TYPE" == "sqlite" ]; then
         echo "Restoring from SQLite backup..."
-        # Make a copy of the backup to the db.sqlite3 file
-        cp "$LATEST_BACKUP" db.sqlite3
+        # Write the backup into the db.sqlite3 file
+        python manage.py sqlite_backup "$LATEST_BACKUP" db.sqlite3 --restore
         echo "SQLite database restored from backup"
         
         # Record which backup was used for diagnostic purposes
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from .incremental_backup import record_queryset
 from .models import Team, Player, Match, MatchAppearance, UserProfile
+from .roles import invalidate_roles
 
 
 # We don't need PlayerInline anymore since Player doesn't have a ForeignKey to Team
@@ -84,12 +86,21 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_editable = ('role', 'status')
     actions = ['approve_users', 'reject_users']
     
+    def _set_status(self, queryset, status):
+        # update() sends no post_save, so log the change and drop the cached roles here
+        user_ids = list(queryset.values_list('user_id', flat=True))
+        updated = queryset.update(status=status)
+        record_queryset(queryset)
+        for user_id in user_ids:
+            invalidate_roles(user_id)
+        return updated
+    
     def approve_users(self, request, queryset):
-        queryset.update(status='approved')
-        self.message_user(request, f"{queryset.count()} users have been approved.")
+        updated = self._set_status(queryset, 'approved')
+        self.message_user(request, f"{updated} users have been approved.")
     approve_users.short_description = "Approve selected users"
     
     def reject_users(self, request, queryset):
-        queryset.update(status='rejected')
-        self.message_user(request, f"{queryset.count()} users have been rejected.")
+        updated = self._set_status(queryset, 'rejected')
+        self.message_user(request, f"{updated} users have been rejected.")
     reject_users.short_description = "Reject selected users"
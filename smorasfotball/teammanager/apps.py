@@ -1,12 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
+import os
 import sys
 
 
+def create_sqlite_directories():
+    """SQLite creates its database file but not the directory; settings only read DATABASE_DIR"""
+    for database in settings.DATABASES.values():
+        name = str(database.get('NAME') or '')
+        if database.get('ENGINE') != 'django.db.backends.sqlite3' or name == ':memory:' or name.startswith('file:'):
+            continue
+        os.makedirs(os.path.dirname(os.path.abspath(name)), exist_ok=True)
+
+
 class TeammanagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'teammanager'
     
     def ready(self):
         # We've removed the automatic backup code since we're now using PostgreSQL
-        # The database is automatically backed up by the Replit infrastructure
-        pass
+        # The database is automatically backed up by the Replit infrastructure.
+        # Saves and deletes are still logged for incremental backups.
+        from . import incremental_backup
+        incremental_backup.connect_signals()
+        create_sqlite_directories()
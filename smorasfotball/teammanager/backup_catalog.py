@@ -0,0 +1,406 @@
+"""
+Backup catalog: a small sidecar manifest for every backup file.
+
+For ``<dir>/<name>`` the manifest lives in ``<dir>/.catalog/<name>.json``
+(a hidden folder, so the existing ``*.json`` globs in the deployment scripts
+never pick it up) and records:
+
+    kind        json, jsonl, sqlite or incremental
+    created_at  when the backup was taken
+    size        file size in bytes, used to spot truncated or replaced files
+    mtime_ns    modification time and inode of the file, so a file replaced
+    inode       by one of the same size is spotted too
+    sha256      content hash of the whole file, used to find duplicates
+    models      {model label: row count}
+    total       sum of the counts
+    max_pks     {model label: highest primary key} (None when unknown)
+    error       instead of the counts, for files that could not be read
+    migrations  {app: latest applied migration} of the database the backup
+                was taken from (None when unknown)
+
+Backups written by this app are catalogued as they are written. Older files
+can be indexed once with ``manage.py backup_catalog --index``. After that,
+listing backups, picking the newest valid one and finding duplicates only
+reads the sidecars and stats the files; no backup is opened or parsed.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from . import backup_stream
+
+CATALOG_DIR = '.catalog'
+BLOCK_SIZE = 1024 * 1024
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3')
+# The live SQLite database sits next to the backups in deployment/
+LIVE_DATABASE_NAMES = ('db.sqlite3',)
+# "<backup>.bak" and "<backup>.20250328_003011.bak" copies
+BAK_SUFFIX = re.compile(r'(\.\d{8}_\d{6})?\.bak$')
+# The timestamp most backup scripts put in file names: _20250328_084127 or _20250328
+NAME_TIMESTAMP = re.compile(r'(\d{8})(?:_(\d{6}))?')
+# Kinds that can be restored on their own (increments need their chain)
+STANDALONE_KINDS = ('json', 'jsonl', 'sqlite')
+# The backup a deployment restores from, in order of preference; otherwise the newest one
+DEPLOYMENT_BACKUP_NAMES = ('deployment_db.jsonl.gz', 'deployment_db.json')
+
+
+def sidecar_path(path):
+    directory, name = os.path.split(str(path))
+    return os.path.join(directory, CATALOG_DIR, f'{name}.json')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _latest_migrations(applied):
+    """{app: name of the highest numbered applied migration} from (app, name) pairs"""
+    latest = {}
+    for app, name in sorted(applied):
+        latest[app] = name
+    return latest
+
+
+def current_migration_state():
+    return _latest_migrations(MigrationRecorder(connection).applied_migrations())
+
+
+def backup_kind(path):
+    name = os.path.basename(str(path))
+    if name in LIVE_DATABASE_NAMES or name.startswith('.'):
+        return None  # Hidden files are temporary files of backups being written
+    if BAK_SUFFIX.search(name):
+        original = BAK_SUFFIX.sub('', name)
+        # A copy of the live database is a backup like any other
+        return 'sqlite' if original in LIVE_DATABASE_NAMES else backup_kind(original)
+    if backup_stream.is_stream_backup(name):
+        return 'jsonl'
+    if name.endswith(SQLITE_EXTENSIONS):
+        return 'sqlite'
+    if name.endswith('.json'):
+        return 'incremental' if name.startswith('backup_incremental_') else 'json'
+    return None
+
+
+def name_timestamp(name):
+    """The last timestamp in a backup's file name, or None"""
+    for match in reversed(list(NAME_TIMESTAMP.finditer(name))):
+        try:
+            return datetime.strptime(''.join(match.groups('000000')), '%Y%m%d%H%M%S').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def _sqlite_contents(path):
+    """(row counts, highest primary keys, migration state) read from a SQLite backup file"""
+    counts, max_pks = {}, {}
+    migrations = None
+    # Tables of known models are reported by model label, like the other kinds of backup
+    models = {model._meta.db_table: model._meta for model in apps.get_models()}
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        tables = [row[0] for row in source.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in tables:
+            meta = models.get(table)
+            if meta is None:
+                counts[table] = source.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                continue
+            counts[meta.label_lower], max_pks[meta.label_lower] = source.execute(
+                f'SELECT COUNT(*), MAX("{meta.pk.column}") FROM "{table}"'
+            ).fetchone()
+        if 'django_migrations' in tables:
+            migrations = _latest_migrations(source.execute('SELECT app, name FROM django_migrations'))
+    finally:
+        source.close()
+    return counts, max_pks, migrations
+
+
+def _object_stats(objects):
+    """(row counts, highest primary keys) of serialized objects"""
+    counts, max_pks = {}, {}
+    for obj in objects:
+        label = obj.get('model', 'unknown')
+        counts[label] = counts.get(label, 0) + 1
+        pk = obj.get('pk')
+        if pk is not None and (max_pks.get(label) is None or pk > max_pks[label]):
+            max_pks[label] = pk
+    return counts, max_pks
+
+
+def _scan_contents(path, kind):
+    """Counts, highest primary keys and migration state (where known) by reading the backup once"""
+    if kind == 'sqlite':
+        return _sqlite_contents(path)
+    if kind == 'incremental':
+        with open(path) as f:
+            increment = json.load(f)
+        counts, _ = _object_stats(increment['objects'])
+        # An increment holds changed rows only, so their primary keys say nothing about the tables
+        return counts, None, None
+    if kind == 'jsonl':
+        manifest = backup_stream.validate_backup(path)
+        if manifest.get('max_pks') is not None:
+            return manifest['models'], manifest['max_pks'], manifest.get('migrations')
+    return (*_object_stats(backup_stream.iter_backup_objects(path)), None)
+
+
+def index_backup(path, counts=None, migrations=None, created_at=None, max_pks=None):
+    """
+    Write the sidecar manifest for a backup file and return it.
+
+    Writers pass the counts, primary keys and migration state they already
+    know; when indexing an existing file they are read from it instead, or
+    kept from its previous sidecar when the content has not changed (a git
+    checkout rewrites a file without changing it, and a JSON backup does
+    not record the migration state itself). ``created_at``
+    defaults to the timestamp in the file name, or else the file's
+    modification time (which a git checkout resets).
+    """
+    kind = backup_kind(path)
+    if kind is None:
+        raise ValueError(f"{path} is not a known kind of backup")
+    sha256 = file_sha256(path)
+    if counts is None:
+        previous = read_sidecar(path)
+        if previous is not None and previous.get('sha256') == sha256 and 'error' not in previous:
+            counts, max_pks = previous['models'], previous.get('max_pks')
+            migrations = migrations or previous.get('migrations')
+            if created_at is None:
+                created_at = datetime.fromisoformat(previous['created_at'])
+        else:
+            counts, max_pks, scanned_migrations = _scan_contents(path, kind)
+            migrations = migrations or scanned_migrations
+    stat = os.stat(path)
+    if created_at is None:
+        created_at = name_timestamp(os.path.basename(str(path)))
+    if created_at is None:
+        created_at = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+
+    manifest = {
+        'file': os.path.basename(str(path)),
+        'kind': kind,
+        'created_at': created_at.isoformat(),
+        **_file_state(stat),
+        'sha256': sha256,
+        'models': counts,
+        'total': sum(counts.values()),
+        'max_pks': max_pks,
+        'migrations': migrations,
+    }
+    _write_sidecar(path, manifest)
+    return manifest
+
+
+def _file_state(stat):
+    """What a sidecar records to tell whether its file has changed since"""
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def _write_sidecar(path, manifest):
+    sidecar = sidecar_path(path)
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    temp_path = f'{sidecar}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, sidecar)
+
+
+def _mark_unreadable(path, error):
+    """Catalogue a file that looks like a backup but isn't one, so it is not read again"""
+    stat = os.stat(path)
+    _write_sidecar(path, {
+        'file': os.path.basename(str(path)),
+        'kind': backup_kind(path),
+        'created_at': datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc).isoformat(),
+        **_file_state(stat),
+        'error': str(error),
+    })
+
+
+def catalog_new_backup(path, counts=None, max_pks=None):
+    """Index a backup that was just taken from the current database"""
+    return index_backup(
+        path, counts=counts, migrations=current_migration_state(), created_at=timezone.now(), max_pks=max_pks
+    )
+
+
+def copy_sidecar(source, path):
+    """Catalogue ``path`` as an identical copy of the catalogued backup ``source``"""
+    _write_sidecar(path, dict(read_sidecar(source), file=os.path.basename(str(path)), **_file_state(os.stat(path))))
+
+
+def refresh_file_state(path):
+    """Keep the sidecar of ``path`` current after the file was replaced by one with the same content"""
+    _write_sidecar(path, dict(read_sidecar(path), **_file_state(os.stat(path))))
+
+
+def read_sidecar(path):
+    try:
+        with open(sidecar_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove(path):
+    """Delete a backup's sidecar (call when deleting the backup itself)"""
+    try:
+        os.remove(sidecar_path(path))
+    except FileNotFoundError:
+        pass
+
+
+class CatalogEntry:
+    """A catalogued backup: its path, sidecar manifest and the file's current ``os.stat`` (None if it is gone)"""
+
+    def __init__(self, path, manifest, stat):
+        self.path = path
+        self.manifest = manifest
+        self.stat = stat
+        self.size = stat.st_size if stat is not None else None
+
+    @property
+    def created_at(self):
+        return datetime.fromisoformat(self.manifest['created_at'])
+
+    @property
+    def exists(self):
+        return self.size is not None
+
+    @property
+    def is_current(self):
+        """The file is still there with the size, modification time and inode it had when it was catalogued"""
+        if self.stat is None or self.size != self.manifest['size']:
+            return False
+        if 'mtime_ns' not in self.manifest:
+            return True  # Catalogued before modification times were recorded
+        return self.stat.st_mtime_ns == self.manifest['mtime_ns'] and self.stat.st_ino == self.manifest['inode']
+
+    @property
+    def is_valid(self):
+        """A current sidecar for a readable backup"""
+        return self.is_current and 'error' not in self.manifest
+
+    def count(self, label):
+        return self.manifest['models'].get(label, 0)
+
+    def schema_matches(self, migrations):
+        return self.manifest['migrations'] is not None and self.manifest['migrations'] == migrations
+
+    def __repr__(self):
+        return f'<CatalogEntry {self.path}>'
+
+
+def list_backups(directories):
+    """Catalogued backups in these directories, newest first"""
+    entries = []
+    for directory in directories:
+        catalog = os.path.join(str(directory), CATALOG_DIR)
+        if not os.path.isdir(catalog):
+            continue
+        for item in os.scandir(catalog):
+            if not item.name.endswith('.json'):
+                continue
+            with open(item.path) as f:
+                try:
+                    manifest = json.load(f)
+                except ValueError:
+                    continue
+            path = os.path.join(str(directory), manifest['file'])
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            entries.append(CatalogEntry(path, manifest, stat))
+    entries.sort(key=lambda entry: entry.created_at, reverse=True)
+    return entries
+
+
+def uncatalogued(directories):
+    """Backup files in these directories that have no sidecar yet"""
+    paths = []
+    for directory in directories:
+        if not os.path.isdir(str(directory)):
+            continue
+        for item in os.scandir(str(directory)):
+            if item.is_file() and backup_kind(item.name) and not os.path.exists(sidecar_path(item.path)):
+                paths.append(item.path)
+    return sorted(paths)
+
+
+def refresh(directories, log=None):
+    """
+    Index backups without a sidecar and re-index those whose size,
+    modification time or inode no longer match theirs (e.g. replaced by a
+    git pull). Each such file is read once.
+    Files that cannot be read are reported through ``log`` and catalogued as
+    unreadable, so they are skipped until they change. Returns the number of
+    files indexed.
+    """
+    stale = [entry.path for entry in list_backups(directories) if entry.exists and not entry.is_current]
+    pending = uncatalogued(directories) + stale
+    for path in pending:
+        try:
+            index_backup(path)
+        except Exception as e:
+            _mark_unreadable(path, e)
+            if log:
+                log(f"Could not catalogue {os.path.basename(path)}: {e}")
+    return len(pending)
+
+
+def newest_valid(directories, kinds=STANDALONE_KINDS, migrations=None, min_total=1):
+    """
+    The newest intact backup of one of ``kinds`` with at least ``min_total``
+    objects, or None. With ``migrations``, only backups taken at exactly that
+    migration state qualify.
+    """
+    for entry in list_backups(directories):
+        if entry.manifest['kind'] not in kinds or not entry.is_valid:
+            continue
+        if entry.manifest['total'] < min_total:
+            continue
+        if migrations is not None and not entry.schema_matches(migrations):
+            continue
+        return entry
+    return None
+
+
+def deployment_backup(directories):
+    """
+    The backup a deployment restores from: a valid JSON or JSON Lines backup
+    with data, preferring the ``DEPLOYMENT_BACKUP_NAMES`` over the newest one.
+    None when there is none.
+    """
+    entries = [
+        entry for entry in list_backups(directories)
+        if entry.is_valid and entry.manifest['kind'] in ('json', 'jsonl') and entry.manifest['total'] > 0
+    ]
+    if not entries:
+        return None
+    preference = {name: rank for rank, name in enumerate(DEPLOYMENT_BACKUP_NAMES)}
+    return min(entries, key=lambda entry: preference.get(os.path.basename(entry.path), len(preference)))
+
+
+def duplicates(directories):
+    """Groups of catalogued backups with identical content, newest first within each group"""
+    by_hash = {}
+    for entry in list_backups(directories):
+        if entry.is_valid:
+            by_hash.setdefault(entry.manifest['sha256'], []).append(entry)
+    return [group for group in by_hash.values() if len(group) > 1]
@@ -0,0 +1,152 @@
+"""
+Write a backup once and fan it out to every backup directory.
+
+``postgres_backup.get_backup_directories`` returns several redundancy
+targets. Instead of running dumpdata or pg_dump once per target, ``write_once``
+serialises into a temporary file in the first directory, fsyncs it, and then
+places it in every directory:
+
+1. as a reflink (a copy-on-write clone, Linux FICLONE) where the filesystem
+   supports it: an independent file that shares blocks until either changes
+2. as a hard link when the directory is on the same filesystem
+3. otherwise as a copy; copies to the different targets run in parallel
+
+Every destination is written under a temporary name, fsynced, renamed into
+place and then hashed and compared with the source, so a target either has
+the complete, verified backup or none at all.
+"""
+import errno
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from . import backup_catalog, metrics
+
+# ioctl request number of FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+BLOCK_SIZE = 1024 * 1024
+WORKERS = 4
+NOT_SUPPORTED = (errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.EPERM, errno.ENOSYS)
+
+
+class BackupFanoutError(Exception):
+    """A destination could not be written or doesn't match the source"""
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(directory):
+    try:
+        _fsync(directory)
+    except OSError:
+        pass  # Not every platform can open a directory
+
+
+def _reflink(source, target):
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy(source, target):
+    shutil.copyfile(source, target)
+    _fsync(target)
+
+
+def _place(source, path):
+    """Put a copy of ``source`` at ``path`` atomically; returns the method used"""
+    temp_path = f'{path}.fanout.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        try:
+            _reflink(source, temp_path)
+            method = 'reflink'
+        except (OSError, ImportError) as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if isinstance(e, OSError) and e.errno not in NOT_SUPPORTED:
+                raise
+            try:
+                os.link(source, temp_path)
+                method = 'hardlink'
+            except OSError as e:
+                if e.errno not in NOT_SUPPORTED:
+                    raise
+                _copy(source, temp_path)
+                method = 'copy'
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    _fsync_directory(os.path.dirname(path) or '.')
+    return method
+
+
+def fan_out(source, paths, workers=WORKERS):
+    """
+    Place the finished file ``source`` at each of ``paths`` and verify them
+    by hash. Returns ({path: method}, {path: error}) for the destinations that
+    succeeded and failed; failed destinations are left without the file.
+    """
+    _fsync(source)
+    expected = _sha256(source)
+
+    def place_and_verify(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        method = _place(source, path)
+        if _sha256(path) != expected:
+            os.remove(path)
+            raise BackupFanoutError(f"{path} does not match the backup after writing it")
+        return method
+
+    placed, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        futures = {path: pool.submit(place_and_verify, path) for path in paths}
+        for path, future in futures.items():
+            try:
+                placed[path] = future.result()
+            except (OSError, BackupFanoutError) as e:
+                failed[path] = e
+    return placed, failed
+
+
+@metrics.time_backup('fanout')
+def write_once(filename, directories, write, workers=WORKERS, catalog=True):
+    """
+    Call ``write(path)`` once to produce the backup, then fan it out as
+    ``filename`` in each of ``directories``. The new backups are catalogued
+    with one read of the file. Returns ({path: method}, {path: error}).
+    """
+    directories = list(dict.fromkeys(directories))
+    os.makedirs(directories[0], exist_ok=True)
+    # Hidden, so the catalog ignores it; the extension is kept for writers that go by it
+    source = os.path.join(directories[0], f'.writing.{filename}')
+    try:
+        write(source)
+        placed, failed = fan_out(source, [os.path.join(d, filename) for d in directories], workers)
+    finally:
+        if os.path.exists(source):
+            os.remove(source)
+
+    if catalog and placed and backup_catalog.backup_kind(filename):
+        first, *others = placed
+        backup_catalog.catalog_new_backup(first)
+        for path in others:
+            backup_catalog.copy_sidecar(first, path)
+    return placed, failed
@@ -0,0 +1,188 @@
+"""
+Content-addressed store and retention for backup files.
+
+Most backups taken between deploys are byte-for-byte identical. ``dedupe``
+keeps one copy of each distinct payload in the store, as
+``<store>/objects/<sha[:2]>/<sha256>``, and turns every backup file with
+that content into a hard link to it. The backup files stay where they are,
+with their names, so nothing that reads them has to change, and disk usage
+grows with the number of distinct payloads instead of with the number of
+backups. Hashes come from the catalog sidecars (see ``backup_catalog``);
+a file is re-hashed before it is replaced by a link.
+
+``prune`` applies a grandfather-father-son retention policy to the catalogued
+backups of each directory and kind: the newest backup of each of the last N
+hours, days, weeks and months is kept, the rest is deleted along with its
+sidecar, and store objects no backup links to any more are removed.
+
+Only backups with a timestamp in their name are touched. Fixed names such as
+``deployment_db.json`` or ``db.sqlite3.bak`` are rewritten in place by the
+deploy and restore scripts, which would change every file linked to the
+same content, and they are what those scripts look for, so they are never
+linked or pruned. Files on another filesystem than the store cannot be hard
+linked and are left as they are.
+"""
+import errno
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import backup_catalog
+
+RETENTION = {
+    'hourly': 24,
+    'daily': 7,
+    'weekly': 4,
+    'monthly': 12,
+}
+PERIODS = {
+    'hourly': lambda moment: (moment.date(), moment.hour),
+    'daily': lambda moment: moment.date(),
+    'weekly': lambda moment: moment.isocalendar()[:2],
+    'monthly': lambda moment: (moment.year, moment.month),
+}
+
+
+def default_store():
+    return os.path.join(settings.BASE_DIR.parent, 'persistent_backups', '.store')
+
+
+def default_directories():
+    """The backup directories inside the repository"""
+    repo_root = settings.BASE_DIR.parent
+    return [
+        os.path.join(settings.BASE_DIR, 'backup'),
+        os.path.join(settings.BASE_DIR, 'backups'),
+        os.path.join(repo_root, 'persistent_backups'),
+        os.path.join(repo_root, 'deployment'),
+        os.path.join(repo_root, 'deployment', 'backups'),
+    ]
+
+
+def _write_once(entry):
+    """Valid backups that nothing rewrites in place (see the module docstring)"""
+    return entry.is_valid and backup_catalog.name_timestamp(os.path.basename(entry.path)) is not None
+
+
+def object_path(store, sha256):
+    return os.path.join(store, 'objects', sha256[:2], sha256)
+
+
+def _link_to(source, path):
+    """Atomically replace ``path`` with a hard link to ``source``"""
+    temp_path = f'{path}.link.tmp'
+    os.link(source, temp_path)
+    os.replace(temp_path, path)
+
+
+def dedupe(directories, store=None, log=None):
+    """
+    Move the payload of every catalogued backup into the store and link the
+    backup to it. Returns (files linked, bytes freed).
+    """
+    store = store or default_store()
+    backup_catalog.refresh(directories, log=log)
+    linked = freed = 0
+    for entry in backup_catalog.list_backups(directories):
+        if not _write_once(entry):
+            continue
+        blob = object_path(store, entry.manifest['sha256'])
+        try:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.link(entry.path, blob)
+                continue
+            if os.path.samefile(entry.path, blob):
+                continue
+            # The sidecar only vouches for the file's size and modification time; check the content itself
+            if backup_catalog.file_sha256(entry.path) != entry.manifest['sha256']:
+                backup_catalog.index_backup(entry.path)
+                continue
+            last_link = os.stat(entry.path).st_nlink == 1
+            _link_to(blob, entry.path)
+            backup_catalog.refresh_file_state(entry.path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if log:
+                log(f"{entry.path} is on another filesystem than the store; not deduplicated")
+            continue
+        linked += 1
+        if last_link:
+            freed += entry.size
+    return linked, freed
+
+
+def collect_garbage(store=None):
+    """Delete store objects that no backup links to; returns the bytes freed"""
+    store = store or default_store()
+    objects = os.path.join(store, 'objects')
+    freed = 0
+    if not os.path.isdir(objects):
+        return freed
+    for prefix in os.scandir(objects):
+        for item in os.scandir(prefix.path):
+            stat = item.stat()
+            if stat.st_nlink == 1:
+                os.remove(item.path)
+                freed += stat.st_size
+    return freed
+
+
+def retained(entries, policy=RETENTION):
+    """
+    The entries a retention policy keeps: for each period with a count in
+    ``policy``, the newest entry in each of that many most recent periods
+    that have a backup. Entries should be newest first.
+    """
+    keep = set()
+    for period, count in policy.items():
+        bucket_of = PERIODS[period]
+        buckets = set()
+        for entry in entries:
+            bucket = bucket_of(timezone.localtime(entry.created_at))
+            if bucket in buckets:
+                continue
+            if len(buckets) == count:
+                break
+            buckets.add(bucket)
+            keep.add(entry.path)
+    return keep
+
+
+def plan_prune(directories, policy=RETENTION):
+    """Paths of the backups a prune would delete"""
+    series = {}
+    for entry in backup_catalog.list_backups(directories):
+        if not _write_once(entry):
+            continue
+        if entry.manifest['kind'] not in backup_catalog.STANDALONE_KINDS:
+            continue  # Increments are only usable with their whole chain
+        series.setdefault((os.path.dirname(entry.path), entry.manifest['kind']), []).append(entry)
+
+    doomed = []
+    for entries in series.values():
+        keep = retained(entries, policy)
+        # The newest backup of every series survives whatever the policy says
+        keep.add(entries[0].path)
+        doomed.extend(entry.path for entry in entries if entry.path not in keep)
+    return sorted(doomed)
+
+
+def prune(directories, policy=RETENTION, store=None):
+    """
+    Delete the backups the retention policy doesn't keep and the store
+    objects nothing links to any more. Returns (pruned paths, bytes freed).
+    """
+    doomed = plan_prune(directories, policy)
+    freed = 0
+    for path in doomed:
+        # Space is only freed when the last link to the content goes
+        stat = os.stat(path)
+        if stat.st_nlink == 1:
+            freed += stat.st_size
+        os.remove(path)
+        backup_catalog.remove(path)
+    freed += collect_garbage(store)
+    return doomed, freed
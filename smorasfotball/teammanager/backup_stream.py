@@ -0,0 +1,351 @@
+"""
+Streaming, compressed JSON Lines backups.
+
+A backup file (``.jsonl.gz``, or ``.jsonl.zst`` when a zstd module is
+available) holds one serialized object per line, grouped by model in
+dependency order, behind a one-line header manifest:
+
+    {"format": "smoras-jsonl", "version": 1, "created_at": ...,
+     "compression": "gzip", "models": {"teammanager.team": 3, ...},
+     "total": 812, "max_pks": {"teammanager.team": 7, ...},
+     "migrations": {"teammanager": "0042_...", ...},
+     "body_bytes": 40233, "content_sha256": "..."}
+
+``migrations`` is the migration state of the database the backup was taken
+from, so a copy that is catalogued again (after a git pull, say) still knows it.
+
+The header is its own compressed member (gzip and zstd both allow
+concatenated members), written after the body has been streamed to a
+temporary file, so its counts are exact. Reading the manifest only
+decompresses that first member; ``validate_backup`` also checks the file
+size against ``body_bytes`` to catch truncated copies, without reading the
+body. Restores deserialize line by line, so memory use does not depend on
+the size of the backup. Every backup written here also gets a catalog
+sidecar (see ``backup_catalog``).
+
+Legacy ``dumpdata`` files (one JSON array) are still understood by
+``model_counts`` and ``iter_backup_objects``, which scan them one object at
+a time instead of loading the whole array.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+from collections import Counter
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from . import models_video  # noqa: F401 -- registers the video models, which models.py doesn't import
+from .incremental_backup import BASE_EXCLUDE, models_in_dependency_order, save_objects, tracking_suspended
+
+FORMAT = 'smoras-jsonl'
+FORMAT_VERSION = 1
+EXTENSIONS = {
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+CHUNK_SIZE = 2000
+BLOCK_SIZE = 1024 * 1024
+# Enough to decode one object of a legacy dumpdata file at a time
+LEGACY_READ_SIZE = 64 * 1024
+
+
+class BackupFormatError(ValueError):
+    """Not a streaming backup, an unsupported compression, or a damaged file"""
+
+
+def _zstd():
+    """The zstd module to use (Python 3.14's compression.zstd or zstandard), or None"""
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def available_compressions():
+    return [name for name in EXTENSIONS if name != 'zstd' or _zstd() is not None]
+
+
+def is_stream_backup(path):
+    return str(path).endswith(tuple(EXTENSIONS.values()))
+
+
+def compression_for(path):
+    for name, extension in EXTENSIONS.items():
+        if str(path).endswith(extension):
+            if name == 'zstd' and _zstd() is None:
+                raise BackupFormatError("zstd backups need Python 3.14 or the 'zstandard' package")
+            return name
+    raise BackupFormatError(f"{path} is not a .jsonl.gz or .jsonl.zst backup")
+
+
+def _compress(data, compression):
+    if compression == 'gzip':
+        return gzip.compress(data, mtime=0)
+    return _zstd().compress(data)
+
+
+def _compressing_writer(fileobj, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', mtime=0)
+    zstd = _zstd()
+    if hasattr(zstd, 'ZstdFile'):
+        return zstd.ZstdFile(fileobj, mode='w')
+    return zstd.ZstdCompressor().stream_writer(fileobj, closefd=False)
+
+
+def _decompressing_reader(fileobj, compression):
+    """Binary reader that continues across members, so header and body read as one stream"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    zstd = _zstd()
+    if hasattr(zstd, 'ZstdFile'):
+        return zstd.ZstdFile(fileobj, mode='r')
+    return zstd.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True, closefd=False)
+
+
+def backup_models(exclude=BASE_EXCLUDE):
+    """Models included in a full backup, parents before children"""
+    labels = []
+    for model in apps.get_models():
+        meta = model._meta
+        if meta.proxy or not meta.managed:
+            continue
+        if meta.app_label in exclude or meta.label_lower in exclude:
+            continue
+        labels.append(meta.label_lower)
+    return models_in_dependency_order(labels)
+
+
+class _HashingWriter(io.RawIOBase):
+    """Passes writes through to a file while hashing and counting them"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+def _counted(iterable, counts, max_pks, label):
+    # Rows come in primary key order, so the last one seen has the highest key
+    for obj in iterable:
+        counts[label] += 1
+        max_pks[label] = obj.pk
+        yield obj
+
+
+@metrics.time_backup('stream')
+def write_backup(path, exclude=BASE_EXCLUDE, chunk_size=CHUNK_SIZE):
+    """
+    Write a full backup of the database to ``path``; the compression follows
+    the extension. Rows are streamed from the database ``chunk_size`` at a
+    time. Returns the manifest.
+    """
+    from .backup_catalog import catalog_new_backup, current_migration_state
+    compression = compression_for(path)
+    counts = Counter()
+    max_pks = {}
+    body_path = f"{path}.body.tmp"
+    temp_path = f"{path}.tmp"
+    try:
+        with open(body_path, 'wb') as raw:
+            body = _HashingWriter(raw)
+            with _compressing_writer(body, compression) as compressed:
+                text = io.TextIOWrapper(compressed, encoding='utf-8', newline='\n')
+                for model in backup_models(exclude):
+                    label = model._meta.label_lower
+                    counts[label] = 0
+                    max_pks[label] = None
+                    queryset = model._base_manager.order_by(model._meta.pk.name)
+                    rows = _counted(queryset.iterator(chunk_size=chunk_size), counts, max_pks, label)
+                    serializers.serialize('jsonl', rows, stream=text, use_natural_foreign_keys=True)
+                text.flush()
+                text.detach()
+
+        manifest = {
+            'format': FORMAT,
+            'version': FORMAT_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'compression': compression,
+            'models': dict(counts),
+            'total': sum(counts.values()),
+            'max_pks': max_pks,
+            'migrations': current_migration_state(),
+            'body_bytes': body.size,
+            'content_sha256': body.digest.hexdigest(),
+        }
+        with open(temp_path, 'wb') as out, open(body_path, 'rb') as body_file:
+            out.write(_compress((json.dumps(manifest) + '\n').encode('utf-8'), compression))
+            for block in iter(lambda: body_file.read(BLOCK_SIZE), b''):
+                out.write(block)
+        os.replace(temp_path, path)
+        catalog_new_backup(path, counts=manifest['models'], max_pks=max_pks)
+    finally:
+        for leftover in (body_path, temp_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return manifest
+
+
+@contextmanager
+def _open_text(path):
+    compression = compression_for(path)
+    with open(path, 'rb') as raw:
+        with io.TextIOWrapper(_decompressing_reader(raw, compression), encoding='utf-8', newline='\n') as text:
+            yield text
+
+
+def _parse_manifest(line, path):
+    try:
+        manifest = json.loads(line)
+    except ValueError:
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get('format') != FORMAT:
+        raise BackupFormatError(f"{path} has no backup manifest")
+    if manifest.get('version', 0) > FORMAT_VERSION:
+        raise BackupFormatError(f"{path} was written by a newer version (format {manifest['version']})")
+    return manifest
+
+
+def read_manifest(path):
+    """The header manifest; only the first line of the file is decompressed"""
+    try:
+        with _open_text(path) as text:
+            return _parse_manifest(text.readline(), path)
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        raise BackupFormatError(f"Cannot read {path}: {e}")
+
+
+def validate_backup(path):
+    """
+    Check the manifest and that the file is exactly as long as it says,
+    without decompressing the body. Returns the manifest.
+    """
+    manifest = read_manifest(path)
+    header_bytes = os.path.getsize(path) - manifest['body_bytes']
+    if header_bytes <= 0:
+        raise BackupFormatError(f"{path} is truncated")
+    with open(path, 'rb') as f:
+        header = f.read(header_bytes)
+    try:
+        compression = manifest['compression']
+        if compression == 'gzip':
+            decoded = gzip.decompress(header)
+        else:
+            decoded = _zstd().decompress(header)
+    except Exception:
+        raise BackupFormatError(f"{path} is truncated or has extra data")
+    if _parse_manifest(decoded.decode('utf-8'), path) != manifest:
+        raise BackupFormatError(f"{path} is truncated or has extra data")
+    return manifest
+
+
+def verify_backup(path):
+    """validate_backup plus a full read of the body to check its SHA-256"""
+    manifest = validate_backup(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(os.path.getsize(path) - manifest['body_bytes'])
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    if digest.hexdigest() != manifest['content_sha256']:
+        raise BackupFormatError(f"{path} does not match its checksum")
+    return manifest
+
+
+def _iter_legacy_objects(path):
+    """Objects of a dumpdata JSON array, decoded one at a time"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(LEGACY_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise BackupFormatError(f"{path} is not a JSON array")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except ValueError:
+                more = f.read(LEGACY_READ_SIZE)
+                if not more:
+                    raise BackupFormatError(f"{path} ends in the middle of an object")
+                buffer += more
+                continue
+            yield obj
+            buffer = buffer[end:]
+            if len(buffer) < LEGACY_READ_SIZE:
+                buffer += f.read(LEGACY_READ_SIZE)
+
+
+def iter_backup_objects(path):
+    """Serialized objects (dicts with model, pk and fields) of either kind of backup"""
+    if not is_stream_backup(path):
+        yield from _iter_legacy_objects(path)
+        return
+    with _open_text(path) as text:
+        _parse_manifest(text.readline(), path)
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+
+
+def model_counts(path):
+    """
+    {model label: number of objects} for a backup. For streaming backups this
+    only reads the manifest; legacy dumpdata files are scanned object by object.
+    """
+    if is_stream_backup(path):
+        return validate_backup(path)['models']
+    return dict(Counter(obj.get('model', 'unknown') for obj in _iter_legacy_objects(path)))
+
+
+def load_backup(path):
+    """
+    Load a streaming backup into the current database without clearing it
+    first, one object at a time. Returns the number of objects loaded.
+    """
+    manifest = validate_backup(path)
+    models = [apps.get_model(label) for label in manifest['models']]
+    with tracking_suspended(), transaction.atomic(), _open_text(path) as text:
+        text.readline()
+        objects = serializers.deserialize('jsonl', text, handle_forward_references=True)
+        loaded = save_objects(objects, models)
+        if loaded != manifest['total']:
+            raise BackupFormatError(f"{path} holds {loaded} objects but its manifest says {manifest['total']}")
+    return loaded
+
+
+def restore_backup(path):
+    """
+    Replace the database with the contents of a streaming backup. The flush
+    and the load are one transaction, so a backup that turns out to be
+    damaged part way through leaves the database as it was.
+    """
+    validate_backup(path)
+    with tracking_suspended(), transaction.atomic():
+        call_command('flush', interactive=False, verbosity=0)
+        return load_backup(path)
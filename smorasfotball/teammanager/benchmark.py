@@ -0,0 +1,164 @@
+"""
+Synthetic data and benchmark steps for the backup and restore paths.
+
+``populate`` fills an empty database with a club of a given scale: every team
+plays ``matches`` matches in each of ``seasons`` seasons, and every match has
+appearances, a match session with playing time and a few substitutions for
+the team's squad of ``squad`` players.
+
+The ``STEPS`` are run by ``manage.py benchmark_backups``, each in its own
+process against a scratch database, so time and peak memory can be measured
+per step. Every step returns (objects, path of the file it wrote or None).
+"""
+import datetime
+import os
+import shutil
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+
+from . import backup_stream, fast_restore, incremental_backup, sqlite_backup
+from .models import Team, Player, Match, MatchAppearance, MatchSession, PlayingTime, PlayerSubstitution
+
+SCALE = {
+    'teams': 4,
+    'seasons': 3,
+    'matches': 20,
+    'squad': 16,
+}
+BATCH_SIZE = 1000
+SUBSTITUTIONS_PER_MATCH = 3
+
+
+def populate(teams, seasons, matches, squad):
+    """Create the synthetic club; returns the number of rows created"""
+    created = 0
+    with incremental_backup.tracking_suspended():
+        for t in range(teams):
+            team = Team.objects.create(name=f'Smørås G{2010 + t}')
+            User.objects.create_user(f'coach{t}', password=None)
+            players = Player.objects.bulk_create([
+                Player(first_name=f'Player{p}', last_name=f'Team{t}', position='Midfielder')
+                for p in range(squad)
+            ])
+            created += 2 + len(players)
+
+            for season in range(seasons):
+                start = datetime.datetime(2020 + season, 4, 1, 17, tzinfo=datetime.timezone.utc)
+                match_rows = Match.objects.bulk_create([
+                    Match(
+                        smoras_team=team, opponent_name=f'Opponent {m}', date=start + datetime.timedelta(days=7 * m),
+                        smoras_score=m % 4, opponent_score=(m * 3) % 5, match_type='League',
+                    )
+                    for m in range(matches)
+                ], batch_size=BATCH_SIZE)
+                sessions = MatchSession.objects.bulk_create([
+                    MatchSession(match=match, name=f'{match.opponent_name} session') for match in match_rows
+                ], batch_size=BATCH_SIZE)
+                appearances = [
+                    MatchAppearance(player=player, match=match, team=team, minutes_played=60, goals=(p + m) % 3)
+                    for m, match in enumerate(match_rows) for p, player in enumerate(players)
+                ]
+                playing_times = [
+                    PlayingTime(match_session=session, player=player, minutes_played=60, is_on_pitch=p < 11)
+                    for session in sessions for p, player in enumerate(players)
+                ]
+                substitutions = [
+                    PlayerSubstitution(
+                        match_session=session, player_in=players[(11 + s) % squad], player_out=players[s],
+                        minute=20 * (s + 1),
+                    )
+                    for session in sessions for s in range(min(SUBSTITUTIONS_PER_MATCH, squad))
+                ]
+                MatchAppearance.objects.bulk_create(appearances, batch_size=BATCH_SIZE)
+                PlayingTime.objects.bulk_create(playing_times, batch_size=BATCH_SIZE)
+                PlayerSubstitution.objects.bulk_create(substitutions, batch_size=BATCH_SIZE)
+                created += len(match_rows) + len(sessions) + len(appearances) + len(playing_times) + len(substitutions)
+    return created
+
+
+def _object_count():
+    return sum(backup_stream.model_counts(_path('dump.json')).values())
+
+
+def _path(name):
+    return os.path.join(os.environ['BENCHMARK_DIR'], name)
+
+
+def _sqlite_database():
+    return connection.settings_dict['NAME']
+
+
+def generate(scale):
+    call_command('migrate', verbosity=0)
+    return populate(**scale), None
+
+
+def dumpdata(scale):
+    call_command('dumpdata', exclude=incremental_backup.BASE_EXCLUDE, output=_path('dump.json'), verbosity=0)
+    return _object_count(), _path('dump.json')
+
+
+def loaddata(scale):
+    call_command('flush', interactive=False, verbosity=0)
+    call_command('loaddata', _path('dump.json'), verbosity=0)
+    return _object_count(), None
+
+
+def fast_restore_json(scale):
+    return fast_restore.restore(_path('dump.json')), None
+
+
+def stream_backup(scale, compression='gzip'):
+    path = _path(f'backup{backup_stream.EXTENSIONS[compression]}')
+    return backup_stream.write_backup(path)['total'], path
+
+
+def stream_restore(scale, compression='gzip'):
+    return fast_restore.restore(_path(f'backup{backup_stream.EXTENSIONS[compression]}')), None
+
+
+def incremental_base(scale):
+    directory = _path('incremental')
+    shutil.rmtree(directory, ignore_errors=True)
+    entry = incremental_backup.create_base_backup(directory)
+    return _object_count(), os.path.join(directory, entry['file'])
+
+
+def sqlite_copy(scale):
+    shutil.copy2(_sqlite_database(), _path('copy.sqlite3'))
+    return None, _path('copy.sqlite3')
+
+
+def sqlite_online_backup(scale):
+    sqlite_backup.backup(_sqlite_database(), _path('online.sqlite3'))
+    return None, _path('online.sqlite3')
+
+
+def sqlite_vacuum_into(scale):
+    sqlite_backup.backup(_sqlite_database(), _path('vacuum.sqlite3'), vacuum=True)
+    return None, _path('vacuum.sqlite3')
+
+
+def sqlite_restore(scale):
+    sqlite_backup.restore(_path('online.sqlite3'), _sqlite_database())
+    return None, None
+
+
+# name: (function, vendors it applies to or None for all)
+STEPS = {
+    'generate': (generate, None),
+    'dumpdata': (dumpdata, None),
+    'loaddata': (loaddata, None),
+    'fast_restore_json': (fast_restore_json, None),
+    'stream_backup_gzip': (stream_backup, None),
+    'stream_restore_gzip': (stream_restore, None),
+    'stream_backup_zstd': (lambda scale: stream_backup(scale, 'zstd'), None),
+    'stream_restore_zstd': (lambda scale: stream_restore(scale, 'zstd'), None),
+    'incremental_base': (incremental_base, None),
+    'sqlite_copy': (sqlite_copy, ('sqlite',)),
+    'sqlite_online_backup': (sqlite_online_backup, ('sqlite',)),
+    'sqlite_vacuum_into': (sqlite_vacuum_into, ('sqlite',)),
+    'sqlite_restore': (sqlite_restore, ('sqlite',)),
+}
@@ -0,0 +1,261 @@
+"""
+Streaming export of players, matches and match statistics.
+
+Each dataset is read with ``values_list(...).iterator(chunk_size=...)``, so
+rows are fetched from the database in chunks and never materialised as a
+whole table. Writers turn those rows into a stream of bytes:
+
+- CSV is written chunk by chunk.
+- XLSX uses openpyxl's write-only workbook, which spools rows to a temporary
+  file; the finished workbook is then streamed from disk.
+- Parquet writes one row group per chunk (requires the optional ``pyarrow``
+  package).
+
+The same generators back the export endpoint (wrapped in a
+StreamingHttpResponse) and the ``export_data`` management command.
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import Player, Match, MatchAppearance, PlayingTime, PlayerSubstitution
+
+CHUNK_SIZE = 2000
+FILE_BLOCK_SIZE = 64 * 1024
+
+# dataset name -> (model, [(column header, ORM field path), ...])
+DATASETS = {
+    'players': (Player, [
+        ('id', 'id'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('position', 'position'),
+        ('date_of_birth', 'date_of_birth'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('active', 'active'),
+        ('created_at', 'created_at'),
+    ]),
+    'matches': (Match, [
+        ('id', 'id'),
+        ('date', 'date'),
+        ('team', 'smoras_team__name'),
+        ('opponent', 'opponent_name'),
+        ('location_type', 'location_type'),
+        ('location', 'location'),
+        ('match_type', 'match_type'),
+        ('smoras_score', 'smoras_score'),
+        ('opponent_score', 'opponent_score'),
+        ('notes', 'notes'),
+    ]),
+    'appearances': (MatchAppearance, [
+        ('id', 'id'),
+        ('match_id', 'match_id'),
+        ('date', 'match__date'),
+        ('opponent', 'match__opponent_name'),
+        ('team', 'team__name'),
+        ('player_id', 'player_id'),
+        ('first_name', 'player__first_name'),
+        ('last_name', 'player__last_name'),
+        ('minutes_played', 'minutes_played'),
+        ('goals', 'goals'),
+        ('assists', 'assists'),
+        ('yellow_cards', 'yellow_cards'),
+        ('red_card', 'red_card'),
+    ]),
+    'playing-times': (PlayingTime, [
+        ('id', 'id'),
+        ('match_session_id', 'match_session_id'),
+        ('match_id', 'match_session__match_id'),
+        ('player_id', 'player_id'),
+        ('first_name', 'player__first_name'),
+        ('last_name', 'player__last_name'),
+        ('minutes_played', 'minutes_played'),
+        ('is_on_pitch', 'is_on_pitch'),
+        ('last_substitution_time', 'last_substitution_time'),
+    ]),
+    'substitutions': (PlayerSubstitution, [
+        ('id', 'id'),
+        ('match_session_id', 'match_session_id'),
+        ('match_id', 'match_session__match_id'),
+        ('period', 'period'),
+        ('minute', 'minute'),
+        ('player_in_id', 'player_in_id'),
+        ('player_in', 'player_in__first_name'),
+        ('player_out_id', 'player_out_id'),
+        ('player_out', 'player_out__first_name'),
+        ('timestamp', 'timestamp'),
+        ('notes', 'notes'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Unknown dataset or format, or a missing optional dependency"""
+
+
+def columns(dataset):
+    return [header for header, _ in DATASETS[dataset][1]]
+
+
+def iter_row_chunks(dataset, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to ``chunk_size`` row tuples, ordered by primary key"""
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.order_by('pk').values_list(*[path for _, path in fields])
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _naive(value):
+    # Excel has no time zones; write datetimes in local time
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def stream_csv(dataset, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Byte order mark so Excel opens Norwegian letters correctly
+    buffer.write('\ufeff')
+    writer.writerow(columns(dataset))
+    for chunk in iter_row_chunks(dataset, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_xlsx(dataset, chunk_size=CHUNK_SIZE):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=dataset)
+    sheet.append(columns(dataset))
+    for chunk in iter_row_chunks(dataset, chunk_size):
+        for row in chunk:
+            sheet.append([_naive(value) for value in row])
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            block = output.read(FILE_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after each row group"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _model_field(model, path):
+    """Follow an ORM path such as 'match__date' to the model field it ends in"""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _arrow_schema(dataset):
+    """Parquet schema derived from the model fields, so every row group matches"""
+    import pyarrow as pa
+
+    types = {
+        'BooleanField': pa.bool_(),
+        'DateField': pa.date32(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    model, fields = DATASETS[dataset]
+    schema = []
+    for header, path in fields:
+        field = _model_field(model, path)
+        internal_type = field.get_internal_type()
+        if field.is_relation or internal_type.endswith(('AutoField', 'IntegerField')):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = types.get(internal_type, pa.string())
+        schema.append((header, arrow_type))
+    return pa.schema(schema)
+
+
+def stream_parquet(dataset, chunk_size=CHUNK_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    headers = columns(dataset)
+    schema = _arrow_schema(dataset)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in iter_row_chunks(dataset, chunk_size):
+        data = {header: list(values) for header, values in zip(headers, zip(*chunk))}
+        writer.write_table(pa.Table.from_pydict(data, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': stream_csv,
+    'xlsx': stream_xlsx,
+    'parquet': stream_parquet,
+}
+
+
+def stream_export(dataset, export_format, chunk_size=CHUNK_SIZE):
+    """
+    Return a generator of bytes for a dataset in the given format.
+
+    Raises ExportError for unknown datasets/formats, and for Parquet when
+    pyarrow is not installed (checked up front so no partial file is sent).
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}'")
+    if export_format not in WRITERS:
+        raise ExportError(f"Unknown format '{export_format}'")
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires the 'pyarrow' package")
+    return WRITERS[export_format](dataset, chunk_size)
+
+
+def export_filename(dataset, export_format):
+    return f"{dataset}_{timezone.now().strftime('%Y%m%d')}.{export_format}"
@@ -0,0 +1,75 @@
+"""
+A cheap fingerprint of the database, to tell whether a restore would change it.
+
+The fingerprint holds, for every model in a full backup, the row count and
+the highest primary key, plus the latest applied migration of every app.
+It takes one ``COUNT``/``MAX`` query per table, however large the tables.
+
+``differences`` compares it with a backup's catalog manifest (see
+``backup_catalog``), which records the same numbers for the backup. When
+nothing differs, the database already holds what the backup holds, and the
+deployment scripts skip pulling and restoring it.
+
+The comparison errs on the side of restoring: a manifest without primary
+keys (catalogued before they were recorded) never matches. Sessions are
+left out, since they change with every login.
+"""
+from django.db.models import Count, Max
+
+from . import backup_catalog, backup_stream
+from .incremental_backup import BASE_EXCLUDE
+
+FINGERPRINT_EXCLUDE = BASE_EXCLUDE + ['sessions']
+
+
+def _excluded(label, exclude=FINGERPRINT_EXCLUDE):
+    return label in exclude or label.split('.')[0] in exclude
+
+
+def fingerprint(exclude=FINGERPRINT_EXCLUDE):
+    """{'tables': {model label: {'count', 'max_pk'}}, 'migrations': {app: latest migration}}"""
+    tables = {}
+    for model in backup_stream.backup_models(exclude):
+        stats = model._base_manager.aggregate(count=Count('pk'), max_pk=Max('pk'))
+        tables[model._meta.label_lower] = stats
+    return {'tables': tables, 'migrations': backup_catalog.current_migration_state()}
+
+
+def _same_pk(a, b):
+    # JSON keeps integer keys as integers, but other keys may come back as strings
+    return a == b or (a is not None and b is not None and str(a) == str(b))
+
+
+def differences(manifest, current=None):
+    """
+    How the database differs from the backup described by ``manifest``, as
+    a list of messages; empty when they match.
+    """
+    if 'error' in manifest:
+        return [f"{manifest['file']} is not a readable backup"]
+    current = current or fingerprint()
+    found = []
+
+    if manifest.get('migrations') is None:
+        found.append(f"the catalog entry of {manifest['file']} has no migration state")
+    elif manifest['migrations'] != current['migrations']:
+        found.append('the applied migrations differ from the backup\'s')
+    max_pks = manifest.get('max_pks')
+    if max_pks is None:
+        found.append(f"the catalog entry of {manifest['file']} has no primary keys")
+
+    for label, stats in current['tables'].items():
+        count = manifest['models'].get(label, 0)
+        if count != stats['count']:
+            found.append(f"{label}: {stats['count']} rows, the backup has {count}")
+        elif max_pks is not None and not _same_pk(max_pks.get(label), stats['max_pk']):
+            found.append(f"{label}: highest id {stats['max_pk']}, the backup has {max_pks.get(label)}")
+    for label, count in manifest['models'].items():
+        if count and label not in current['tables'] and not _excluded(label):
+            found.append(f"{label}: {count} rows in the backup but not in the database")
+    return found
+
+
+def matches(entry):
+    """True when the catalogued backup ``entry`` holds exactly what the database holds"""
+    return entry is not None and entry.is_valid and not differences(entry.manifest)
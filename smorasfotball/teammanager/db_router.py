@@ -0,0 +1,95 @@
+"""
+Send the reads of reporting views to a read replica.
+
+When ``DATABASE_REPLICA_URL`` is set, settings add a ``replica`` database.
+Views decorated with ``replica_reads`` (statistics, the player matrix and
+data exports) then read the club's data (``teammanager`` models) from it;
+everything else, including sessions and authentication, and every write
+stays on ``default``.
+
+A replica lags behind the primary, so after a client sends a POST (or any
+other unsafe request) ``ReplicaMiddleware`` pins that client to the primary
+for ``DATABASE_REPLICA_STICKY_SECONDS``, with a cookie, so it reads its own
+writes. Without a replica configured nothing changes.
+"""
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+ROUTED_APPS = {'teammanager'}
+STICKY_COOKIE = 'primary_reads_until'
+STICKY_SECONDS = 10
+
+# Set while a request is served by a replica_reads view, until the request finishes
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_reads(view):
+    """Mark a view whose reads may be served by the replica"""
+    view.replica_reads = True
+    return view
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+def _reset(**kwargs):
+    _use_replica.set(False)
+
+
+# Streaming responses keep reading after the view returns, so the flag is only cleared here
+request_finished.connect(_reset)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label in ROUTED_APPS and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Django would otherwise save objects read from the replica back to it
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == REPLICA_ALIAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA_ALIAS
+
+
+class ReplicaMiddleware:
+    """Route reads of replica_reads views to the replica, except for clients that just wrote"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _use_replica.set(False)
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and replica_configured():
+            seconds = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', STICKY_SECONDS)
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + seconds)), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_reads', False) and not self._pinned(request):
+            _use_replica.set(True)
+
+    def _pinned(self, request):
+        try:
+            return int(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
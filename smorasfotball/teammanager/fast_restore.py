@@ -0,0 +1,333 @@
+"""
+Fast restore of JSON backups (dumpdata files and .jsonl.gz/.jsonl.zst).
+
+``loaddata`` saves every object through the ORM one at a time. This engine
+reads the backup as a stream, collects consecutive objects of the same model
+into batches and writes each batch in one go:
+
+- SQLite: one ``executemany`` INSERT per batch
+- PostgreSQL: ``COPY ... FROM STDIN`` in CSV format
+- anything else: ``bulk_create``
+
+Values are taken as stored in the backup (no auto_now, no save() or model
+signals), like loaddata's raw saves. Many-to-many links (user groups and
+permissions) are written to their through tables the same way.
+
+By default the flush and the load run in one transaction with foreign key
+checks deferred to the end, so a failed restore leaves the database as it
+was. With ``workers > 1`` on PostgreSQL the backup is first split into one
+spool file per model and the tables are loaded level by level: tables whose
+foreign keys only point to earlier levels are loaded in parallel, each on its
+own connection. Many-to-many links are loaded a level after both ends of the
+link. That path commits per table and is not atomic.
+
+The site's backups leave out content types and permissions, while admin log
+entries and user permissions point at them. So after the flush post_migrate
+recreates them before anything is loaded; a backup that has its own copies
+replaces the recreated rows. Recreated rows get new ids, so backups refer to
+them by natural key (older backups that refer to them by id only restore
+correctly if the ids happen to match). Sequences are reset at the end, and post_migrate
+runs again for permissions of content types that came from the backup.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, connections, models, transaction
+
+from .backup_stream import is_stream_backup, iter_backup_objects, validate_backup
+from .incremental_backup import tracking_suspended
+
+BATCH_SIZE = 1000
+
+# Tables post_migrate fills after the flush, which a backup may bring its own rows for
+RECREATED = ('contenttypes.contenttype', 'auth.permission')
+
+
+class RestoreError(Exception):
+    """The backup refers to unknown models or does not fit the schema"""
+
+
+def _batches(objects, batch_size):
+    """(label, [serialized dicts]) for runs of objects of the same model, at most batch_size long"""
+    for label, group in groupby(objects, key=lambda obj: obj['model'].lower()):
+        batch = []
+        for obj in group:
+            batch.append(obj)
+            if len(batch) == batch_size:
+                yield label, batch
+                batch = []
+        if batch:
+            yield label, batch
+
+
+def _get_model(label):
+    try:
+        return apps.get_model(label)
+    except LookupError:
+        raise RestoreError(f"The backup contains unknown model '{label}'")
+
+
+def _db_values(fields, instance, conn):
+    return [field.get_db_prep_save(getattr(instance, field.attname), conn) for field in fields]
+
+
+def _insert_sqlite(model, instances, conn):
+    fields = model._meta.concrete_fields
+    quote = conn.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with conn.cursor() as cursor:
+        cursor.executemany(sql, [_db_values(fields, instance, conn) for instance in instances])
+
+
+def _csv_value(field, value):
+    """One CSV cell for COPY: unquoted empty is NULL, everything else is quoted"""
+    if value is None:
+        return ''
+    if isinstance(field, models.JSONField):
+        text = json.dumps(value, cls=field.encoder)
+    elif isinstance(value, bool):
+        text = 't' if value else 'f'
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _insert_postgresql(model, instances, conn):
+    fields = model._meta.concrete_fields
+    quote = conn.ops.quote_name
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields)
+    )
+    buffer = io.StringIO()
+    for instance in instances:
+        # Python-side values; JSON is dumped here instead of through the driver's adapter
+        values = [getattr(instance, field.attname) if isinstance(field, models.JSONField)
+                  else field.get_db_prep_save(getattr(instance, field.attname), conn)
+                  for field in fields]
+        buffer.write(','.join(_csv_value(field, value) for field, value in zip(fields, values)))
+        buffer.write('\n')
+    buffer.seek(0)
+    with conn.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)  # psycopg2
+        else:
+            with raw.copy(sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+
+
+def _insert_default(model, instances, conn):
+    model._base_manager.using(conn.alias).bulk_create(instances, batch_size=BATCH_SIZE)
+
+
+def _writer(model, conn):
+    if conn.vendor == 'sqlite':
+        return _insert_sqlite
+    if conn.vendor == 'postgresql' and not any(
+        isinstance(field, models.BinaryField) for field in model._meta.concrete_fields
+    ):
+        return _insert_postgresql
+    return _insert_default
+
+
+def _through_rows(deserialized):
+    """{through model: [instances]} for the many-to-many data of deserialized objects"""
+    rows = {}
+    for item in deserialized:
+        for name, pks in item.m2m_data.items():
+            field = item.object._meta.get_field(name)
+            through = field.remote_field.through
+            if not through._meta.auto_created:
+                continue  # Explicit through models are backed up as models of their own
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            rows.setdefault(through, []).extend(
+                through(**{source: item.object.pk, target: pk}) for pk in pks
+            )
+    return rows
+
+
+def _make_room(label, conn, loaded):
+    """Before the backup's first rows of a recreated table, delete the rows post_migrate put there"""
+    if label not in RECREATED:
+        return
+    # Permissions point at the content types; post_migrate recreates any the backup lacks in _finish
+    for target in ('auth.permission', label) if label == 'contenttypes.contenttype' else (label,):
+        model = apps.get_model(target)
+        if model not in loaded:
+            model._base_manager.using(conn.alias).all()._raw_delete(conn.alias)
+
+
+def _load_batch(label, batch, conn, loaded, objects=True, links=True):
+    """
+    Insert one batch of serialized objects and/or their many-to-many links;
+    returns the number of objects
+    """
+    model = _get_model(label)
+    deserialized = list(serializers.deserialize('python', batch, using=conn.alias, ignorenonexistent=True))
+    if objects:
+        _make_room(label, conn, loaded)
+        _writer(model, conn)(model, [item.object for item in deserialized], conn)
+        loaded.add(model)
+    if links:
+        for through, rows in _through_rows(deserialized).items():
+            _writer(through, conn)(through, rows, conn)
+            loaded.add(through)
+    return len(deserialized) if objects else 0
+
+
+def _finish(conn, loaded):
+    """Reset sequences and recreate content types/permissions"""
+    sequence_sql = conn.ops.sequence_reset_sql(no_style(), list(loaded))
+    if sequence_sql:
+        with conn.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    emit_post_migrate_signal(0, False, conn.alias)
+
+
+def _clear(conn):
+    call_command('flush', interactive=False, inhibit_post_migrate=True, verbosity=0, database=conn.alias)
+    # Content types and permissions, which the rows to load may point at
+    emit_post_migrate_signal(0, False, conn.alias)
+
+
+def _restore_serial(objects, batch_size, log):
+    conn = connection
+    loaded = set()
+    count = 0
+    with transaction.atomic():
+        _clear(conn)
+        if conn.vendor == 'postgresql':
+            with conn.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        with conn.constraint_checks_disabled():
+            for label, batch in _batches(objects, batch_size):
+                count += _load_batch(label, batch, conn, loaded)
+                if log:
+                    log(f"  {label}: {count} objects loaded")
+        conn.check_constraints(table_names=[model._meta.db_table for model in loaded])
+        _finish(conn, loaded)
+    return count
+
+
+def _link_targets(model):
+    """Labels of the models a model's auto-created many-to-many tables link it to"""
+    return {
+        field.related_model._meta.label_lower
+        for field in model._meta.many_to_many
+        if field.remote_field.through._meta.auto_created
+    }
+
+
+def _dependency_levels(labels):
+    """
+    Group model labels so every model's foreign keys point into earlier
+    groups. A model with many-to-many links also gets a ``(label, 'links')``
+    entry for its link tables, placed after the model and every model it
+    links to.
+    """
+    remaining = {}
+    for label in labels:
+        model = _get_model(label)
+        remaining[label] = {
+            field.related_model._meta.label_lower
+            for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is not model
+        }
+        targets = _link_targets(model)
+        if targets:
+            remaining[(label, 'links')] = targets | {label}
+    levels = []
+    while remaining:
+        level = [key for key, needs in remaining.items() if not needs & (remaining.keys() - {key})]
+        if not level:
+            raise RestoreError("Foreign keys between the backed up tables form a cycle; use one worker")
+        levels.append(sorted(level, key=str))
+        for key in level:
+            del remaining[key]
+    return levels
+
+
+def _load_spool(label, path, batch_size, links):
+    """Load one model's spool file on this thread's own connection: its rows, or its many-to-many links"""
+    conn = connections['default']
+    loaded = set()
+    count = 0
+    try:
+        with transaction.atomic(), open(path) as f:
+            objects = (json.loads(line) for line in f)
+            for _, batch in _batches(objects, batch_size):
+                count += _load_batch(label, batch, conn, loaded, objects=not links, links=links)
+        return count, loaded
+    finally:
+        conn.close()
+
+
+def _restore_parallel(objects, batch_size, workers, log):
+    spool_dir = tempfile.mkdtemp(prefix='restore_')
+    try:
+        spools = {}
+        files = {}
+        try:
+            for obj in objects:
+                label = obj['model'].lower()
+                if label not in files:
+                    spools[label] = os.path.join(spool_dir, f'{label}.jsonl')
+                    files[label] = open(spools[label], 'w')
+                files[label].write(json.dumps(obj) + '\n')
+        finally:
+            for f in files.values():
+                f.close()
+
+        with transaction.atomic():
+            _clear(connection)
+            for label in RECREATED:
+                if label in spools:
+                    _make_room(label, connection, set())
+        loaded = set()
+        count = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level in _dependency_levels(spools):
+                futures = {}
+                for key in level:
+                    label, links = (key[0], True) if isinstance(key, tuple) else (key, False)
+                    futures[key] = pool.submit(_load_spool, label, spools[label], batch_size, links)
+                for key, future in futures.items():
+                    level_count, level_models = future.result()
+                    count += level_count
+                    loaded |= level_models
+                    if log and not isinstance(key, tuple):
+                        log(f"  {key}: {level_count} objects loaded")
+        _finish(connection, loaded)
+        return count
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def restore(path, batch_size=BATCH_SIZE, workers=1, log=None):
+    """
+    Replace the database with the contents of a JSON backup (dumpdata array
+    or streaming .jsonl backup). Returns the number of objects loaded.
+    """
+    if is_stream_backup(path):
+        validate_backup(path)
+    objects = iter_backup_objects(path)
+    with tracking_suspended():
+        if workers > 1 and connection.vendor == 'postgresql':
+            return _restore_parallel(objects, batch_size, workers, log)
+        return _restore_serial(objects, batch_size, log)
@@ -0,0 +1,169 @@
+"""
+Precomputed pitch coordinates for formation templates.
+
+The lineup builder (JavaScript) and the server (LineupCreateView) both need to
+place players on the pitch according to a formation such as "4-4-2". Instead of
+each of them splitting ``formation_structure`` on every request, the layout is
+computed once per FormationTemplate, kept in the cache and shared with the
+builder as a single JSON payload.
+
+A layout is an ordered list of slots per direction: the goalkeeper first, then
+each formation layer from defence to attack, then sideline slots for
+substitutes. Players are assigned to slots in order, so the layout for a squad
+of N players is simply the first N slots - the table therefore covers every
+squad size from 1 up to ``player_count + SIDELINE_SLOTS``.
+"""
+from functools import lru_cache
+
+from django.core.cache import cache
+
+from . import metrics
+
+# Used when a lineup has no formation (matches the old 4-4-2 default)
+DEFAULT_FORMATION_STRUCTURE = '4-4-2'
+DEFAULT_PLAYER_COUNT = 11
+
+# Number of substitute slots placed along the sideline
+SIDELINE_SLOTS = 9
+
+# Keep the cached layouts for a day; saves invalidate them explicitly
+CACHE_TIMEOUT = 60 * 60 * 24
+
+GOALKEEPER_X = 8
+FIRST_LAYER_X = 25
+LAST_LAYER_X = 85
+SIDELINE_X = 1
+
+
+def _cache_key(formation_id):
+    return f"formation_layout:{formation_id}"
+
+
+def parse_structure(formation_structure):
+    """Parse '4-4-2' into [4, 4, 2]; fall back to the default on bad input"""
+    try:
+        layers = [int(part) for part in formation_structure.split('-')]
+        if layers and all(layer > 0 for layer in layers):
+            return layers
+    except (ValueError, AttributeError):
+        pass
+    return [int(part) for part in DEFAULT_FORMATION_STRUCTURE.split('-')]
+
+
+def _layer_role(index, layer_count):
+    """Defenders first, forwards last, midfielders in between"""
+    if index == 0:
+        return 'DEF'
+    if index == layer_count - 1:
+        return 'FWD'
+    return 'MID'
+
+
+def compute_slots(formation_structure, direction='LR'):
+    """
+    Compute the ordered slot list for a formation in one direction.
+
+    Each slot is a dict with ``role`` (GK/DEF/MID/FWD/SUB), ``x``, ``y`` and
+    ``is_starter``. Coordinates are percentages (0-100) in the same system as
+    LineupPlayerPosition; for 'RL' the x axis is mirrored.
+    """
+    layers = parse_structure(formation_structure)
+    slots = [{'role': 'GK', 'x': GOALKEEPER_X, 'y': 50, 'is_starter': True}]
+
+    # Spread the layers evenly between the defence and attack lines
+    step = (LAST_LAYER_X - FIRST_LAYER_X) / (len(layers) - 1) if len(layers) > 1 else 0
+    for i, players_in_layer in enumerate(layers):
+        x = FIRST_LAYER_X + i * step if len(layers) > 1 else 50
+        y_gap = 100 / (players_in_layer + 1)
+        for j in range(players_in_layer):
+            slots.append({
+                'role': _layer_role(i, len(layers)),
+                'x': x,
+                'y': y_gap * (j + 1),
+                'is_starter': True,
+            })
+
+    # Substitutes line up along the sideline
+    for k in range(SIDELINE_SLOTS):
+        slots.append({'role': 'SUB', 'x': SIDELINE_X, 'y': 5 + k * 10, 'is_starter': False})
+
+    for slot in slots:
+        if direction == 'RL':
+            slot['x'] = 100 - slot['x']
+        slot['x'] = round(slot['x'], 2)
+        slot['y'] = round(slot['y'], 2)
+
+    return slots
+
+
+def build_layout_table(formation_structure, player_count):
+    """Build the coordinate table for both directions"""
+    return {
+        'structure': formation_structure,
+        'player_count': player_count,
+        'max_players': player_count + SIDELINE_SLOTS,
+        'directions': {
+            'LR': compute_slots(formation_structure, 'LR'),
+            'RL': compute_slots(formation_structure, 'RL'),
+        },
+    }
+
+
+@lru_cache(maxsize=None)
+def _default_layout_table():
+    return build_layout_table(DEFAULT_FORMATION_STRUCTURE, DEFAULT_PLAYER_COUNT)
+
+
+def get_layout_table(formation):
+    """
+    Return the cached coordinate table for a FormationTemplate (or the default
+    layout when ``formation`` is None).
+    """
+    if formation is None:
+        return _default_layout_table()
+
+    key = _cache_key(formation.pk)
+    table = cache.get(key)
+    # Guard against stale entries from another worker that missed the invalidation
+    if (table is None or table['structure'] != formation.formation_structure
+            or table['player_count'] != formation.player_count):
+        metrics.count_cache('formation_layout', misses=1)
+        table = build_layout_table(formation.formation_structure, formation.player_count)
+        cache.set(key, table, CACHE_TIMEOUT)
+    else:
+        metrics.count_cache('formation_layout', hits=1)
+    return table
+
+
+def get_layout(formation, direction='LR', player_total=None):
+    """Return the slots for ``player_total`` players (all slots when None)"""
+    directions = get_layout_table(formation)['directions']
+    slots = directions.get(direction) or directions['LR']
+    if player_total is None:
+        return slots
+    return slots[:player_total]
+
+
+def get_all_layout_tables(formations):
+    """Coordinate tables for several formations, keyed by formation id"""
+    keys = {_cache_key(formation.pk): formation for formation in formations}
+    cached = cache.get_many(list(keys))
+
+    tables = {}
+    missing = {}
+    for key, formation in keys.items():
+        table = cached.get(key)
+        if (table is None or table['structure'] != formation.formation_structure
+                or table['player_count'] != formation.player_count):
+            table = build_layout_table(formation.formation_structure, formation.player_count)
+            missing[key] = table
+        tables[str(formation.pk)] = dict(table, name=formation.name)
+
+    metrics.count_cache('formation_layout', hits=len(keys) - len(missing), misses=len(missing))
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+    return tables
+
+
+def invalidate_layout(formation_id):
+    cache.delete(_cache_key(formation_id))
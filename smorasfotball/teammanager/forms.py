@@ -153,8 +153,25 @@ class PlayerSelectionForm(forms.Form):
 
 class ExcelUploadForm(forms.Form):
     excel_file = forms.FileField(
-        label='Select Excel File',
-        help_text='Upload an Excel file (.xlsx) containing player data.'
+        label='Select Excel or CSV File',
+        help_text='Upload an Excel (.xlsx) or CSV (.csv) file containing player data.'
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Dry run',
+        help_text='Only show which players would be created or updated, without saving anything.'
+    )
+
+
+class MatchImportForm(forms.Form):
+    match_file = forms.FileField(
+        label='Select Excel or CSV File',
+        help_text='Upload an Excel (.xlsx) or CSV (.csv) file with one row per player per match.'
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Dry run',
+        help_text='Only show the reconciliation report, without saving anything.'
     )
 
 
@@ -240,6 +257,39 @@ class LineupForm(forms.ModelForm):
             self.fields['match'].required = False
 
 
+class BulkLineupDuplicateForm(forms.Form):
+    matches = forms.ModelMultipleChoiceField(
+        queryset=Match.objects.none(),
+        widget=forms.CheckboxSelectMultiple,
+        help_text='Select every match that should get a copy of this lineup.'
+    )
+    skip_inactive_players = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Skip inactive players',
+        help_text='Players who are no longer active are left out of the copies.'
+    )
+    skip_existing = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Skip matches that already have a lineup',
+        help_text='Matches with an existing lineup for this team are left untouched.'
+    )
+
+    def __init__(self, lineup, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from django.utils import timezone
+        from datetime import timedelta
+
+        # Only matches for the lineup's team, from two weeks ago and onwards
+        two_weeks_ago = timezone.now() - timedelta(days=14)
+        self.fields['matches'].queryset = Match.objects.filter(
+            smoras_team=lineup.team,
+            date__gte=two_weeks_ago
+        ).order_by('date')
+        self.fields['matches'].label_from_instance = lambda obj: f"{obj.date.strftime('%Y-%m-%d')}: {obj.smoras_team} vs {obj.opponent_name}"
+
+
 class LineupPlayerPositionForm(forms.ModelForm):
     class Meta:
         model = LineupPlayerPosition
@@ -0,0 +1,513 @@
+"""
+Incremental (differential) backups.
+
+Every save or delete of a tracked object appends a row to the BackupChange
+log: all teammanager models plus Django's users. A backup directory holds a
+chain described by ``incremental_manifest.json``:
+
+- a full base backup (plain ``dumpdata`` output, loadable with loaddata), and
+- a list of increments, each holding the current state of every object that
+  changed since the previous backup, plus the keys of objects deleted since.
+
+Each backup appends a checkpoint row to the log and records its id and time in
+the manifest; the next increment captures the changes logged after it. If the
+checkpoint is missing (the database was flushed or restored from elsewhere)
+the chain cannot be continued and a new base backup is taken instead.
+
+Log ids are handed out when a row is inserted, not when its transaction
+commits, so a change can become visible after a checkpoint with a higher id.
+Each backup therefore records the ids below its checkpoint that it did not
+see as ``pending``, and the next increments read those again until they show
+up, or until they are older than ``PENDING_SECONDS`` (no request runs that
+long, so they were rolled back).
+
+One chain can be kept in several directories (``copies``): each base and
+increment is written once and placed in all of them with
+``backup_fanout.write_once``, and a copy that missed files is brought up to
+date before the next backup.
+
+Restoring flushes the database, loads the base and replays the increments in
+order. Change tracking is switched off while restoring so replayed rows are
+not logged again.
+
+Bulk writes (bulk_create, bulk_update, queryset.update) do not send model
+signals, so code that uses them calls ``record_objects`` or
+``record_queryset`` itself.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from . import metrics
+from .models import BackupChange
+
+MANIFEST_NAME = 'incremental_manifest.json'
+FORMAT = 'smoras-incremental'
+FORMAT_VERSION = 1
+
+# Same exclusions as the full backups in postgres_backup.py, plus the log itself
+BASE_EXCLUDE = ['contenttypes', 'auth.permission', 'teammanager.backupchange']
+TRACKED_APPS = {'teammanager'}
+TRACKED_MODELS = {'auth.user'}
+
+# Log rows with an empty model label are backup checkpoints, not changes
+CHECKPOINT = ''
+FETCH_BATCH_SIZE = 500
+# Ids missing from the log for longer than this belong to rolled back transactions
+PENDING_SECONDS = 3600
+
+_state = threading.local()
+
+
+class BackupChainError(Exception):
+    """The backup directory has no usable manifest or a file of the chain is missing"""
+
+
+@contextmanager
+def tracking_suspended():
+    """Don't log changes inside this block (used while restoring)"""
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_tracked(model):
+    meta = model._meta
+    if model is BackupChange or meta.proxy or not meta.managed:
+        return False
+    return meta.app_label in TRACKED_APPS or meta.label_lower in TRACKED_MODELS
+
+
+def record_changes(model, pks, deleted=False):
+    """Log that the objects with these primary keys were saved (or deleted)"""
+    if getattr(_state, 'suspended', False) or not is_tracked(model):
+        return
+    label = model._meta.label_lower
+    BackupChange.objects.bulk_create(
+        [BackupChange(model=label, object_pk=str(pk), deleted=deleted) for pk in pks if pk is not None],
+        batch_size=FETCH_BATCH_SIZE
+    )
+
+
+def record_objects(objects):
+    """Log a list of saved instances of one model, e.g. after bulk_create or bulk_update"""
+    objects = list(objects)
+    if objects:
+        record_changes(type(objects[0]), [obj.pk for obj in objects])
+
+
+def record_queryset(queryset):
+    """Log every object of a queryset, e.g. after queryset.update()"""
+    if is_tracked(queryset.model):
+        record_changes(queryset.model, queryset.values_list('pk', flat=True))
+
+
+def _on_save(sender, instance, raw=False, **kwargs):
+    # raw saves come from loaddata and from replaying an increment
+    if not raw:
+        record_changes(sender, [instance.pk])
+
+
+def _on_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], deleted=True)
+
+
+def connect_signals():
+    post_save.connect(_on_save, dispatch_uid='incremental_backup_save')
+    post_delete.connect(_on_delete, dispatch_uid='incremental_backup_delete')
+
+
+def _timestamp():
+    return timezone.now().strftime('%Y%m%d_%H%M%S')
+
+
+def _checkpoint():
+    """Append a checkpoint to the log; returns what the manifest needs to find it again"""
+    with tracking_suspended():
+        checkpoint = BackupChange.objects.create(model=CHECKPOINT, object_pk='')
+    return {'change_id': checkpoint.pk, 'changed_at': checkpoint.changed_at.isoformat()}
+
+
+def _gaps(after, before, seen):
+    """Ranges [first, last] of the ids between ``after`` and ``before`` (exclusive) not in ``seen``"""
+    gaps = []
+    start = after + 1
+    for pk in sorted(pk for pk in seen if after < pk < before):
+        if pk > start:
+            gaps.append([start, pk - 1])
+        start = pk + 1
+    if start < before:
+        gaps.append([start, before - 1])
+    return gaps
+
+
+def _pending(after, before, seen, previous, now):
+    """
+    The ids a backup still has to look for: the earlier ``previous`` ranges
+    that are neither seen nor expired, and the unseen ids of the new window.
+    Entries are [first, last, when first found missing].
+    """
+    expired = now - timedelta(seconds=PENDING_SECONDS)
+    pending = []
+    for first, last, since in previous:
+        if datetime.fromisoformat(since) >= expired:
+            pending.extend([*gap, since] for gap in _gaps(first - 1, last + 1, seen))
+    pending.extend([*gap, now.isoformat()] for gap in _gaps(after, before, seen))
+    return pending
+
+
+def _checkpoint_exists(entry):
+    changed_at = BackupChange.objects.filter(pk=entry['change_id'], model=CHECKPOINT).values_list(
+        'changed_at', flat=True
+    ).first()
+    return changed_at is not None and changed_at.isoformat() == entry['changed_at']
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise BackupChainError(f"{path} is not an incremental backup manifest")
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    # Write next to the old manifest and swap, so a crash never leaves half a file
+    path = os.path.join(directory, MANIFEST_NAME)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def head(manifest):
+    """The most recent backup in the chain (the base or the last increment)"""
+    return manifest['increments'][-1] if manifest['increments'] else manifest['base']
+
+
+def can_continue(manifest):
+    return manifest is not None and _checkpoint_exists(head(manifest))
+
+
+def _write_chain_file(directory, copies, filename, write, counts=None):
+    """
+    Call ``write(path)`` once to produce a chain file and place it in
+    ``directory`` and each of ``copies``, catalogued. Returns the directories
+    that have it; a copy that failed is left out and brought up to date by
+    the next backup.
+    """
+    from .backup_catalog import catalog_new_backup, copy_sidecar
+    path = os.path.join(directory, filename)
+    if not copies:
+        write(path)
+        catalog_new_backup(path, counts=counts)
+        return [directory]
+
+    from .backup_fanout import write_once
+    placed, failed = write_once(filename, [directory, *copies], write, catalog=False)
+    if path in failed:
+        raise failed[path]
+    catalog_new_backup(path, counts=counts)
+    for other in placed:
+        if other != path:
+            copy_sidecar(path, other)
+    return [os.path.dirname(other) for other in placed]
+
+
+def sync_copies(directory, copies):
+    """Give each copy of the chain in ``directory`` the files it lacks, and the same manifest"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return
+    from .backup_catalog import copy_sidecar
+    from .backup_fanout import fan_out
+    files = [entry['file'] for entry in [manifest['base']] + manifest['increments']]
+    for copy in copies:
+        try:
+            current = read_manifest(copy) == manifest
+        except BackupChainError:
+            current = False  # Overwritten with the chain's manifest below
+        if current and all(os.path.exists(os.path.join(copy, filename)) for filename in files):
+            continue
+        for filename in files:
+            source, path = os.path.join(directory, filename), os.path.join(copy, filename)
+            if os.path.exists(path):
+                continue
+            _, failed = fan_out(source, [path])
+            if failed:
+                break
+            copy_sidecar(source, path)
+        else:
+            write_manifest(copy, manifest)
+
+
+def create_base_backup(directory, copies=()):
+    """
+    Write a full dumpdata backup and start a new chain in ``directory``, and
+    in each of ``copies``
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Checkpoint first: anything changed while dumping is also in the next increment
+    checkpoint = _checkpoint()
+    # Changes logged since the last checkpoint (or in the whole log, if there is none) may not have
+    # committed yet, and so be missing from the dump
+    earlier = BackupChange.objects.filter(pk__lt=checkpoint['change_id'])
+    last_checkpoint = earlier.filter(model=CHECKPOINT).order_by('-pk').values_list('pk', flat=True).first()
+    first_change = earlier.order_by('pk').values_list('pk', flat=True).first()
+    after = last_checkpoint or (first_change - 1 if first_change else checkpoint['change_id'] - 1)
+    seen = set(earlier.filter(pk__gt=after).values_list('pk', flat=True))
+    checkpoint['pending'] = _pending(after, checkpoint['change_id'], seen, [], timezone.now())
+    filename = f"backup_base_{_timestamp()}.json"
+    written = _write_chain_file(directory, copies, filename, lambda path: call_command(
+        'dumpdata', exclude=BASE_EXCLUDE, natural_foreign=True, output=path, verbosity=0
+    ))
+
+    manifest = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'base': {'file': filename, 'created_at': timezone.now().isoformat(), **checkpoint},
+        'increments': [],
+    }
+    for chain_directory in written:
+        write_manifest(chain_directory, manifest)
+    return manifest['base']
+
+
+def _changed_keys(after, before, pending=()):
+    """
+    ({model label: set of pk strings}, ids seen) for changes logged between
+    two checkpoints or in the ``pending`` ranges of the previous backup
+    """
+    window = Q(pk__gt=after, pk__lt=before)
+    for first, last, _ in pending:
+        window |= Q(pk__range=(first, last))
+    keys = {}
+    seen = set()
+    rows = BackupChange.objects.filter(window).values_list('pk', 'model', 'object_pk')
+    for pk, label, object_pk in rows.iterator(chunk_size=FETCH_BATCH_SIZE):
+        seen.add(pk)
+        if label != CHECKPOINT:
+            keys.setdefault(label, set()).add(object_pk)
+    return keys, seen
+
+
+def models_in_dependency_order(labels):
+    """Models for these labels with every model after the models its foreign keys point to"""
+    pending = {label: apps.get_model(label) for label in sorted(labels)}
+    ordered = []
+    while pending:
+        for label, model in pending.items():
+            parents = {
+                field.related_model._meta.label_lower
+                for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model is not model
+            }
+            if not parents & pending.keys():
+                break
+        else:
+            # A cycle of foreign keys; constraint checks are deferred anyway
+            label, model = next(iter(pending.items()))
+        ordered.append(pending.pop(label))
+    return ordered
+
+
+def create_incremental_backup(directory, copies=()):
+    """
+    Append an increment with everything changed since the head of the chain,
+    in ``directory`` and in each of ``copies``.
+
+    The current state of each changed object is stored, so an object saved
+    many times costs one entry; objects that no longer exist are listed as
+    deleted. Returns the manifest entry, or None when nothing changed.
+    Raises BackupChainError when the chain cannot be continued.
+    """
+    manifest = read_manifest(directory)
+    if not can_continue(manifest):
+        raise BackupChainError(f"No backup chain to continue in {directory}")
+
+    previous = head(manifest)
+    checkpoint = _checkpoint()
+    keys, seen = _changed_keys(previous['change_id'], checkpoint['change_id'], previous.get('pending', []))
+    if not keys:
+        return None
+    checkpoint['pending'] = _pending(
+        previous['change_id'], checkpoint['change_id'], seen, previous.get('pending', []), timezone.now()
+    )
+
+    objects = []
+    deleted = {}
+    for model in models_in_dependency_order(keys):
+        label = model._meta.label_lower
+        pks = sorted(keys[label])
+        found = set()
+        for start in range(0, len(pks), FETCH_BATCH_SIZE):
+            batch = [model._meta.pk.to_python(pk) for pk in pks[start:start + FETCH_BATCH_SIZE]]
+            queryset = model._default_manager.filter(pk__in=batch).order_by('pk')
+            for data in serializers.serialize('python', queryset, use_natural_foreign_keys=True):
+                found.add(str(data['pk']))
+                objects.append(data)
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            deleted[label] = missing
+
+    filename = f"backup_incremental_{_timestamp()}_{checkpoint['change_id']}.json"
+
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump({
+                'format': FORMAT,
+                'version': FORMAT_VERSION,
+                'from_change_id': previous['change_id'],
+                'to_change_id': checkpoint['change_id'],
+                'objects': objects,
+                'deleted': deleted,
+            }, f, cls=DjangoJSONEncoder)
+
+    counts = {}
+    for data in objects:
+        counts[data['model']] = counts.get(data['model'], 0) + 1
+    written = _write_chain_file(directory, copies, filename, write, counts=counts)
+
+    entry = {
+        'file': filename,
+        'created_at': timezone.now().isoformat(),
+        'saved': len(objects),
+        'deleted': sum(len(pks) for pks in deleted.values()),
+        **checkpoint,
+    }
+    manifest['increments'].append(entry)
+    for chain_directory in written:
+        write_manifest(chain_directory, manifest)
+    return entry
+
+
+def create_backup(directory, full=False, copies=()):
+    """
+    Continue the chain in ``directory`` with an increment, or start a new
+    one with a base backup when asked to or when the chain is broken.
+    ``copies`` are more directories that keep the same chain; each file is
+    written once and placed in all of them.
+    Returns (kind, manifest entry) where kind is 'base' or 'incremental'.
+    """
+    if copies and not full:
+        sync_copies(directory, copies)
+    if not full and can_continue(read_manifest(directory)):
+        with metrics.time_backup('incremental'):
+            return 'incremental', create_incremental_backup(directory, copies)
+    with metrics.time_backup('base'):
+        return 'base', create_base_backup(directory, copies)
+
+
+def apply_increment(path):
+    """Replay one increment file onto the current database"""
+    with open(path) as f:
+        increment = json.load(f)
+    if increment.get('format') != FORMAT:
+        raise BackupChainError(f"{path} is not an incremental backup")
+
+    deleted = increment['deleted']
+    models = models_in_dependency_order(set(deleted) | {data['model'] for data in increment['objects']})
+    with tracking_suspended(), transaction.atomic():
+        # Children before parents, so cascades don't remove rows that are saved below
+        for model in reversed(models):
+            label = model._meta.label_lower
+            pks = [model._meta.pk.to_python(pk) for pk in deleted.get(label, [])]
+            for start in range(0, len(pks), FETCH_BATCH_SIZE):
+                model._default_manager.filter(pk__in=pks[start:start + FETCH_BATCH_SIZE]).delete()
+
+        save_objects(serializers.deserialize('python', increment['objects'], handle_forward_references=True), models)
+    return len(increment['objects']), sum(len(pks) for pks in deleted.values())
+
+
+def save_objects(objects, models):
+    """
+    Save deserialized objects the way loaddata does: with constraint checks
+    deferred to the end, forward references resolved once everything is
+    saved, and the sequences of ``models`` moved past the inserted ids.
+    Call inside a transaction. Returns the number of objects saved.
+    """
+    saved = 0
+    with connection.constraint_checks_disabled():
+        deferred = []
+        for obj in objects:
+            obj.save()
+            saved += 1
+            if obj.deferred_fields:
+                deferred.append(obj)
+        for obj in deferred:
+            obj.save_deferred_fields()
+    connection.check_constraints(table_names=[model._meta.db_table for model in models])
+
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    return saved
+
+
+def chain_files(directory, manifest=None):
+    """Paths of the base and increments, in replay order; checks that all exist"""
+    manifest = manifest or read_manifest(directory)
+    if manifest is None:
+        raise BackupChainError(f"No {MANIFEST_NAME} in {directory}")
+    paths = [os.path.join(directory, entry['file']) for entry in [manifest['base']] + manifest['increments']]
+    for path in paths:
+        if not os.path.exists(path):
+            raise BackupChainError(f"Backup chain file {path} is missing")
+    return paths
+
+
+def restore_chain(directory, log=None):
+    """
+    Replace the database with the state at the head of the chain: flush,
+    load the base with loaddata and replay each increment in order, in one
+    transaction, so a failed restore leaves the database as it was.
+    """
+    base, *increments = chain_files(directory)
+    with tracking_suspended(), transaction.atomic():
+        call_command('flush', interactive=False, verbosity=0)
+        call_command('loaddata', base, verbosity=0)
+        if log:
+            log(f"Loaded base backup {os.path.basename(base)}")
+        for path in increments:
+            saved, deleted = apply_increment(path)
+            if log:
+                log(f"Applied {os.path.basename(path)}: {saved} saved, {deleted} deleted")
+    return len(increments)
+
+
+def prune_changes(directories):
+    """
+    Delete log rows that every chain in ``directories`` has already captured.
+    Returns the number of rows deleted.
+    """
+    heads = []
+    for directory in directories:
+        manifest = read_manifest(directory)
+        if can_continue(manifest):
+            entry = head(manifest)
+            # Rows that commit late into a pending range have not been captured yet
+            heads.append(min([entry['change_id']] + [first for first, _, _ in entry.get('pending', [])]))
+    if not heads:
+        return 0
+    # Keep each head checkpoint itself; it is how a chain proves it can continue
+    return BackupChange.objects.filter(pk__lt=min(heads)).delete()[0]
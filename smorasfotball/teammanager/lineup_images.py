@@ -0,0 +1,275 @@
+"""
+SVG and PNG images of a lineup for sharing in chat groups.
+
+The pitch uses the same page size and geometry as the PDF export
+(``export_lineup_pdf``), which now takes its pitch markings from
+``pitch_markings`` below. A lineup is first turned into a small "scene" - a
+list of drawing primitives in top-left based coordinates - and the scene is
+then written out either as SVG markup or rasterised with Pillow.
+
+Rendered images are cached under a version derived from everything that is
+drawn (positions, names, header text), so any viewer of a shared link gets
+the cached bytes and browsers can revalidate with the same value as ETag.
+"""
+import hashlib
+import io
+import json
+import os
+from xml.sax.saxutils import escape
+
+import reportlab
+from django.core.cache import cache
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from . import metrics
+
+# Page and pitch geometry, shared with the PDF export
+PAGE_WIDTH, PAGE_HEIGHT = landscape(A4)
+PITCH_X = 50
+PITCH_BOTTOM = 70
+PITCH_WIDTH = PAGE_WIDTH - 150
+PITCH_HEIGHT = PAGE_HEIGHT - 180
+GRASS_STRIPE_WIDTH = 20
+CENTER_CIRCLE_RADIUS = 50
+PENALTY_SPOT_DISTANCE = 60
+GOAL_AREA_WIDTH = 40
+GOAL_AREA_HEIGHT = 120
+PENALTY_AREA_WIDTH = 80
+PENALTY_AREA_HEIGHT = 220
+GOAL_DEPTH = 8
+GOAL_HEIGHT = 80
+PLAYER_RADIUS = 15
+
+# Pitch top edge measured from the top of the page (images draw top-down)
+PITCH_TOP = PAGE_HEIGHT - PITCH_BOTTOM - PITCH_HEIGHT
+
+GRASS = '#008000'
+GRASS_EDGE = '#006400'
+GRASS_STRIPE = '#0080001a'
+STARTER = '#0000ff'
+SUBSTITUTE = '#add8e6'
+SHADOW = '#00000033'
+
+IMAGE_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+PNG_SCALE = 2
+# Bitstream Vera ships with reportlab and covers Norwegian letters
+FONT_DIR = os.path.join(os.path.dirname(reportlab.__file__), 'fonts')
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+RENDER_VERSION = 1
+
+
+def pitch_markings(pitch_x, pitch_y, pitch_width, pitch_height):
+    """
+    White pitch markings as ('rect', x, y, w, h, filled), ('circle', cx, cy, r, filled)
+    and ('line', x1, y1, x2, y2) tuples.
+
+    The markings are symmetric around the horizontal centre line, so the same
+    tuples work with the PDF's bottom-left origin and the images' top-left one.
+    """
+    center_x = pitch_x + pitch_width / 2
+    center_y = pitch_y + pitch_height / 2
+    right_x = pitch_x + pitch_width
+    return [
+        ('rect', pitch_x, pitch_y, pitch_width, pitch_height, False),
+        ('line', center_x, pitch_y, center_x, pitch_y + pitch_height),
+        ('circle', center_x, center_y, CENTER_CIRCLE_RADIUS, False),
+        ('circle', center_x, center_y, 5, True),
+        ('circle', pitch_x + PENALTY_SPOT_DISTANCE, center_y, 3, True),
+        ('circle', right_x - PENALTY_SPOT_DISTANCE, center_y, 3, True),
+        ('rect', pitch_x, center_y - GOAL_AREA_HEIGHT / 2, GOAL_AREA_WIDTH, GOAL_AREA_HEIGHT, False),
+        ('rect', right_x - GOAL_AREA_WIDTH, center_y - GOAL_AREA_HEIGHT / 2,
+         GOAL_AREA_WIDTH, GOAL_AREA_HEIGHT, False),
+        ('rect', pitch_x, center_y - PENALTY_AREA_HEIGHT / 2, PENALTY_AREA_WIDTH, PENALTY_AREA_HEIGHT, False),
+        ('rect', right_x - PENALTY_AREA_WIDTH, center_y - PENALTY_AREA_HEIGHT / 2,
+         PENALTY_AREA_WIDTH, PENALTY_AREA_HEIGHT, False),
+        ('rect', pitch_x - GOAL_DEPTH, center_y - GOAL_HEIGHT / 2, GOAL_DEPTH, GOAL_HEIGHT, True),
+        ('rect', right_x, center_y - GOAL_HEIGHT / 2, GOAL_DEPTH, GOAL_HEIGHT, True),
+    ]
+
+
+def lineup_image_data(lineup, direction):
+    """Everything drawn on a lineup image, read in one query"""
+    mirror = direction != lineup.direction
+    players = []
+    positions = lineup.player_positions.select_related('player', 'position').order_by('id')
+    for pos in positions:
+        x = float(pos.x_coordinate)
+        players.append({
+            'name': pos.player.first_name,
+            'x': 100 - x if mirror else x,
+            'y': float(pos.y_coordinate),
+            'is_starter': pos.is_starter,
+            'jersey_number': pos.jersey_number,
+            'position': pos.position.short_name if pos.position else '',
+        })
+
+    if lineup.match:
+        subtitle = f"{lineup.team.name} vs {lineup.match.opponent_name} - {lineup.match.date.strftime('%Y-%m-%d %H:%M')}"
+    else:
+        subtitle = f"Practice/Template Lineup - {lineup.team.name}"
+    if lineup.formation:
+        subtitle += f" | Formation: {lineup.formation.formation_structure}"
+
+    if direction == 'RL':
+        direction_text = "Playing from Right - Goalkeeper on Right"
+    else:
+        direction_text = "Playing from Left - Goalkeeper on Left"
+
+    return {
+        'lineup_id': lineup.pk,
+        'title': f"Lineup: {lineup.name}",
+        'subtitle': subtitle,
+        'direction': direction,
+        'direction_text': direction_text,
+        'players': players,
+    }
+
+
+def image_version(data):
+    """Stable hash of the drawn content, used as cache key and ETag"""
+    payload = json.dumps([RENDER_VERSION, data], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def build_scene(data):
+    """Turn lineup image data into a list of drawing primitives"""
+    scene = [
+        ('rect', 0, 0, PAGE_WIDTH, PAGE_HEIGHT, '#ffffff', None),
+        ('text', 30, 30, data['title'], 18, True, '#000000', 'start'),
+        ('text', 30, 52, data['subtitle'], 12, False, '#000000', 'start'),
+        ('rect', PITCH_X, PITCH_TOP, PITCH_WIDTH, PITCH_HEIGHT, GRASS, GRASS_EDGE),
+    ]
+    for offset in range(0, int(PITCH_HEIGHT), GRASS_STRIPE_WIDTH * 2):
+        stripe_height = min(GRASS_STRIPE_WIDTH, PITCH_HEIGHT - offset)
+        scene.append(('rect', PITCH_X, PITCH_TOP + offset, PITCH_WIDTH, stripe_height, GRASS_STRIPE, None))
+
+    for kind, *args in pitch_markings(PITCH_X, PITCH_TOP, PITCH_WIDTH, PITCH_HEIGHT):
+        if kind == 'line':
+            scene.append(('line', *args, '#ffffff'))
+        else:
+            *shape, filled = args
+            scene.append((kind, *shape, '#ffffff' if filled else None, '#ffffff'))
+
+    for player in data['players']:
+        px = PITCH_X + (player['x'] / 100) * PITCH_WIDTH
+        py = PITCH_TOP + (player['y'] / 100) * PITCH_HEIGHT
+        scene.append(('circle', px + 2, py + 2, PLAYER_RADIUS + 1, SHADOW, None))
+        scene.append(('circle', px, py, PLAYER_RADIUS, STARTER if player['is_starter'] else SUBSTITUTE, None))
+        if player['jersey_number']:
+            scene.append(('text', px, py + 4, str(player['jersey_number']), 10, True, '#ffffff', 'middle'))
+
+        name_width = stringWidth(player['name'], 'Helvetica', 8) + 4
+        scene.append(('rect', px - name_width / 2, py + 18, name_width, 12, '#ffffff', None))
+        scene.append(('text', px, py + 27, player['name'], 8, False, '#000000', 'middle'))
+        if player['position']:
+            position_width = stringWidth(player['position'], 'Helvetica', 6) + 4
+            scene.append(('rect', px - position_width / 2, py + 30, position_width, 10, '#ffffff', None))
+            scene.append(('text', px, py + 37, player['position'], 6, False, '#00008b', 'middle'))
+
+    # Direction label and legend below the pitch, as on the PDF
+    pitch_bottom = PITCH_TOP + PITCH_HEIGHT
+    scene.append(('text', PITCH_X + PITCH_WIDTH / 2, pitch_bottom + 22, data['direction_text'],
+                  14, True, '#000000', 'middle'))
+    scene.append(('text', PITCH_X, PAGE_HEIGHT - 46, "Starting XI", 10, True, '#000000', 'start'))
+    scene.append(('circle', PITCH_X + 80, PAGE_HEIGHT - 50, 5, STARTER, None))
+    scene.append(('text', PITCH_X + 100, PAGE_HEIGHT - 46, "Substitutes", 10, True, '#000000', 'start'))
+    scene.append(('circle', PITCH_X + 190, PAGE_HEIGHT - 50, 5, SUBSTITUTE, None))
+    scene.append(('text', PAGE_WIDTH - 50, PAGE_HEIGHT - 26, "Smørås Fotball - G2015", 8, False, '#000000', 'end'))
+    return scene
+
+
+def _svg_paint(fill, stroke):
+    parts = [f'fill="{fill[:7]}"' if fill else 'fill="none"']
+    if fill and len(fill) == 9:
+        parts.append(f'fill-opacity="{int(fill[7:], 16) / 255:.2f}"')
+    if stroke:
+        parts.append(f'stroke="{stroke}"')
+    return ' '.join(parts)
+
+
+def render_svg(scene):
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{PAGE_WIDTH:.0f}" height="{PAGE_HEIGHT:.0f}" '
+        f'viewBox="0 0 {PAGE_WIDTH:.2f} {PAGE_HEIGHT:.2f}" font-family="Helvetica, Arial, sans-serif">'
+    ]
+    for kind, *args in scene:
+        if kind == 'rect':
+            x, y, w, h, fill, stroke = args
+            lines.append(f'<rect x="{x:.2f}" y="{y:.2f}" width="{w:.2f}" height="{h:.2f}" {_svg_paint(fill, stroke)}/>')
+        elif kind == 'circle':
+            cx, cy, r, fill, stroke = args
+            lines.append(f'<circle cx="{cx:.2f}" cy="{cy:.2f}" r="{r:.2f}" {_svg_paint(fill, stroke)}/>')
+        elif kind == 'line':
+            x1, y1, x2, y2, stroke = args
+            lines.append(f'<line x1="{x1:.2f}" y1="{y1:.2f}" x2="{x2:.2f}" y2="{y2:.2f}" stroke="{stroke}"/>')
+        elif kind == 'text':
+            x, y, text, size, bold, fill, anchor = args
+            weight = ' font-weight="bold"' if bold else ''
+            lines.append(
+                f'<text x="{x:.2f}" y="{y:.2f}" font-size="{size}"{weight} fill="{fill}" '
+                f'text-anchor="{anchor}">{escape(text)}</text>'
+            )
+    lines.append('</svg>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _font(size, bold):
+    try:
+        return ImageFont.truetype(os.path.join(FONT_DIR, 'VeraBd.ttf' if bold else 'Vera.ttf'), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_png(scene, scale=PNG_SCALE):
+    image = Image.new('RGB', (round(PAGE_WIDTH * scale), round(PAGE_HEIGHT * scale)), '#ffffff')
+    draw = ImageDraw.Draw(image, 'RGBA')
+    fonts = {}
+    anchors = {'start': 'ls', 'middle': 'ms', 'end': 'rs'}
+
+    for kind, *args in scene:
+        if kind == 'rect':
+            x, y, w, h, fill, stroke = args
+            draw.rectangle([x * scale, y * scale, (x + w) * scale, (y + h) * scale],
+                           fill=fill, outline=stroke, width=scale if stroke else 0)
+        elif kind == 'circle':
+            cx, cy, r, fill, stroke = args
+            draw.ellipse([(cx - r) * scale, (cy - r) * scale, (cx + r) * scale, (cy + r) * scale],
+                         fill=fill, outline=stroke, width=scale if stroke else 0)
+        elif kind == 'line':
+            x1, y1, x2, y2, stroke = args
+            draw.line([x1 * scale, y1 * scale, x2 * scale, y2 * scale], fill=stroke, width=scale)
+        elif kind == 'text':
+            x, y, text, size, bold, fill, anchor = args
+            if (size, bold) not in fonts:
+                fonts[size, bold] = _font(size * scale, bold)
+            font = fonts[size, bold]
+            draw.text((x * scale, y * scale), text, fill=fill, font=font, anchor=anchors[anchor])
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def get_lineup_image(lineup, image_format, data, version):
+    """
+    Return the image of ``data`` (from ``lineup_image_data``) whose
+    ``image_version`` is ``version``, rendering it only when no cached copy
+    exists. Callers work out the version first, so a request the browser
+    already has the image for needs no rendering at all.
+    """
+    key = f"lineup_image:{lineup.pk}:{image_format}:{version}"
+
+    content = cache.get(key)
+    if content is None:
+        metrics.count_cache('lineup_image', misses=1)
+        scene = build_scene(data)
+        content = render_png(scene) if image_format == 'png' else render_svg(scene)
+        cache.set(key, content, CACHE_TIMEOUT)
+    else:
+        metrics.count_cache('lineup_image', hits=1)
+    return content
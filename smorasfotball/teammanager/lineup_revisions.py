@@ -0,0 +1,255 @@
+"""
+Compact revision history for lineups.
+
+The lineup builder autosaves on every drag, so storing a full copy of the
+lineup each time would grow quickly. Instead each LineupRevision stores only
+the players whose position changed, in a compact list format:
+
+    snapshot: {"d": "LR", "p": [[player_id, position_id, x, y, starter, jersey, notes], ...]}
+    diff:     {"d": "RL", "u": [[player_id, ...same fields...], ...], "r": [removed player_id, ...]}
+
+"d" is only present in a diff when the direction changed. Restores also carry
+"f": the revision number that was restored, which lets undo walk back through
+history instead of toggling between two states.
+
+Every SNAPSHOT_INTERVAL revisions a full snapshot is written, so rebuilding
+any revision needs at most one snapshot plus SNAPSHOT_INTERVAL - 1 diffs.
+Saves by the same user within COALESCE_SECONDS are folded into the previous
+diff, so a burst of drags becomes a single revision.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .incremental_backup import record_objects
+from .models import Lineup, LineupPlayerPosition, LineupRevision
+
+SNAPSHOT_INTERVAL = 20
+COALESCE_SECONDS = 30
+
+
+def _entry(player_id, values):
+    return [player_id, *values]
+
+
+def _values(position_id, x, y, is_starter, jersey_number, notes):
+    """Normalise one position into the tuple stored in revisions"""
+    return (
+        position_id,
+        round(float(x), 2),
+        round(float(y), 2),
+        1 if is_starter else 0,
+        jersey_number,
+        notes or None,
+    )
+
+
+def capture_state(lineup):
+    """Current direction and player positions of a lineup, read in one query"""
+    rows = LineupPlayerPosition.objects.filter(lineup=lineup).values_list(
+        'player_id', 'position_id', 'x_coordinate', 'y_coordinate',
+        'is_starter', 'jersey_number', 'notes'
+    )
+    return {
+        'direction': lineup.direction,
+        'positions': {row[0]: _values(*row[1:]) for row in rows},
+    }
+
+
+def snapshot_data(state):
+    return {
+        'd': state['direction'],
+        'p': [_entry(player_id, values) for player_id, values in sorted(state['positions'].items())],
+    }
+
+
+def make_diff(old, new):
+    """Diff two states; returns an empty dict when nothing changed"""
+    data = {}
+    if old['direction'] != new['direction']:
+        data['d'] = new['direction']
+
+    updated = [
+        _entry(player_id, values)
+        for player_id, values in sorted(new['positions'].items())
+        if old['positions'].get(player_id) != values
+    ]
+    removed = sorted(player_id for player_id in old['positions'] if player_id not in new['positions'])
+    if updated:
+        data['u'] = updated
+    if removed:
+        data['r'] = removed
+    return data
+
+
+def apply_revision(state, revision):
+    """Apply a revision's data to a state (in place) and return it"""
+    data = revision.data
+    if revision.is_snapshot:
+        state['positions'] = {entry[0]: tuple(entry[1:]) for entry in data.get('p', [])}
+    else:
+        for entry in data.get('u', []):
+            state['positions'][entry[0]] = tuple(entry[1:])
+        for player_id in data.get('r', []):
+            state['positions'].pop(player_id, None)
+    if 'd' in data:
+        state['direction'] = data['d']
+    return state
+
+
+def reconstruct(lineup, number):
+    """
+    Rebuild the lineup state as of revision ``number``.
+
+    Raises LineupRevision.DoesNotExist if there is no snapshot to start from.
+    """
+    snapshot = lineup.revisions.filter(number__lte=number, is_snapshot=True).order_by('-number').first()
+    if snapshot is None:
+        raise LineupRevision.DoesNotExist(f"No snapshot at or before revision {number}")
+
+    state = apply_revision({'direction': lineup.direction, 'positions': {}}, snapshot)
+    for revision in lineup.revisions.filter(number__gt=snapshot.number, number__lte=number).order_by('number'):
+        apply_revision(state, revision)
+    return state
+
+
+def _lock(lineup):
+    """
+    Lock the lineup's row until the end of the transaction, so concurrent
+    saves record their revisions one after the other. Locking the revisions
+    instead would lock nothing before the first one exists.
+    """
+    Lineup.objects.select_for_update().filter(pk=lineup.pk).values_list('pk', flat=True).get()
+
+
+def record_revision(lineup, user=None, coalesce=True, restored_from=None):
+    """
+    Store the lineup's current state as a new revision.
+
+    Returns the new (or coalesced) revision, or None when nothing changed.
+    """
+    user_id = user.pk if user is not None and user.is_authenticated else None
+
+    with transaction.atomic():
+        _lock(lineup)
+        current = capture_state(lineup)
+        latest = lineup.revisions.order_by('-number').first()
+        if latest is None:
+            return LineupRevision.objects.create(
+                lineup=lineup, number=1, is_snapshot=True,
+                data=snapshot_data(current), created_by_id=user_id
+            )
+
+        previous = reconstruct(lineup, latest.number)
+        diff = make_diff(previous, current)
+        if not diff:
+            return None
+
+        # Fold quick successive saves by the same user into the last diff
+        recent = timezone.now() - timedelta(seconds=COALESCE_SECONDS)
+        if (coalesce and restored_from is None and not latest.is_snapshot
+                and 'f' not in latest.data
+                and latest.created_by_id == user_id and latest.updated_at >= recent):
+            merged = make_diff(reconstruct(lineup, latest.number - 1), current)
+            if not merged:
+                latest.delete()
+                return None
+            latest.data = merged
+            latest.save(update_fields=['data', 'updated_at'])
+            return latest
+
+        number = latest.number + 1
+        if (number - 1) % SNAPSHOT_INTERVAL == 0:
+            data, is_snapshot = snapshot_data(current), True
+        else:
+            data, is_snapshot = diff, False
+        if restored_from is not None:
+            data['f'] = restored_from
+
+        return LineupRevision.objects.create(
+            lineup=lineup, number=number, is_snapshot=is_snapshot,
+            data=data, created_by_id=user_id
+        )
+
+
+def ensure_baseline(lineup, user=None):
+    """
+    Record the current state before the first change to a lineup. Call it
+    in the same transaction as the change and its ``record_revision``, so a
+    concurrent first save waits for the lock instead of recording a second
+    baseline.
+    """
+    with transaction.atomic():
+        _lock(lineup)
+        if not lineup.revisions.exists():
+            record_revision(lineup, user)
+
+
+def restore_revision(lineup, number, user=None):
+    """Rewrite the lineup's positions to match revision ``number``"""
+    state = reconstruct(lineup, number)
+
+    with transaction.atomic():
+        LineupPlayerPosition.objects.filter(lineup=lineup).delete()
+        record_objects(LineupPlayerPosition.objects.bulk_create([
+            LineupPlayerPosition(
+                lineup=lineup,
+                player_id=player_id,
+                position_id=position_id,
+                x_coordinate=x,
+                y_coordinate=y,
+                is_starter=bool(starter),
+                jersey_number=jersey,
+                notes=notes,
+            )
+            for player_id, (position_id, x, y, starter, jersey, notes) in state['positions'].items()
+        ]))
+        if lineup.direction != state['direction']:
+            lineup.direction = state['direction']
+            lineup.save(update_fields=['direction', 'updated_at'])
+
+        return record_revision(lineup, user, coalesce=False, restored_from=number)
+
+
+def undo_target(lineup):
+    """
+    The revision number an undo should restore, or None if there is nothing to undo.
+
+    Undoing a restore continues from the revision before the restored one, so
+    repeated undos keep stepping back instead of flipping between two states.
+    """
+    latest = lineup.revisions.order_by('-number').first()
+    if latest is None:
+        return None
+    target = latest.data.get('f', latest.number) - 1
+    return target if target >= 1 else None
+
+
+def describe_changes(old, new):
+    """Human-friendly diff between two states (used by the diff endpoint)"""
+    def as_dict(values):
+        position_id, x, y, starter, jersey, notes = values
+        return {
+            'position_id': position_id, 'x': x, 'y': y,
+            'is_starter': bool(starter), 'jersey_number': jersey, 'notes': notes,
+        }
+
+    added = [
+        dict(as_dict(values), player_id=player_id)
+        for player_id, values in sorted(new['positions'].items())
+        if player_id not in old['positions']
+    ]
+    removed = sorted(player_id for player_id in old['positions'] if player_id not in new['positions'])
+    changed = [
+        {'player_id': player_id, 'before': as_dict(old['positions'][player_id]), 'after': as_dict(values)}
+        for player_id, values in sorted(new['positions'].items())
+        if player_id in old['positions'] and old['positions'][player_id] != values
+    ]
+    return {
+        'direction': {'before': old['direction'], 'after': new['direction']}
+        if old['direction'] != new['direction'] else None,
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+    }
@@ -0,0 +1,62 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from teammanager import backup_catalog
+
+
+class Command(BaseCommand):
+    help = 'List catalogued backups, catalogue new ones, or find duplicate backups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directories', nargs='*',
+            help='Backup directories (default: backup)'
+        )
+        parser.add_argument(
+            '--index', action='store_true',
+            help='First catalogue backups that have no sidecar or were replaced'
+        )
+        parser.add_argument(
+            '--duplicates', action='store_true',
+            help='Only list backups with identical content'
+        )
+
+    def handle(self, *args, **options):
+        directories = options['directories'] or ['backup']
+
+        if options['index']:
+            indexed = backup_catalog.refresh(
+                directories, log=lambda message: self.stdout.write(self.style.WARNING(message))
+            )
+            self.stdout.write(f"Catalogued {indexed} backup(s)")
+
+        if options['duplicates']:
+            groups = backup_catalog.duplicates(directories)
+            if not groups:
+                self.stdout.write('No duplicate backups')
+            for group in groups:
+                self.stdout.write(f"{group[0].manifest['sha256'][:12]} ({group[0].size} bytes each):")
+                for entry in group:
+                    self.stdout.write(f"  {entry.path}")
+            return
+
+        for entry in backup_catalog.list_backups(directories):
+            if 'error' in entry.manifest:
+                self.stdout.write(f"{os.path.relpath(entry.path)}: not a readable backup ({entry.manifest['error']})")
+                continue
+            if not entry.exists:
+                status = ' [missing]'
+            elif not entry.is_current:
+                status = ' [changed since it was catalogued]'
+            else:
+                status = ''
+            self.stdout.write(
+                f"{entry.manifest['created_at']}  {entry.manifest['kind']:<11} "
+                f"{entry.manifest['total']:>7} objects  {os.path.relpath(entry.path)}{status}"
+            )
+        uncatalogued = backup_catalog.uncatalogued(directories)
+        if uncatalogued:
+            self.stdout.write(self.style.WARNING(
+                f"{len(uncatalogued)} backup(s) not catalogued yet; run with --index"
+            ))
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from teammanager import benchmark
+from teammanager.backup_stream import available_compressions
+
+
+class Command(BaseCommand):
+    help = ('Time every backup and restore path on a synthetic dataset and report throughput, '
+            'peak memory and file size as JSON')
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.SCALE.items():
+            parser.add_argument(f'--{name}', type=int, default=default, help=f'Dataset scale (default: {default})')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument(
+            '--database-url',
+            help='Run against this database instead of a scratch SQLite file. It is flushed: use a throwaway database'
+        )
+        parser.add_argument('--only', action='append', help='Run only these steps (after generate; repeatable)')
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+        # Internal: run one step in this process
+        parser.add_argument('--step', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] for name in benchmark.SCALE}
+        if options['step']:
+            function, _ = benchmark.STEPS[options['step']]
+            started = time.perf_counter()
+            objects, path = function(scale)
+            seconds = time.perf_counter() - started
+            self.stdout.write(json.dumps({'objects': objects, 'path': path, 'seconds': seconds}))
+            return
+
+        workdir = tempfile.mkdtemp(prefix='backup_benchmark_')
+        env = dict(os.environ, BENCHMARK_DIR=workdir, DATABASE_DIR=os.path.join(workdir, 'db'))
+        os.makedirs(env['DATABASE_DIR'])
+        env.pop('DATABASE_URL', None)
+        vendor = 'sqlite'
+        if options['database_url']:
+            env['DATABASE_URL'] = options['database_url']
+            vendor = 'postgresql' if options['database_url'].startswith('postgres') else 'other'
+
+        steps = [
+            name for name, (_, vendors) in benchmark.STEPS.items()
+            if (vendors is None or vendor in vendors)
+            and not (name.endswith('_zstd') and 'zstd' not in available_compressions())
+            and (name == 'generate' or not options['only'] or name in options['only'])
+        ]
+        report = {
+            'commit': self._commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': vendor,
+            'scale': scale,
+            'results': [],
+        }
+        objects = None
+        try:
+            for name in steps:
+                result = self._run(name, [sys.executable, 'manage.py', 'benchmark_backups', '--step', name]
+                                   + [f'--{key}={value}' for key, value in scale.items()], env)
+                objects = result['objects'] if name == 'dumpdata' else objects
+                report['results'].append(self._measure(name, result, objects))
+            if vendor == 'postgresql' and (not options['only'] or 'postgres_backup' in options['only']):
+                output_dir = os.path.join(workdir, 'postgres_backup')
+                result = self._run('postgres_backup', [
+                    sys.executable, os.path.join(settings.BASE_DIR, 'postgres_backup.py'), '--output-dir', output_dir
+                ], env, parse=False)
+                result['path'] = output_dir
+                report['results'].append(self._measure('postgres_backup', result, objects))
+        finally:
+            if options['keep']:
+                self.stdout.write(f"Scratch files kept in {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _run(self, name, command, env, parse=True):
+        """Run one step in a child process; returns its result with seconds and peak RSS"""
+        self.stderr.write(f"Running {name}...")
+        with tempfile.TemporaryFile('w+') as out, tempfile.TemporaryFile('w+') as err:
+            started = time.perf_counter()
+            process = subprocess.Popen(command, env=env, stdout=out, stderr=err, cwd=settings.BASE_DIR)
+            # wait4 gives this child's own resource usage (ru_maxrss is in KB on Linux)
+            _, status, usage = os.wait4(process.pid, 0)
+            seconds = time.perf_counter() - started
+            out.seek(0)
+            err.seek(0)
+            stdout, stderr = out.read(), err.read()
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise CommandError(f"Step {name} failed:\n{stderr[-2000:]}")
+        if parse:
+            result = json.loads(stdout.strip().splitlines()[-1])
+        else:
+            result = {'objects': None, 'path': None, 'seconds': seconds}
+        # Steps in manage.py time themselves, without Django's start-up
+        result['process_seconds'] = seconds
+        result['peak_rss_kb'] = usage.ru_maxrss
+        return result
+
+    def _measure(self, name, result, objects):
+        path = result.get('path')
+        size = None
+        if path and os.path.isdir(path):
+            size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+        elif path and os.path.exists(path):
+            size = os.path.getsize(path)
+        count = result['objects'] if result['objects'] is not None else objects
+        seconds = result['seconds']
+        return {
+            'step': name,
+            'seconds': round(seconds, 4),
+            'process_seconds': round(result['process_seconds'], 4),
+            'objects': count,
+            'objects_per_second': round(count / seconds, 1) if count else None,
+            'bytes': size,
+            'bytes_per_second': round(size / seconds) if size else None,
+            'peak_rss_kb': result['peak_rss_kb'],
+        }
+
+    def _print(self, report):
+        self.stdout.write(f"Scale: {report['scale']} on {report['database']} (commit {report['commit']})")
+        self.stdout.write(f"{'step':<22}{'seconds':>9}{'objects/s':>12}{'bytes':>12}{'MB/s':>9}{'peak RSS KB':>13}")
+        for row in report['results']:
+            rate = f"{row['bytes_per_second'] / 1e6:.2f}" if row['bytes_per_second'] else ''
+            self.stdout.write(
+                f"{row['step']:<22}{row['seconds']:>9.3f}{row['objects_per_second'] or '':>12}"
+                f"{row['bytes'] or '':>12}{rate:>9}{row['peak_rss_kb']:>13}"
+            )
@@ -0,0 +1,90 @@
+import json
+import os
+import statistics
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from smorasfotball.settings import postgres_database
+
+# Environment for each way of handling connections, fed through the same settings as the site
+MODES = {
+    'reconnect': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '600', 'DB_CONN_HEALTH_CHECKS': '1'},
+    'pool': {'DB_POOL': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request database latency when reconnecting for every request, with '
+            'persistent connections and with a connection pool (PostgreSQL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database-url', default=os.environ.get('DATABASE_URL'),
+            help='PostgreSQL database to connect to (default: DATABASE_URL). '
+                 'Add ?sslmode=disable for a local server without TLS'
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode (default: 200)')
+        parser.add_argument('--mode', action='append', choices=list(MODES), help='Only these modes (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        url = options['database_url']
+        if not url or not url.startswith('postgres'):
+            raise CommandError('Pass a PostgreSQL --database-url or set DATABASE_URL')
+
+        results = []
+        for mode in options['mode'] or MODES:
+            with mock.patch.dict(os.environ, MODES[mode]):
+                config = postgres_database(url)
+            if mode == 'pool' and 'pool' not in config['OPTIONS']:
+                self.stderr.write('Skipping pool: psycopg_pool is not installed')
+                continue
+            results.append(self._measure(mode, config, options['requests']))
+
+        self.stdout.write(f"{'mode':<12}{'first ms':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<12}{row['first_ms']:>10.2f}{row['mean_ms']:>10.2f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'requests': options['requests'], 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _measure(self, mode, config, requests):
+        """Time ``requests`` request cycles, each running one query, on a connection configured by ``config``"""
+        alias = f'benchmark_{mode}'
+        # Fill in the defaults Django gives every configured database
+        connections.settings[alias] = connections.configure_settings({DEFAULT_DB_ALIAS: config})[DEFAULT_DB_ALIAS]
+        connection = connections[alias]
+        timings = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                # The same signals a request sends: they close or return connections as configured
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                request_finished.send(sender=self.__class__)
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+            del connections[alias]
+            del connections.settings[alias]
+
+        steady = timings[1:] or timings
+        return {
+            'mode': mode,
+            'first_ms': round(timings[0], 3),
+            'mean_ms': round(statistics.mean(steady), 3),
+            'p50_ms': round(statistics.median(steady), 3),
+            'p95_ms': round(statistics.quantiles(steady, n=20)[-1], 3) if len(steady) > 1 else round(steady[0], 3),
+        }
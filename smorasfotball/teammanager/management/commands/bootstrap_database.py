@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+STATE_NAME = '.database_bootstrap.json'
+
+
+def is_production(deployment_dir):
+    return os.path.exists(os.path.join(deployment_dir, 'IS_PRODUCTION_ENVIRONMENT'))
+
+
+class Command(BaseCommand):
+    help = ('Provision and check the database once: creates a PostgreSQL database in production when '
+            'DATABASE_URL is missing, saves its credentials and remembers that the database is ready')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Check again even if already provisioned')
+        parser.add_argument('--state', help=f'State file (default: deployment/{STATE_NAME})')
+
+    def handle(self, *args, **options):
+        deployment_dir = os.path.join(os.path.dirname(settings.BASE_DIR), 'deployment')
+        state_path = options['state'] or os.path.join(deployment_dir, STATE_NAME)
+        database = connection.settings_dict
+        key = self._key(database)
+
+        state = self._read_state(state_path)
+        if state and state.get('key') == key and not options['force']:
+            self.stdout.write(f"Database already provisioned ({state['engine']}, since {state['provisioned_at']})")
+            return
+
+        if connection.vendor != 'postgresql' and is_production(deployment_dir):
+            self.stdout.write(self.style.WARNING(
+                "This is a production environment, but DATABASE_URL is not set. Provisioning PostgreSQL..."
+            ))
+            url = self._provision()
+            if not url:
+                raise CommandError('Could not provision a PostgreSQL database; set DATABASE_URL')
+            self._save_credentials(deployment_dir, url)
+            self.stdout.write(self.style.SUCCESS(
+                'PostgreSQL database created. Set DATABASE_URL for the app and run this command again'
+            ))
+            return
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('No DATABASE_URL: using SQLite, for development and testing only'))
+            if not connection.is_in_memory_db():
+                os.makedirs(os.path.dirname(str(database['NAME'])), exist_ok=True)
+        elif os.environ.get('DB_POOL') and 'pool' not in database['OPTIONS']:
+            self.stdout.write(self.style.WARNING(
+                'DB_POOL is set but psycopg_pool is not installed; using persistent connections'
+            ))
+
+        try:
+            connection.ensure_connection()
+        except DatabaseError as e:
+            raise CommandError(f"Cannot connect to the {connection.vendor} database: {e}")
+        self.stdout.write(
+            f"Database engine: {database['ENGINE']}, name: {database['NAME']}, host: {database.get('HOST') or 'local'}"
+        )
+
+        state = {
+            'key': key,
+            'engine': database['ENGINE'],
+            'provisioned_at': timezone.now().isoformat(),
+        }
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        with open(state_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        self.stdout.write(self.style.SUCCESS('Database is ready'))
+
+    def _key(self, database):
+        """Identifies the configured database without storing its credentials"""
+        identity = '|'.join(str(database.get(name) or '') for name in ('ENGINE', 'HOST', 'PORT', 'NAME', 'USER'))
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def _read_state(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _provision(self):
+        """Run create_postgres_db.py's provisioning in this process; returns the new DATABASE_URL or None"""
+        repo_root = os.path.dirname(settings.BASE_DIR)
+        if repo_root not in sys.path:
+            sys.path.insert(0, repo_root)
+        try:
+            from create_postgres_db import create_postgres_db
+        except ImportError as e:
+            raise CommandError(f"create_postgres_db.py is not available: {e}")
+        if not create_postgres_db():
+            return None
+        return os.environ.get('DATABASE_URL')
+
+    def _save_credentials(self, deployment_dir, url):
+        os.makedirs(deployment_dir, exist_ok=True)
+        # Save only the DATABASE_URL to avoid saving other sensitive credentials
+        with open(os.path.join(deployment_dir, 'postgres_credentials.json'), 'w') as f:
+            json.dump({'DATABASE_URL': url}, f)
+        self.stdout.write('PostgreSQL credentials saved for future use')
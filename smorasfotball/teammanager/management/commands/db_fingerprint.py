@@ -0,0 +1,44 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from teammanager import backup_catalog, db_fingerprint
+
+
+class Command(BaseCommand):
+    help = ("Print the database's fingerprint (row counts, highest ids, migrations), or compare it "
+            "with a backup's catalog entry")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='A backup, or a directory whose deployment backup is used. '
+                 'Exits with an error when the database differs from it'
+        )
+
+    def handle(self, *args, **options):
+        path = options['compare']
+        if not path:
+            self.stdout.write(json.dumps(db_fingerprint.fingerprint(), indent=2, default=str))
+            return
+
+        if os.path.isdir(path):
+            backup_catalog.refresh([path], log=lambda message: self.stdout.write(self.style.WARNING(message)))
+            entry = backup_catalog.deployment_backup([path])
+            if entry is None:
+                raise CommandError(f"No deployment backup in {path}")
+        else:
+            manifest = backup_catalog.read_sidecar(path)
+            if manifest is None:
+                raise CommandError(f"{path} is not catalogued; run backup_catalog --index first")
+            entry = backup_catalog.CatalogEntry(path, manifest, os.stat(path) if os.path.exists(path) else None)
+            if not entry.is_current:
+                raise CommandError(f"{path} has changed since it was catalogued")
+
+        found = db_fingerprint.differences(entry.manifest)
+        if found:
+            raise CommandError(
+                f"The database differs from {entry.path}:\n" + '\n'.join(f"  {message}" for message in found)
+            )
+        self.stdout.write(self.style.SUCCESS(f"The database matches {entry.path}"))
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from teammanager import data_export
+
+
+class Command(BaseCommand):
+    help = 'Export players, matches, appearances, playing times or substitutions as CSV, XLSX or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(data_export.DATASETS), help='Dataset to export')
+        parser.add_argument(
+            '--format', dest='export_format', choices=sorted(data_export.FORMATS), default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write to (default: <dataset>_<date>.<format>; use - for stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=data_export.CHUNK_SIZE,
+            help='Rows fetched from the database at a time'
+        )
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        export_format = options['export_format']
+        output = options['output'] or data_export.export_filename(dataset, export_format)
+
+        try:
+            content = data_export.stream_export(dataset, export_format, chunk_size=options['chunk_size'])
+        except data_export.ExportError as e:
+            raise CommandError(str(e))
+
+        if output == '-':
+            for block in content:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(output, 'wb') as f:
+            for block in content:
+                f.write(block)
+                size += len(block)
+        self.stdout.write(self.style.SUCCESS(f"Exported {dataset} to {output} ({size} bytes)"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teammanager import incremental_backup
+
+
+class Command(BaseCommand):
+    help = 'Back up only the rows created, changed or deleted since the last backup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir', action='append', dest='output_dirs',
+            help='Directory holding the backup chain (repeat for several; default: backup/incremental)'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Start a new chain with a full base backup'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Afterwards, delete change log entries that every chain has captured'
+        )
+
+    def handle(self, *args, **options):
+        directories = options['output_dirs'] or ['backup/incremental']
+
+        for directory in directories:
+            try:
+                kind, entry = incremental_backup.create_backup(directory, full=options['full'])
+            except (incremental_backup.BackupChainError, OSError) as e:
+                raise CommandError(f"Backup in {directory} failed: {e}")
+
+            if entry is None:
+                self.stdout.write(f"{directory}: nothing changed since the last backup")
+            elif kind == 'base':
+                self.stdout.write(self.style.SUCCESS(f"{directory}: base backup {entry['file']}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{directory}: incremental backup {entry['file']} "
+                    f"({entry['saved']} saved, {entry['deleted']} deleted)"
+                ))
+
+        if options['prune']:
+            pruned = incremental_backup.prune_changes(directories)
+            self.stdout.write(f"Pruned {pruned} change log entries")
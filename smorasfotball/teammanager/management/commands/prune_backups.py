@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from teammanager import backup_catalog, backup_store
+
+
+class Command(BaseCommand):
+    help = 'Deduplicate identical backups into a content-addressed store and prune old backups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directories', nargs='*',
+            help='Backup directories (default: the backup folders inside the repository)'
+        )
+        for period, count in backup_store.RETENTION.items():
+            parser.add_argument(
+                f'--keep-{period}', type=int, default=count, dest=period,
+                help=f'Keep the newest backup of each of this many {period} periods (default: {count})'
+            )
+        parser.add_argument('--store', help='Content store directory (default: persistent_backups/.store)')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the backups that would be pruned')
+        parser.add_argument('--no-prune', action='store_true', help='Only deduplicate, keep every backup')
+
+    def handle(self, *args, **options):
+        directories = [d for d in options['directories'] or backup_store.default_directories() if os.path.isdir(d)]
+        policy = {period: options[period] for period in backup_store.RETENTION}
+        warn = lambda message: self.stdout.write(self.style.WARNING(message))
+
+        if options['dry_run']:
+            backup_catalog.refresh(directories, log=warn)
+            for path in backup_store.plan_prune(directories, policy):
+                self.stdout.write(f"Would prune {path}")
+            return
+
+        linked, freed = backup_store.dedupe(directories, store=options['store'], log=warn)
+        self.stdout.write(f"Linked {linked} duplicate backup(s) to the store, {freed} bytes freed")
+
+        if not options['no_prune']:
+            pruned, freed = backup_store.prune(directories, policy, store=options['store'])
+            for path in pruned:
+                self.stdout.write(f"Pruned {path}")
+            self.stdout.write(self.style.SUCCESS(f"Pruned {len(pruned)} backup(s), {freed} bytes freed"))
@@ -1,8 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
-from django.core.management import call_command
 import os
-import shutil
-import glob
+
+from teammanager import backup_catalog, backup_stream, fast_restore, incremental_backup, sqlite_backup
 
 class Command(BaseCommand):
     help = 'Restores database from a backup'
@@ -12,37 +11,60 @@ class Command(BaseCommand):
             'backup_file',
             nargs='?',
             type=str,
-            help='Path to the backup file (.json) to restore from. If not provided, will list available backups.'
+            help='Path to the backup file (.json, .jsonl.gz, .jsonl.zst or .sqlite3), or to an incremental backup chain '
+                 '(its directory or incremental_manifest.json), to restore from. '
+                 'If not provided, will list available backups.'
         )
         parser.add_argument(
             '--force',
             action='store_true',
             help='Force restore without confirmation prompt',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Load independent tables in parallel (PostgreSQL only; not atomic)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=fast_restore.BATCH_SIZE,
+            help='Objects inserted per statement when restoring JSON backups',
+        )
     
     def handle(self, *args, **options):
         backup_dir = 'backup'
         
-        # Check if backup directory exists
-        if not os.path.exists(backup_dir):
-            raise CommandError(f"Backup directory '{backup_dir}' does not exist.")
-        
         # If no backup file specified, list available backups
         if not options['backup_file']:
-            json_backups = glob.glob(os.path.join(backup_dir, '*.json'))
-            sqlite_backups = glob.glob(os.path.join(backup_dir, '*.sqlite3'))
+            # Check if backup directory exists
+            if not os.path.exists(backup_dir):
+                raise CommandError(f"Backup directory '{backup_dir}' does not exist.")
             
-            if not json_backups and not sqlite_backups:
+            entries = [
+                entry for entry in backup_catalog.list_backups([backup_dir])
+                if entry.exists and 'error' not in entry.manifest
+            ]
+            uncatalogued = backup_catalog.uncatalogued([backup_dir])
+            
+            if not entries and not uncatalogued:
                 self.stdout.write(self.style.WARNING('No backups found in the backup directory.'))
                 return
             
-            self.stdout.write('Available JSON backups:')
-            for i, backup in enumerate(sorted(json_backups), 1):
-                self.stdout.write(f" {i}. {os.path.basename(backup)}")
+            self.stdout.write('Available backups (newest first):')
+            for i, entry in enumerate(entries, 1):
+                status = '' if entry.is_current else ' [changed since it was catalogued]'
+                self.stdout.write(
+                    f" {i}. {os.path.basename(entry.path)} - {entry.manifest['kind']}, "
+                    f"{entry.manifest['total']} objects, {entry.manifest['created_at']}{status}"
+                )
             
-            self.stdout.write('\nAvailable SQLite backups:')
-            for i, backup in enumerate(sorted(sqlite_backups), 1):
-                self.stdout.write(f" {i}. {os.path.basename(backup)}")
+            if uncatalogued:
+                self.stdout.write('\nNot catalogued yet:')
+                for backup in uncatalogued:
+                    self.stdout.write(f" - {os.path.basename(backup)}")
+                self.stdout.write(f'Run "python manage.py backup_catalog --index {backup_dir}" to catalogue them.')
             
             self.stdout.write('\nTo restore, run:')
             self.stdout.write('  python manage.py restore_database backup/[filename]')
@@ -62,20 +84,32 @@ class Command(BaseCommand):
                 return
         
         # Perform the restore based on file extension
-        if backup_file.endswith('.json'):
-            # Restore from JSON (dumpdata) file
+        if os.path.isdir(backup_file) or os.path.basename(backup_file) == incremental_backup.MANIFEST_NAME:
+            # Replay a base backup plus its chain of increments
+            chain_dir = backup_file if os.path.isdir(backup_file) else os.path.dirname(backup_file)
+            try:
+                self.stdout.write(f'Restoring backup chain from {chain_dir}...')
+                increments = incremental_backup.restore_chain(chain_dir, log=self.stdout.write)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Database restored successfully from base backup and {increments} increment(s).'
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Error restoring database: {str(e)}'))
+
+        elif backup_file.endswith('.json') or backup_stream.is_stream_backup(backup_file):
+            # Restore from JSON (dumpdata) or streaming backup with batched inserts
             try:
                 self.stdout.write(f'Restoring from {backup_file}...')
-                # Flush the database first (but keep the superuser)
-                call_command('flush', '--noinput')
-                # Load data from backup
-                call_command('loaddata', backup_file)
-                self.stdout.write(self.style.SUCCESS('Database restored successfully from JSON backup.'))
+                log = self.stdout.write if options['verbosity'] > 1 else None
+                loaded = fast_restore.restore(
+                    backup_file, batch_size=options['batch_size'], workers=options['workers'], log=log
+                )
+                self.stdout.write(self.style.SUCCESS(f'Database restored successfully: {loaded} objects loaded.'))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error restoring database: {str(e)}'))
         
         elif backup_file.endswith('.sqlite3'):
-            # Restore from SQLite file (direct copy)
+            # Restore from SQLite file with the online backup API (consistent, under SQLite's locks)
             try:
                 db_path = 'db.sqlite3'
                 self.stdout.write(f'Restoring SQLite database from {backup_file}...')
@@ -83,14 +117,17 @@ class Command(BaseCommand):
                 # Create a backup of the current database before overwriting
                 if os.path.exists(db_path):
                     temp_backup = f'{db_path}.bak'
-                    shutil.copy2(db_path, temp_backup)
+                    sqlite_backup.backup(db_path, temp_backup)
                     self.stdout.write(f'Created temporary backup at {temp_backup}')
                 
-                # Copy the backup database over the current one
-                shutil.copy2(backup_file, db_path)
+                # Copy the backup database into the current one
+                progress = None
+                if options['verbosity'] > 1:
+                    progress = lambda copied, total: self.stdout.write(f'  {copied}/{total} pages')
+                sqlite_backup.restore(backup_file, db_path, progress=progress)
                 self.stdout.write(self.style.SUCCESS('SQLite database restored successfully.'))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error restoring database: {str(e)}'))
         
         else:
-            raise CommandError(f"Unsupported backup file format. Please use .json or .sqlite3 files.")
\ No newline at end of file
+            raise CommandError(f"Unsupported backup file format. Please use .json, .jsonl.gz, .jsonl.zst or .sqlite3 files.")
\ No newline at end of file
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+
+from teammanager import sqlite_backup
+
+
+class Command(BaseCommand):
+    help = 'Copy a SQLite database consistently while it is in use (online backup API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Database to back up, or the backup to restore with --restore')
+        parser.add_argument('target', help='Backup file to write, or the database to restore into with --restore')
+        parser.add_argument(
+            '--restore', action='store_true',
+            help='Check the source and write it into the target database in place'
+        )
+        parser.add_argument(
+            '--vacuum', action='store_true',
+            help='Take the backup with VACUUM INTO, which also compacts it'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=sqlite_backup.PAGES,
+            help=f'Pages copied per step (default: {sqlite_backup.PAGES}; -1 copies everything in one step)'
+        )
+
+    def handle(self, *args, **options):
+        source, target = options['source'], options['target']
+        progress = None
+        if options['verbosity'] > 1:
+            progress = lambda copied, total: self.stdout.write(f"  {copied}/{total} pages")
+
+        try:
+            if options['restore']:
+                size = sqlite_backup.restore(source, target, pages=options['pages'], progress=progress)
+                self.stdout.write(self.style.SUCCESS(f"Restored {source} into {target} ({size} bytes)"))
+            else:
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                size = sqlite_backup.backup(
+                    source, target, pages=options['pages'], progress=progress, vacuum=options['vacuum']
+                )
+                self.stdout.write(self.style.SUCCESS(f"Backed up {source} to {target} ({size} bytes)"))
+        except (sqlite_backup.SQLiteBackupError, sqlite3.Error, OSError) as e:
+            raise CommandError(str(e))
@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from teammanager import backup_stream
+
+
+class Command(BaseCommand):
+    help = 'Create or inspect compressed JSON Lines backups (.jsonl.gz / .jsonl.zst)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'backup_file', nargs='?',
+            help='Backup to create (default: backup/backup_<timestamp>.jsonl.gz), or to inspect with --info/--verify'
+        )
+        parser.add_argument(
+            '--compression', choices=sorted(backup_stream.EXTENSIONS), default='gzip',
+            help='Compression for the default file name (default: gzip)'
+        )
+        parser.add_argument('--info', action='store_true', help='Print the manifest of an existing backup')
+        parser.add_argument('--verify', action='store_true', help='Also check the checksum of the whole file')
+
+    def handle(self, *args, **options):
+        path = options['backup_file']
+        try:
+            if options['info'] or options['verify']:
+                if not path:
+                    raise CommandError('Give the backup file to inspect')
+                if options['verify']:
+                    manifest = backup_stream.verify_backup(path)
+                else:
+                    manifest = backup_stream.validate_backup(path)
+                self._print_manifest(path, manifest)
+                return
+
+            if not path:
+                extension = backup_stream.EXTENSIONS[options['compression']]
+                path = os.path.join('backup', f"backup_{timezone.now().strftime('%Y%m%d_%H%M%S')}{extension}")
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            manifest = backup_stream.write_backup(path)
+        except backup_stream.BackupFormatError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backed up {manifest['total']} objects to {path} ({os.path.getsize(path)} bytes)"
+        ))
+
+    def _print_manifest(self, path, manifest):
+        self.stdout.write(f"{path}: {manifest['total']} objects, created {manifest['created_at']}")
+        for label, count in manifest['models'].items():
+            if count:
+                self.stdout.write(f"  {label}: {count}")
+        self.stdout.write(self.style.SUCCESS('Backup is complete'))
@@ -0,0 +1,308 @@
+"""
+Bulk import of historical matches and player appearances.
+
+The file has one row per player per match (CSV or .xlsx, read in chunks like
+the player import). Match columns are repeated on every row of that match:
+
+    date, team, opponent, [location_type, location, match_type,
+    smoras_score, opponent_score]
+
+and each row names a player (``player`` as "First Last", or ``first_name``
+and ``last_name``) with optional ``minutes_played``, ``goals``, ``assists``,
+``yellow_cards`` and ``red_card``.
+
+Teams and players are matched by name through in-memory indexes built once
+per import. Matches are looked up by (team, opponent, date) and created in
+bulk when missing; appearances are inserted with
+``bulk_create(ignore_conflicts=True)`` so existing player/match pairs are
+left untouched. The returned report reconciles what was read against what
+was written, including matches where the players' goals don't add up to the
+recorded score.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+import pandas as pd
+
+from .incremental_backup import record_objects, record_queryset
+from .models import Team, Player, Match, MatchAppearance
+from .player_import import (
+    CHUNK_SIZE, REPORT_LIST_LIMIT, TRUE_VALUES, WRITE_BATCH_SIZE, SpreadsheetError,
+    iter_spreadsheet_chunks
+)
+
+REQUIRED_COLUMNS = ['date', 'team', 'opponent']
+MATCH_COLUMNS = ['location_type', 'location', 'match_type', 'smoras_score', 'opponent_score']
+COUNT_COLUMNS = ['goals', 'assists', 'yellow_cards']
+
+LOCATION_TYPES = {value.lower(): value for value, _ in Match.LOCATION_CHOICES}
+MATCH_TYPES = {value.lower(): value for value, _ in Match.MATCH_TYPE_CHOICES}
+
+
+def missing_columns(columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if 'player' not in columns and 'first_name' not in columns:
+        missing.append('player')
+    return missing
+
+
+def _name(value):
+    return ' '.join(str(value).split()).lower()
+
+
+class NameIndex:
+    """Case-insensitive name -> id lookup that remembers ambiguous names"""
+
+    def __init__(self, pairs):
+        self.ids = {}
+        self.names = {}
+        self.ambiguous = set()
+        for name, pk in pairs:
+            self.names[pk] = name
+            key = _name(name)
+            if key in self.ids and self.ids[key] != pk:
+                self.ambiguous.add(key)
+            self.ids.setdefault(key, pk)
+
+    def get(self, name):
+        key = _name(name)
+        if key in self.ambiguous:
+            return None
+        return self.ids.get(key)
+
+
+def build_team_index():
+    return NameIndex(Team.objects.values_list('name', 'id'))
+
+
+def build_player_index():
+    pairs = []
+    for first_name, last_name, pk in Player.objects.values_list('first_name', 'last_name', 'id'):
+        pairs.append((f"{first_name} {last_name or ''}", pk))
+    return NameIndex(pairs)
+
+
+def _text(series):
+    series = series.astype('string').str.strip()
+    return series.mask(series == '')
+
+
+def normalise_match_frame(df, first_row=2):
+    """Normalise one chunk of rows; returns a list of (row_number, data) pairs"""
+    df = df.copy()
+    df.index = range(first_row, first_row + len(df))
+    out = pd.DataFrame(index=df.index)
+
+    if 'player' in df.columns:
+        out['player'] = _text(df['player'])
+    else:
+        last_names = _text(df['last_name']).fillna('') if 'last_name' in df.columns else ''
+        out['player'] = (_text(df['first_name']) + ' ' + last_names).str.strip()
+    out['team'] = _text(df['team'])
+    out['opponent'] = _text(df['opponent'])
+
+    dates = pd.to_datetime(df['date'], errors='coerce', format='mixed')
+    out['date'] = pd.Series(
+        [date.to_pydatetime() if pd.notna(date) else None for date in dates], index=df.index, dtype=object
+    )
+
+    out['location'] = _text(df['location']) if 'location' in df.columns else None
+    for column, choices, default in (('location_type', LOCATION_TYPES, 'Home'),
+                                     ('match_type', MATCH_TYPES, 'Friendly')):
+        if column in df.columns:
+            out[column] = _text(df[column]).str.lower().map(choices).fillna(default)
+        else:
+            out[column] = default
+
+    for column in ('smoras_score', 'opponent_score', 'minutes_played'):
+        if column in df.columns:
+            numbers = pd.to_numeric(df[column], errors='coerce')
+            out[column] = numbers.astype('Int64').astype(object).where(numbers.notna(), None)
+        else:
+            out[column] = None
+    for column in COUNT_COLUMNS:
+        if column in df.columns:
+            out[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).clip(lower=0).astype(int)
+        else:
+            out[column] = 0
+
+    if 'red_card' in df.columns:
+        raw = df['red_card']
+        numbers = pd.to_numeric(raw, errors='coerce')
+        out['red_card'] = raw.astype('string').str.strip().str.lower().isin(TRUE_VALUES) | (numbers.fillna(0) != 0)
+    else:
+        out['red_card'] = False
+
+    # Drop rows that are completely empty (trailing rows in exported sheets)
+    out = out[df.notna().any(axis=1)]
+    out = out.astype(object).where(out.notna(), None)
+    return list(zip(out.index, out.to_dict('records')))
+
+
+def new_report(dry_run=False):
+    return {
+        'dry_run': dry_run,
+        'rows': 0,
+        'chunks': 0,
+        'matches_created': 0,
+        'matches_existing': 0,
+        'appearances_created': 0,
+        'appearances_duplicate': 0,
+        'errors': [],
+        'error_count': 0,
+        'unknown_players': [],
+        'unknown_teams': [],
+        'score_mismatches': [],
+    }
+
+
+def _note(report, key, value):
+    if len(report[key]) < REPORT_LIST_LIMIT and value not in report[key]:
+        report[key].append(value)
+
+
+def _row_error(report, row_number, message):
+    _note(report, 'errors', {'row': row_number, 'message': message})
+    report['error_count'] += 1
+
+
+class MatchHistoryImporter:
+    """Imports chunks of rows, keeping the name and match indexes between chunks"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.report = new_report(dry_run)
+        self.teams = build_team_index()
+        self.players = build_player_index()
+        # Everything below is keyed by (team_id, opponent, date), which also
+        # works for matches that are not saved yet (or never, in a dry run)
+        self.matches = {}
+        self.appearances = set()
+        self.goals = defaultdict(int)
+
+    def _load_existing_matches(self, keys):
+        """Fetch existing matches for the team/date pairs of a chunk in one query"""
+        team_ids = {team_id for team_id, _, _ in keys}
+        dates = {date for _, _, date in keys}
+        keys_by_id = {}
+        for match in Match.objects.filter(smoras_team_id__in=team_ids, date__in=dates):
+            key = (match.smoras_team_id, _name(match.opponent_name), match.date)
+            if key in keys and key not in self.matches:
+                self.matches[key] = match
+                keys_by_id[match.pk] = key
+        self.report['matches_existing'] += len(keys_by_id)
+        if not keys_by_id:
+            return
+
+        # Remember who already played in these matches and the goals they scored
+        existing = MatchAppearance.objects.filter(match_id__in=keys_by_id)
+        for player_id, match_id, goals in existing.values_list('player_id', 'match_id', 'goals'):
+            self.appearances.add((player_id, keys_by_id[match_id]))
+            self.goals[keys_by_id[match_id]] += goals
+
+    def import_rows(self, rows):
+        report = self.report
+        resolved = []
+        for row_number, data in rows:
+            report['rows'] += 1
+            if data['date'] is None:
+                _row_error(report, row_number, "date: missing or not a valid date")
+                continue
+            if not data['team'] or not data['opponent'] or not data['player']:
+                _row_error(report, row_number, "team, opponent and player are required")
+                continue
+            team_id = self.teams.get(data['team'])
+            if team_id is None:
+                _note(report, 'unknown_teams', data['team'])
+                _row_error(report, row_number, f"team: unknown or ambiguous team '{data['team']}'")
+                continue
+            player_id = self.players.get(data['player'])
+            if player_id is None:
+                _note(report, 'unknown_players', data['player'])
+                _row_error(report, row_number, f"player: unknown or ambiguous player '{data['player']}'")
+                continue
+            date = data['date']
+            if timezone.is_naive(date):
+                date = timezone.make_aware(date)
+            resolved.append((team_id, player_id, (team_id, _name(data['opponent']), date), data))
+
+        missing = {key for _, _, key, _ in resolved if key not in self.matches}
+        if missing:
+            self._load_existing_matches(missing)
+
+        new_matches = []
+        appearances = []
+        for team_id, player_id, key, data in resolved:
+            match = self.matches.get(key)
+            if match is None:
+                match = Match(
+                    smoras_team_id=team_id,
+                    opponent_name=data['opponent'],
+                    date=key[2],
+                    **{column: data[column] for column in MATCH_COLUMNS},
+                )
+                self.matches[key] = match
+                new_matches.append(match)
+
+            if (player_id, key) in self.appearances:
+                report['appearances_duplicate'] += 1
+                continue
+            self.appearances.add((player_id, key))
+            self.goals[key] += data['goals']
+            appearances.append(MatchAppearance(
+                player_id=player_id,
+                match=match,
+                team_id=team_id,
+                minutes_played=data['minutes_played'],
+                goals=data['goals'],
+                assists=data['assists'],
+                yellow_cards=data['yellow_cards'],
+                red_card=data['red_card'],
+            ))
+        report['matches_created'] += len(new_matches)
+        report['appearances_created'] += len(appearances)
+
+        if not self.dry_run:
+            with transaction.atomic():
+                record_objects(Match.objects.bulk_create(new_matches, batch_size=WRITE_BATCH_SIZE))
+                # ignore_conflicts keeps the player/match unique constraint safe
+                # against appearances added by someone else during the import
+                MatchAppearance.objects.bulk_create(
+                    appearances, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True
+                )
+                # Ignored rows come back without ids, so log what is in the database
+                if appearances:
+                    record_queryset(MatchAppearance.objects.filter(
+                        match_id__in={appearance.match_id for appearance in appearances},
+                        player_id__in={appearance.player_id for appearance in appearances},
+                    ))
+
+    def reconcile(self):
+        """Flag matches where the players' goals don't add up to the recorded score"""
+        for key, match in self.matches.items():
+            if match.smoras_score is not None and self.goals[key] != match.smoras_score:
+                team_name = self.teams.names[match.smoras_team_id]
+                _note(self.report, 'score_mismatches', {
+                    'match': f"{team_name} vs {match.opponent_name} ({match.date.strftime('%Y-%m-%d')})",
+                    'score': match.smoras_score,
+                    'goals': self.goals[key],
+                })
+        return self.report
+
+
+def import_match_history(upload, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Import historical matches and appearances from an uploaded .xlsx or .csv
+    file. Raises SpreadsheetError for unsupported files or missing columns.
+    """
+    importer = MatchHistoryImporter(dry_run=dry_run)
+    first_row = 2
+    for chunk in iter_spreadsheet_chunks(upload, chunk_size):
+        missing = missing_columns(chunk.columns)
+        if missing:
+            raise SpreadsheetError(f"Required column '{missing[0]}' not found in the file.")
+        importer.import_rows(normalise_match_frame(chunk, first_row=first_row))
+        importer.report['chunks'] += 1
+        first_row += len(chunk)
+    return importer.reconcile()
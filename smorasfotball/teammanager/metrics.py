@@ -0,0 +1,369 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Every process (each gunicorn worker, and management commands that take
+backups) counts into its own ``Store`` in memory, and writes it to its own
+file in ``METRICS_DIR`` at most every ``FLUSH_SECONDS``. The metrics view
+(``views_metrics``) merges the files of all processes, so it reports the
+whole site whichever worker serves the scrape. A process's file is named
+by its pid and start time, so a new process that is given an old pid
+doesn't overwrite (and lower) the old one's counters. When the metrics are
+collected, the files of processes that have exited are added into
+``exited.json`` and removed, so their counters remain part of the totals
+without the directory growing with every restart. Whether a process has
+exited is checked by pid, so ``METRICS_DIR`` must not be shared between
+hosts.
+
+Recorded:
+
+    http_requests_total             requests by view, method and status
+    http_request_duration_seconds   latency histogram by view
+    db_queries_total                queries run by requests, by view
+    db_time_seconds_total           time requests spent in the database, by view
+    cache_requests_total            lookups of the layout and image caches, by result
+    backup_duration_seconds         histogram of backup writes, by operation: 'stream',
+                                    'sqlite', 'base' or 'incremental' (backup chains), and
+                                    'fanout' (a backup written once and copied to every
+                                    backup directory, which includes writing it)
+
+The cache hit ratios and the number of active match sessions are worked out
+when the metrics are rendered.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PREFIX = 'smoras_'
+
+# A process writes its metrics to disk at most this often (and when the metrics are rendered)
+FLUSH_SECONDS = 5
+
+# The counters of exited processes are merged into this file
+EXITED_FILE = 'exited.json'
+# '<pid>-<start time>.json'; files named by the pid alone are from before start times were added
+PROCESS_FILE = re.compile(r'^(\d+)(?:-(\d+))?\.json$')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BACKUP_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by view, method and status code', None),
+    'http_request_duration_seconds': ('histogram', 'Time to respond to a request, by view', LATENCY_BUCKETS),
+    'db_queries_total': ('counter', 'Database queries run by requests, by view', None),
+    'db_time_seconds_total': ('counter', 'Time requests spent in the database, by view', None),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+    'backup_duration_seconds': ('histogram', 'Time to write a backup, by operation', BACKUP_BUCKETS),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Store:
+    """One process's counters and histograms, keyed by metric name and labels"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.values = {}
+        self.flushed_at = time.monotonic()
+        self.started = time.time_ns()
+
+    @property
+    def filename(self):
+        return f'{self.name}.json' if self.name else f'{os.getpid()}-{self.started}.json'
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self._flush_if_due()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                # Observations per bucket, the last one for values above every bound, then the sum
+                histogram = self.values[key] = [0] * (len(buckets) + 1) + [0.0]
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram[index] += 1
+            histogram[-1] += value
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        if time.monotonic() - self.flushed_at >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Write this process's metrics to its file in METRICS_DIR"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        self.flushed_at = time.monotonic()
+        if not directory:
+            return
+        with self.lock:
+            rows = [[name, dict(labels), value] for (name, labels), value in self.values.items()]
+        path = os.path.join(directory, self.filename)
+        temporary = f'{path}.tmp'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temporary, 'w') as f:
+                json.dump(rows, f)
+            os.replace(temporary, path)
+        except OSError:
+            pass  # Metrics must never break a request
+
+
+_store = Store()
+# A forked worker starts counting from zero, under its own pid
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_store.reset)
+
+
+def inc(name, amount=1, **labels):
+    _store.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    _store.observe(name, value, **labels)
+
+
+def flush():
+    _store.flush()
+
+
+def count_cache(cache, hits=0, misses=0):
+    """Record lookups of one of the site's caches"""
+    if hits:
+        inc('cache_requests_total', hits, cache=cache, result='hit')
+    if misses:
+        inc('cache_requests_total', misses, cache=cache, result='miss')
+
+
+@contextmanager
+def time_backup(operation):
+    """Time the block as a backup write; written out straight away, as backups often run in commands"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('backup_duration_seconds', time.perf_counter() - started, operation=operation)
+        flush()
+
+
+def _running(pid):
+    if os.name == 'nt':
+        return True  # os.kill() would end the process
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # It exists but belongs to another user
+    return True
+
+
+def _exited(filenames):
+    """The process files among ``filenames`` whose processes have exited"""
+    processes = {}
+    for filename in filenames:
+        match = PROCESS_FILE.match(filename)
+        if match:
+            processes[filename] = (int(match.group(1)), int(match.group(2) or 0))
+    latest = {}
+    for pid, started in processes.values():
+        latest[pid] = max(latest.get(pid, started), started)
+    # An older file for a pid is from a process that exited before the pid was reused
+    return [
+        filename for filename, (pid, started) in processes.items()
+        if started < latest[pid] or not _running(pid)
+    ]
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _fold_exited(directory):
+    """
+    Add the counters of exited processes into EXITED_FILE and remove their files.
+
+    EXITED_FILE keeps the names of the files it last took in, and those are
+    removed first next time, so a file that outlives a crash between writing
+    EXITED_FILE and removing it isn't counted twice.
+    """
+    exited_path = os.path.join(directory, EXITED_FILE)
+    exited = _read(exited_path) or {'rows': [], 'folded': []}
+    for filename in exited['folded']:
+        try:
+            os.remove(os.path.join(directory, filename))
+        except FileNotFoundError:
+            pass
+
+    rows = list(exited['rows'])
+    folded = []
+    for filename in _exited(name for name in os.listdir(directory) if name not in exited['folded']):
+        process_rows = _read(os.path.join(directory, filename))
+        if process_rows is not None:
+            rows.extend(process_rows)
+            folded.append(filename)
+    if not folded:
+        return
+    rows = [[name, dict(labels), value] for (name, labels), value in _merge(rows).items()]
+    temporary = f'{exited_path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'rows': rows, 'folded': folded}, f)
+    os.replace(temporary, exited_path)
+    for filename in folded:
+        os.remove(os.path.join(directory, filename))
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Hold the metrics directory's lock; yields False where files can't be locked"""
+    try:
+        import fcntl
+    except ImportError:
+        yield False
+        return
+    with open(os.path.join(directory, 'exited.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield True
+
+
+def _read_directory(directory):
+    rows = []
+    # Under the lock, so a scrape can't read a file and also the EXITED_FILE it was just folded into
+    with _directory_lock(directory) as locked:
+        if locked:
+            _fold_exited(directory)
+        for filename in os.listdir(directory):
+            if filename == EXITED_FILE:
+                rows.extend((_read(os.path.join(directory, filename)) or {'rows': []})['rows'])
+            elif filename.endswith('.json'):
+                rows.extend(_read(os.path.join(directory, filename)) or [])
+    return rows
+
+
+def _merge(rows):
+    merged = {}
+    for name, labels, value in rows:
+        if name not in METRICS:
+            continue
+        key = _key(name, labels)
+        if key not in merged:
+            merged[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            merged[key] = [a + b for a, b in zip(merged[key], value)]
+        else:
+            merged[key] += value
+    return merged
+
+
+def collect():
+    """The merged metrics of every process: {(name, labels): value}"""
+    flush()
+    directory = getattr(settings, 'METRICS_DIR', None)
+    rows = None
+    if directory and os.path.isdir(directory):
+        try:
+            rows = _read_directory(directory)
+        except OSError:
+            rows = None  # Fall back to this process's own metrics
+    if rows is None:
+        rows = [[name, dict(labels), value] for (name, labels), value in _store.values.items()]
+    return _merge(rows)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(gauges=None):
+    """The merged metrics as Prometheus text; ``gauges`` adds {name: (help, value)}"""
+    merged = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{PREFIX}{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{PREFIX}{name}_count{_labels(labels)} {cumulative}')
+
+    # Hit ratio of each cache since the processes started
+    lookups = {}
+    for (metric, labels), value in merged.items():
+        if metric == 'cache_requests_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    if lookups:
+        lines.append(f'# HELP {PREFIX}cache_hit_ratio Share of cache lookups that were hits')
+        lines.append(f'# TYPE {PREFIX}cache_hit_ratio gauge')
+        for cache, (hits, total) in sorted(lookups.items()):
+            lines.append(f'{PREFIX}cache_hit_ratio{_labels([("cache", cache)])} {_number(hits / total)}')
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{name} gauge')
+        lines.append(f'{PREFIX}{name} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Record each request's status, latency and database time under its URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved URLs share one label, so random paths can't grow the metrics
+        view = match.view_name if match else 'unresolved'
+        inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        observe('http_request_duration_seconds', elapsed, view=view)
+        queries = getattr(request, 'queries', None)
+        if queries is not None:
+            inc('db_queries_total', queries.count, view=view)
+            inc('db_time_seconds_total', queries.seconds, view=view)
+        return response
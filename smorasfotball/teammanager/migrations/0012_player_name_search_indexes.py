@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def create_pattern_ops_indexes(apps, schema_editor):
+    """On PostgreSQL, LIKE 'prefix%' only uses an index built with pattern ops"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS player_first_name_prefix_idx '
+        'ON teammanager_player (lower(first_name) text_pattern_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS player_last_name_prefix_idx '
+        'ON teammanager_player (lower(last_name) text_pattern_ops)'
+    )
+
+
+def drop_pattern_ops_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS player_first_name_prefix_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS player_last_name_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teammanager', '0011_highlightreel_videoclip_highlightclipassociation_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), models.F('id'), name='player_first_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(django.db.models.functions.text.Lower('last_name'), name='player_last_name_lower_idx'),
+        ),
+        migrations.RunPython(create_pattern_ops_indexes, drop_pattern_ops_indexes),
+    ]
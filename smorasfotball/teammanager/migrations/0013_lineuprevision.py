@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teammanager', '0012_player_name_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LineupRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text='Sequential revision number within the lineup')),
+                ('is_snapshot', models.BooleanField(default=False, help_text='Full state instead of a diff')),
+                ('data', models.JSONField(help_text='Compact diff or snapshot of the player positions')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lineup_revisions', to=settings.AUTH_USER_MODEL)),
+                ('lineup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='teammanager.lineup')),
+            ],
+            options={
+                'ordering': ['lineup', '-number'],
+                'unique_together': {('lineup', 'number')},
+            },
+        ),
+    ]
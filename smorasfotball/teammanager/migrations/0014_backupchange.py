@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teammanager', '0013_lineuprevision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Model label, e.g. teammanager.player', max_length=100)),
+                ('object_pk', models.CharField(max_length=64)),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:42
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teammanager', '0014_backupchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lineup',
+            index=models.Index(condition=models.Q(('is_template', True)), fields=['team', '-created_at'], name='lineup_team_template_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lineup',
+            index=models.Index(condition=models.Q(('is_template', False)), fields=['team', '-created_at'], name='lineup_team_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lineup',
+            index=models.Index(condition=models.Q(('is_template', False)), fields=['match', '-created_at'], name='lineup_match_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['-date'], name='match_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['smoras_team', '-date'], name='match_team_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matchappearance',
+            index=models.Index(fields=['match', 'team'], name='appearance_match_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), models.F('id'), condition=models.Q(('active', True)), name='player_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playersubstitution',
+            index=models.Index(fields=['match_session', 'minute'], name='substitution_session_min_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playingtime',
+            index=models.Index(condition=models.Q(('is_on_pitch', True)), fields=['match_session'], name='playingtime_on_pitch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playingtime',
+            index=models.Index(condition=models.Q(('is_on_pitch', False)), fields=['match_session'], name='playingtime_on_bench_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['status'], name='userprofile_pending_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.urls import reverse
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
@@ -24,6 +26,12 @@ class UserProfile(models.Model):
     player = models.ForeignKey('Player', on_delete=models.SET_NULL, null=True, blank=True, related_name='user_profile')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Only pending profiles are ever looked up by status (admin approval queue)
+            models.Index(fields=['status'], condition=Q(status='pending'), name='userprofile_pending_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.username} ({self.get_role_display()})"
     
@@ -60,6 +68,22 @@ def save_user_profile(sender, instance, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_roles(sender, instance, **kwargs):
+    """Drop the cached roles whenever a profile changes"""
+    from .roles import invalidate_roles
+    invalidate_roles(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_roles(sender, instance, **kwargs):
+    """Drop the cached roles whenever a user changes (the superuser flag is part of them)"""
+    from .roles import invalidate_roles
+    invalidate_roles(instance.pk)
+
+
 class Team(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
@@ -82,6 +106,15 @@ class Player(models.Model):
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Support case-insensitive prefix search on names (player picker API)
+            models.Index(Lower('first_name'), 'id', name='player_first_name_lower_idx'),
+            models.Index(Lower('last_name'), name='player_last_name_lower_idx'),
+            # The player picker and player matrix only list active players
+            models.Index(Lower('first_name'), 'id', condition=Q(active=True), name='player_active_name_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}" if self.last_name else self.first_name
 
@@ -126,6 +159,14 @@ class Match(models.Model):
     players = models.ManyToManyField(Player, through='MatchAppearance', related_name='matches')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Recent matches on the dashboard and date filters
+            models.Index(fields=['-date'], name='match_date_idx'),
+            # A team's matches, newest first
+            models.Index(fields=['smoras_team', '-date'], name='match_team_date_idx'),
+        ]
+
     def __str__(self):
         if self.location_type == 'Home':
             return f"{self.smoras_team} vs {self.opponent_name} ({self.date.strftime('%Y-%m-%d')})"
@@ -190,6 +231,10 @@ class MatchAppearance(models.Model):
     
     class Meta:
         unique_together = ('player', 'match')
+        indexes = [
+            # A match's appearances for one side (match detail, saving a squad)
+            models.Index(fields=['match', 'team'], name='appearance_match_team_idx'),
+        ]
 
     def __str__(self):
         return f"{self.player} in {self.match}"
@@ -225,6 +270,19 @@ class FormationTemplate(models.Model):
         except (ValueError, AttributeError):
             return False
 
+    def get_layout_table(self):
+        """Cached pitch coordinates for this formation (see formation_layouts)"""
+        from .formation_layouts import get_layout_table
+        return get_layout_table(self)
+
+
+@receiver(post_save, sender=FormationTemplate)
+@receiver(post_delete, sender=FormationTemplate)
+def invalidate_formation_layout(sender, instance, **kwargs):
+    """Drop the cached coordinate table whenever a formation changes"""
+    from .formation_layouts import invalidate_layout
+    invalidate_layout(instance.pk)
+
 
 class LineupPosition(models.Model):
     """
@@ -266,6 +324,15 @@ class Lineup(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Lineup list: templates or match lineups of one team, newest first
+            models.Index(fields=['team', '-created_at'], condition=Q(is_template=True), name='lineup_team_template_idx'),
+            models.Index(fields=['team', '-created_at'], condition=Q(is_template=False), name='lineup_team_match_idx'),
+            # A match's latest lineup when a match session starts
+            models.Index(fields=['match', '-created_at'], condition=Q(is_template=False), name='lineup_match_created_idx'),
+        ]
+    
     def __str__(self):
         match_str = f" - {self.match}" if self.match else ""
         return f"{self.name}{match_str}"
@@ -284,21 +351,88 @@ class Lineup(models.Model):
             created_by=self.created_by
         )
         
-        # Copy player positions
-        for position in self.player_positions.all():
-            LineupPlayerPosition.objects.create(
-                lineup=new_lineup,
-                player=position.player,
-                position=position.position,
-                x_coordinate=position.x_coordinate,
-                y_coordinate=position.y_coordinate,
-                jersey_number=position.jersey_number,
-                is_starter=position.is_starter,
-                notes=position.notes
-            )
-        
+        # Copy player positions in a single INSERT
+        from .incremental_backup import record_objects
+        record_objects(LineupPlayerPosition.objects.bulk_create([
+            position.copy_to(new_lineup) for position in self.player_positions.all()
+        ]))
+
         return new_lineup
 
+    def duplicate_to_matches(self, matches, skip_inactive_players=False, skip_existing=False,
+                             created_by=None, batch_size=500):
+        """
+        Copy this lineup onto many matches at once.
+
+        One lineup is created per match and all player positions are written
+        with bulk_create in batches of ``batch_size``, so preparing a whole
+        season from a template costs a handful of queries instead of one
+        INSERT per player per match.
+
+        Returns a summary dict with the created lineups and what was skipped.
+        """
+        from django.db import transaction
+        from .incremental_backup import record_objects
+
+        matches = list(matches)
+        source_positions = list(self.player_positions.select_related('player'))
+
+        skipped_players = []
+        if skip_inactive_players:
+            skipped_players = [pos.player for pos in source_positions if not pos.player.active]
+            source_positions = [pos for pos in source_positions if pos.player.active]
+
+        skipped_matches = []
+        if skip_existing and matches:
+            # One query for every match that already has a lineup for this team
+            existing_match_ids = set(
+                Lineup.objects.filter(team=self.team, match__in=matches)
+                .values_list('match_id', flat=True)
+            )
+            skipped_matches = [match for match in matches if match.id in existing_match_ids]
+            matches = [match for match in matches if match.id not in existing_match_ids]
+
+        with transaction.atomic():
+            new_lineups = Lineup.objects.bulk_create([
+                Lineup(
+                    name=f"{self.name} - {match.opponent_name} ({match.date.strftime('%Y-%m-%d')})",
+                    match=match,
+                    team=self.team,
+                    formation=self.formation,
+                    is_template=False,
+                    notes=self.notes,
+                    direction=self.direction,
+                    created_by=created_by or self.created_by,
+                )
+                for match in matches
+            ], batch_size=batch_size)
+
+            # Backends that cannot return ids from bulk inserts need a lookup
+            if new_lineups and new_lineups[0].pk is None:
+                lookup = {
+                    lineup.match_id: lineup
+                    for lineup in Lineup.objects.filter(team=self.team, match__in=matches)
+                    .order_by('match_id', 'created_at')
+                }
+                new_lineups = [lookup[match.id] for match in matches]
+
+            new_positions = [
+                position.copy_to(lineup)
+                for lineup in new_lineups
+                for position in source_positions
+            ]
+            LineupPlayerPosition.objects.bulk_create(new_positions, batch_size=batch_size)
+            record_objects(new_lineups)
+            record_objects(new_positions)
+
+        return {
+            'lineups': new_lineups,
+            'lineups_created': len(new_lineups),
+            'positions_created': len(new_positions),
+            'skipped_players': skipped_players,
+            'skipped_matches': skipped_matches,
+        }
+
 
 class LineupPlayerPosition(models.Model):
     """
@@ -320,6 +454,45 @@ class LineupPlayerPosition(models.Model):
         position_str = f" ({self.position})" if self.position else ""
         return f"{self.player}{position_str} in {self.lineup}"
 
+    def copy_to(self, lineup):
+        """Return an unsaved copy of this position attached to another lineup"""
+        return LineupPlayerPosition(
+            lineup=lineup,
+            player_id=self.player_id,
+            position_id=self.position_id,
+            x_coordinate=self.x_coordinate,
+            y_coordinate=self.y_coordinate,
+            jersey_number=self.jersey_number,
+            is_starter=self.is_starter,
+            notes=self.notes
+        )
+
+
+class LineupRevision(models.Model):
+    """
+    Compact history of a lineup's player positions.
+
+    Most revisions only store what changed since the previous one (see
+    lineup_revisions.py for the format); every SNAPSHOT_INTERVAL revisions a
+    full snapshot is stored so reconstructing any revision only has to replay
+    a short chain of diffs.
+    """
+    lineup = models.ForeignKey(Lineup, related_name='revisions', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField(help_text="Sequential revision number within the lineup")
+    is_snapshot = models.BooleanField(default=False, help_text="Full state instead of a diff")
+    data = models.JSONField(help_text="Compact diff or snapshot of the player positions")
+    created_by = models.ForeignKey(User, related_name='lineup_revisions', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('lineup', 'number')
+        ordering = ['lineup', '-number']
+    
+    def __str__(self):
+        kind = "snapshot" if self.is_snapshot else "diff"
+        return f"{self.lineup} r{self.number} ({kind})"
+
 
 class MatchSession(models.Model):
     """
@@ -371,6 +544,12 @@ class PlayerSubstitution(models.Model):
     period = models.PositiveSmallIntegerField(default=1, help_text="Match period when substitution occurred")
     notes = models.CharField(max_length=200, blank=True, null=True)
     
+    class Meta:
+        indexes = [
+            # A session's substitutions in match order
+            models.Index(fields=['match_session', 'minute'], name='substitution_session_min_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.minute}' {self.player_in} for {self.player_out}"
 
@@ -388,11 +567,37 @@ class PlayingTime(models.Model):
     
     class Meta:
         unique_together = ('match_session', 'player')
+        indexes = [
+            # Players on the pitch and on the bench, polled during a live match. Partial
+            # indexes, since a filter on a boolean column can't use it as an index key on SQLite
+            models.Index(fields=['match_session'], condition=Q(is_on_pitch=True), name='playingtime_on_pitch_idx'),
+            models.Index(fields=['match_session'], condition=Q(is_on_pitch=False), name='playingtime_on_bench_idx'),
+        ]
     
     def __str__(self):
         status = "playing" if self.is_on_pitch else "on bench"
         return f"{self.player} - {self.minutes_played} mins ({status})"
 
 
+
+class BackupChange(models.Model):
+    """
+    Change log used by incremental backups.
+
+    One row is appended whenever a tracked object is saved or deleted (see
+    incremental_backup.py). The auto-incrementing id doubles as a sequence
+    number: an incremental backup captures every change with an id above the
+    one recorded in the previous backup's manifest, plus the ids below it that
+    the previous backup saw missing (their transactions had not committed yet).
+    """
+    model = models.CharField(max_length=100, help_text="Model label, e.g. teammanager.player")
+    object_pk = models.CharField(max_length=64)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "saved"
+        return f"#{self.pk} {self.model} {self.object_pk} {action}"
+
 # Video-related models have been moved to models_video.py
 # VideoClip, HighlightReel, and HighlightClipAssociation are now defined there
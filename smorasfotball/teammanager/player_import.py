@@ -0,0 +1,273 @@
+"""
+Bulk import of players from a spreadsheet.
+
+The sheet is normalised column by column with pandas, existing players are
+fetched in batched queries and matched on case-folded first and last name, and all
+changes are written with bulk_create/bulk_update inside one transaction.
+With ``dry_run`` the same report is produced without writing anything.
+
+Uploads are read as a stream of fixed-size chunks (openpyxl read-only mode
+for .xlsx, pandas' chunked reader for .csv) and each chunk is imported on
+its own, so memory use does not grow with the size of the file.
+"""
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from openpyxl import load_workbook
+import pandas as pd
+
+from .incremental_backup import record_objects
+from .models import Player
+
+REQUIRED_COLUMNS = ['first_name']
+OPTIONAL_COLUMNS = ['last_name', 'position', 'date_of_birth', 'email', 'phone', 'active']
+TEXT_COLUMNS = ['first_name', 'last_name', 'position', 'email', 'phone']
+TRUE_VALUES = ['yes', 'true', 'y', '1']
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.csv')
+
+# Each name is looked up in up to eight spellings; keep the query well below SQLite's variable limit
+LOOKUP_BATCH_SIZE = 100
+WRITE_BATCH_SIZE = 500
+# Rows read, normalised and written at a time by the streaming import
+CHUNK_SIZE = 1000
+# Cap the per-player lists in the report; the counts are always complete
+REPORT_LIST_LIMIT = 200
+
+
+class SpreadsheetError(ValueError):
+    """The uploaded file cannot be imported (wrong type or missing columns)"""
+
+
+def missing_columns(columns):
+    return [column for column in REQUIRED_COLUMNS if column not in columns]
+
+
+def _text_column(series):
+    """Strip text cells, turning blanks into NA; whole numbers lose their '.0'"""
+    if pd.api.types.is_float_dtype(series):
+        whole = series.dropna()
+        if (whole == whole.round()).all():
+            series = series.astype('Int64')
+    series = series.astype('string').str.strip()
+    return series.mask(series == '')
+
+
+def normalise_player_frame(df, first_row=2):
+    """
+    Normalise a sheet of players into ``(row_number, data)`` pairs.
+
+    ``data`` only holds the fields that have a value in that row. Row numbers
+    follow the spreadsheet (the header is row 1). Rows without a first name
+    are skipped, as are dates that cannot be parsed.
+    """
+    columns = [column for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if column in df.columns]
+    df = df[columns].copy()
+    df.index = range(first_row, first_row + len(df))
+
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            df[column] = _text_column(df[column])
+
+    if 'date_of_birth' in df.columns:
+        dates = pd.to_datetime(df['date_of_birth'], errors='coerce', format='mixed')
+        df['date_of_birth'] = dates.dt.date.where(dates.notna())
+
+    if 'active' in df.columns:
+        raw = df['active']
+        text = raw.astype('string').str.strip().str.lower()
+        numbers = pd.to_numeric(raw, errors='coerce')
+        active = text.isin(TRUE_VALUES) | (numbers.notna() & (numbers != 0))
+        df['active'] = active.astype(object).where(raw.notna())
+
+    df = df[df['first_name'].notna()]
+    present = df.notna()
+    # Convert pandas NA/NaT to None before handing values to the ORM
+    df = df.astype(object).where(present, None)
+
+    return [
+        (row_number, {field: value for field, value in values.items() if mask[field]})
+        for row_number, values, mask in zip(df.index, df.to_dict('records'), present.to_dict('records'))
+    ]
+
+
+def _name_key(first_name, last_name):
+    return (first_name or '').casefold(), (last_name or '').casefold()
+
+
+def _spellings(name):
+    """Common spellings of a case-folded name, for a lookup that doesn't depend on the database's case folding"""
+    return {name, name.capitalize(), name.title(), name.upper()}
+
+
+def fetch_existing_players(keys):
+    """
+    Existing players for a set of (first, last) case-folded name keys, keyed
+    the same way.
+
+    SQLite's lower() only folds ASCII letters, so the first names are matched
+    in the database by their common spellings, raw and lowered (which finds
+    "Ørjan" and "ØRJAN" for "ørjan"), and the final match is made here.
+    """
+    existing = {}
+    first_names = sorted({first for first, _ in keys})
+    for start in range(0, len(first_names), LOOKUP_BATCH_SIZE):
+        spellings = set()
+        for first_name in first_names[start:start + LOOKUP_BATCH_SIZE]:
+            spellings |= _spellings(first_name)
+        players = Player.objects.annotate(first_lower=Lower('first_name')).filter(
+            Q(first_lower__in=spellings) | Q(first_name__in=spellings)
+        )
+        for player in players.order_by('id'):
+            key = _name_key(player.first_name, player.last_name)
+            if key in keys:
+                existing.setdefault(key, player)
+    return existing
+
+
+def new_report(dry_run=False):
+    return {
+        'dry_run': dry_run,
+        'created': 0,
+        'updated': 0,
+        'creates': [],
+        'updates': [],
+        'errors': [],
+        'error_count': 0,
+        'chunks': 0,
+    }
+
+
+def _note(report, key, value):
+    if len(report[key]) < REPORT_LIST_LIMIT:
+        report[key].append(value)
+
+
+def import_player_rows(rows, dry_run=False, report=None):
+    """
+    Create or update players from normalised rows.
+
+    Players with the same first and last name (ignoring case) are updated;
+    rows without a last name always create a new player. Rows that fail
+    model validation are reported and skipped. Returns the report dict.
+    """
+    report = report if report is not None else new_report(dry_run)
+    keys = {_name_key(data['first_name'], data['last_name']) for _, data in rows if data.get('last_name')}
+    existing = fetch_existing_players(keys) if keys else {}
+
+    to_create = {}
+    to_update = {}
+    update_fields = set()
+    for row_number, data in rows:
+        # Validate the row on its own so a bad row never touches a shared instance
+        candidate = Player(**data)
+        try:
+            candidate.full_clean(
+                exclude=[field for field in OPTIONAL_COLUMNS if field not in data],
+                validate_unique=False, validate_constraints=False
+            )
+        except ValidationError as e:
+            messages = [f"{field}: {'; '.join(errors)}" for field, errors in e.message_dict.items()]
+            _note(report, 'errors', {'row': row_number, 'message': ', '.join(messages)})
+            report['error_count'] += 1
+            continue
+
+        key = _name_key(data['first_name'], data['last_name']) if data.get('last_name') else None
+        player = existing.get(key) if key else None
+        # A repeated name later in the same sheet updates the pending new player
+        pending = to_create.get(key) if key and player is None else None
+        target = player or pending or candidate
+        for field in data:
+            setattr(target, field, getattr(candidate, field))
+
+        if player is not None:
+            to_update[player.pk] = player
+            update_fields.update(data)
+        elif pending is None:
+            to_create[key or ('row', row_number)] = candidate
+            report['created'] += 1
+            _note(report, 'creates', str(candidate))
+            continue
+        report['updated'] += 1
+        _note(report, 'updates', str(target))
+
+    if not dry_run and (to_create or to_update):
+        with transaction.atomic():
+            record_objects(Player.objects.bulk_create(list(to_create.values()), batch_size=WRITE_BATCH_SIZE))
+            if to_update:
+                Player.objects.bulk_update(
+                    list(to_update.values()), sorted(update_fields), batch_size=WRITE_BATCH_SIZE
+                )
+                record_objects(to_update.values())
+    return report
+
+
+def import_players_from_frame(df, dry_run=False):
+    """Normalise a DataFrame of players and import it in one go"""
+    return import_player_rows(normalise_player_frame(df), dry_run=dry_run)
+
+
+def iter_xlsx_chunks(upload, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of ``chunk_size`` rows from the first sheet, read row by row"""
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(cell).strip() if cell is not None else '' for cell in header]
+        chunk = []
+        yielded = False
+        for row in rows:
+            chunk.append(row[:len(columns)])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+                yielded = True
+        # Always yield at least once so the header gets validated
+        if chunk or not yielded:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_csv_chunks(upload, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of ``chunk_size`` rows from a CSV file (comma or semicolon separated)"""
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    reader = pd.read_csv(text, sep=None, engine='python', dtype=str, chunksize=chunk_size)
+    with reader:
+        for chunk in reader:
+            chunk.columns = [str(column).strip() for column in chunk.columns]
+            yield chunk
+
+
+def iter_spreadsheet_chunks(upload, chunk_size=CHUNK_SIZE):
+    name = upload.name.lower()
+    if name.endswith('.xlsx'):
+        return iter_xlsx_chunks(upload, chunk_size)
+    if name.endswith('.csv'):
+        return iter_csv_chunks(upload, chunk_size)
+    raise SpreadsheetError('Please upload a valid Excel (.xlsx) or CSV (.csv) file')
+
+
+def import_players_streaming(upload, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Import players from an uploaded .xlsx or .csv file, one chunk at a time.
+
+    Each chunk is committed in its own transaction, so a later chunk sees
+    players created by earlier ones. Raises SpreadsheetError for unsupported
+    files or missing required columns.
+    """
+    report = new_report(dry_run)
+    first_row = 2
+    for chunk in iter_spreadsheet_chunks(upload, chunk_size):
+        missing = missing_columns(chunk.columns)
+        if missing:
+            raise SpreadsheetError(f"Required column '{missing[0]}' not found in the file.")
+        import_player_rows(normalise_player_frame(chunk, first_row=first_row), dry_run=dry_run, report=report)
+        report['chunks'] += 1
+        first_row += len(chunk)
+    return report
@@ -0,0 +1,101 @@
+"""
+Per-request query instrumentation.
+
+``QueryRecorder`` is installed as an execute wrapper on every database
+connection and records each query's count, time and fingerprint: the SQL
+with literals and parameter lists collapsed, so the same query with other
+arguments has the same fingerprint. A fingerprint seen more than once in a
+request is usually an N+1 loop.
+
+``QueryCountMiddleware`` records every request. Staff users get the result
+in response headers:
+
+    X-Query-Count       queries run
+    X-Query-Time-Ms     total time spent in the database
+    X-Query-Duplicates  queries that repeated an earlier fingerprint
+    X-Query-Worst       the most repeated fingerprint and its count
+
+Tests use ``record_queries`` to hold views to a query budget.
+"""
+import re
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The SQL of a query without its arguments"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PARAMETER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper that counts and times the queries it sees"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+
+    @property
+    def duplicates(self):
+        """Executions that repeated a fingerprint already seen"""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def most_repeated(self):
+        """(fingerprint, count) of the most repeated query, or None when nothing repeats"""
+        if not self.duplicates:
+            return None
+        return max(self.fingerprints.items(), key=lambda item: item[1])
+
+
+@contextmanager
+def record_queries():
+    """Record the queries run on every database connection inside the block"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryCountMiddleware:
+    """Record each request's queries; report them to staff in response headers"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            # Read by MetricsMiddleware
+            request.queries = recorder
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            # For streaming responses this covers the queries run before streaming began
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.seconds * 1000:.1f}'
+            response['X-Query-Duplicates'] = str(recorder.duplicates)
+            worst = recorder.most_repeated()
+            if worst:
+                response['X-Query-Worst'] = f'{worst[1]}x {worst[0][:200]}'
+        return response
@@ -0,0 +1,105 @@
+"""
+The signed-in user's roles, resolved once per request.
+
+``RolesMiddleware`` gives every request ``request.roles``, and the ``roles``
+context processor passes it to templates as ``roles``, along with the
+``is_admin``, ``is_coach``, ``is_player`` and ``is_approved`` flags the
+templates have always used. Views and templates read these instead of
+calling the profile's methods one by one.
+
+A user's roles are read with one query (profile and user together) and kept
+in the cache until the profile or the user is saved or deleted (see the
+receivers in models.py). Without a shared cache each worker process has its
+own copy, and another process only sees a change once its copy expires, so
+copies expire after ``CACHE_TIMEOUT``.
+"""
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+# Seconds before a cached copy expires, as a bound on how stale another worker's copy can be
+CACHE_TIMEOUT = 60
+
+
+def _cache_key(user_id):
+    return f"user_roles:{user_id}"
+
+
+class Roles:
+    """What the user may do. Every flag is False for anonymous users and unapproved profiles"""
+
+    def __init__(self, role=None, status=None, player_id=None, is_superuser=False, is_authenticated=False):
+        self.role = role
+        self.status = status
+        self.player_id = player_id
+        self.is_superuser = is_superuser
+        self.is_authenticated = is_authenticated
+        self.is_approved = status == 'approved'
+        self.is_pending = status == 'pending'
+        self.is_admin = self.is_approved and role == 'admin'
+        self.is_coach = self.is_approved and role == 'coach'
+        self.is_player = self.is_approved and role == 'player'
+        self.is_coach_or_admin = self.is_admin or self.is_coach
+
+    def __repr__(self):
+        return f"<Roles role={self.role} status={self.status}>"
+
+
+ANONYMOUS = Roles()
+
+
+def _load(user_id):
+    from .models import UserProfile
+    profile = UserProfile.objects.select_related('user').filter(user_id=user_id).first()
+    if profile is None:
+        return None
+    return {
+        'role': profile.role,
+        'status': profile.status,
+        'player_id': profile.player_id,
+        'is_superuser': profile.user.is_superuser,
+    }
+
+
+def get_roles(user):
+    """The user's Roles, from the cache or one query; kept on the user object for the rest of the request"""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        state = cache.get(key)
+        if state is None:
+            state = _load(user.pk) or {'is_superuser': user.is_superuser}
+            cache.set(key, state, CACHE_TIMEOUT)
+        roles = user._roles = Roles(is_authenticated=True, **state)
+    return roles
+
+
+def invalidate_roles(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+class RolesMiddleware:
+    """Set ``request.roles``, resolved on first use; must come after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request.user))
+        return self.get_response(request)
+
+
+def roles(request):
+    """Context processor: the user's roles, and the role flags templates use"""
+    user_roles = getattr(request, 'roles', None)
+    if user_roles is None:
+        user = getattr(request, 'user', None)
+        user_roles = get_roles(user) if user is not None else ANONYMOUS
+    return {
+        'roles': user_roles,
+        'is_admin': user_roles.is_admin,
+        'is_coach': user_roles.is_coach,
+        'is_player': user_roles.is_player,
+        'is_approved': user_roles.is_approved,
+    }
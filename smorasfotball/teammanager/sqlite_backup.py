@@ -0,0 +1,119 @@
+"""
+Online backup and restore of SQLite databases.
+
+Copying a live database file with ``cp`` or ``shutil.copy2`` can capture a
+torn copy (half of a write, or a WAL that isn't checkpointed yet). This
+module uses SQLite's online backup API instead: pages are copied
+``pages`` at a time, and between steps the source is unlocked, so readers
+(and, for a backup, writers) carry on. If the source changes during the copy
+SQLite restarts it, so the result is always a consistent snapshot.
+
+A backup is written to a temporary file next to the target and moved into
+place when complete. With ``vacuum=True`` the snapshot is taken with
+``VACUUM INTO`` instead, which also drops free pages and defragments the
+file, at the cost of a single longer read transaction.
+
+Restoring uses the same API in the other direction, writing the backup into
+the live database through SQLite's own locking, so other connections see
+either the old or the new database, never a mix. The backup is checked
+with ``PRAGMA quick_check`` first.
+"""
+import os
+import sqlite3
+
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics
+
+PAGES = 256
+# Seconds to wait between steps when the source is busy
+SLEEP = 0.01
+
+
+class SQLiteBackupError(Exception):
+    """The backup file is not a usable SQLite database"""
+
+
+def _connect(path, read_only=False):
+    if read_only:
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    return sqlite3.connect(path)
+
+
+def _progress(callback):
+    """Adapt (copied pages, total pages) callbacks to the backup API's signature"""
+    if callback is None:
+        return None
+    return lambda status, remaining, total: callback(total - remaining, total)
+
+
+def check(path):
+    """Raise SQLiteBackupError unless ``path`` is an intact SQLite database"""
+    try:
+        source = _connect(path, read_only=True)
+        try:
+            result = source.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            source.close()
+    except sqlite3.DatabaseError as e:
+        raise SQLiteBackupError(f"{path} is not a SQLite database: {e}")
+    if result != 'ok':
+        raise SQLiteBackupError(f"{path} is damaged: {result}")
+
+
+@metrics.time_backup('sqlite')
+def backup(source_path, target_path, pages=PAGES, progress=None, vacuum=False):
+    """
+    Take a consistent snapshot of the database at ``source_path`` while it is
+    in use. ``progress(copied, total)`` is called after every step. Returns
+    the size of the snapshot in bytes.
+    """
+    if not os.path.exists(source_path):
+        raise SQLiteBackupError(f"{source_path} does not exist")
+    temp_path = f'{target_path}.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    source = _connect(source_path, read_only=True)
+    try:
+        if vacuum:
+            source.execute('VACUUM INTO ?', (temp_path,))
+        else:
+            target = _connect(temp_path)
+            try:
+                source.backup(target, pages=pages, progress=_progress(progress), sleep=SLEEP)
+            finally:
+                target.close()
+        os.replace(temp_path, target_path)
+    finally:
+        source.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    from .backup_catalog import backup_kind, index_backup
+    if backup_kind(target_path):
+        # Counts and migration state are read from the snapshot itself
+        index_backup(target_path, created_at=timezone.now())
+    return os.path.getsize(target_path)
+
+
+def restore(backup_path, database_path, pages=PAGES, progress=None):
+    """
+    Replace the contents of the database at ``database_path`` with the
+    backup, in place and under SQLite's locks. Django's connections to that
+    file are closed first so they reopen on the restored database.
+    """
+    check(backup_path)
+    for conn in connections.all(initialized_only=True):
+        if conn.vendor == 'sqlite' and os.path.abspath(str(conn.settings_dict['NAME'])) == os.path.abspath(database_path):
+            conn.close()
+    source = _connect(backup_path, read_only=True)
+    try:
+        target = _connect(database_path)
+        try:
+            source.backup(target, pages=pages, progress=_progress(progress), sleep=SLEEP)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return os.path.getsize(database_path)
@@ -33,6 +33,7 @@ urlpatterns = [
     # Matches
     path('matches/', views.MatchListView.as_view(), name='match-list'),
     path('matches/add/', views.MatchCreateView.as_view(), name='match-add'),
+    path('matches/import/', views.ImportMatchesView.as_view(), name='import-matches'),
     path('matches/<int:pk>/', views.MatchDetailView.as_view(), name='match-detail'),
     path('matches/<int:pk>/edit/', views.MatchUpdateView.as_view(), name='match-edit'),
     path('matches/<int:pk>/delete/', views.MatchDeleteView.as_view(), name='match-delete'),
@@ -50,11 +51,13 @@ urlpatterns = [
     path('database/', views_db_admin.database_overview, name='database-overview'),
     path('database/diagnostic/', views_db_diagnostics.database_diagnostic_view, name='database-diagnostic'),
     path('database/inspect/', views_db_inspect.db_inspect_view, name='database-inspect'),
+    path('database/export/<str:dataset>.<str:export_format>', views_db_admin.export_data, name='data-export'),
     
     # API for charts
     path('api/player-stats/', views.player_stats, name='player-stats'),
     path('api/match-stats/', views.match_stats, name='match-stats'),
     path('api/player-matrix/', views.player_matrix, name='player-matrix'),
+    path('api/players/search/', views_lineup.player_search, name='player-search'),
     
     # Lineup Builder
     path('lineups/', views_lineup.LineupListView.as_view(), name='lineup-list'),
@@ -63,16 +66,25 @@ urlpatterns = [
     path('lineups/<int:pk>/builder/', views_lineup.LineupBuilderView.as_view(), name='lineup-builder'),
     path('lineups/<int:pk>/edit/', views_lineup.LineupUpdateView.as_view(), name='lineup-edit'),
     path('lineups/<int:pk>/duplicate/', views_lineup.duplicate_lineup, name='lineup-duplicate'),
+    path('lineups/<int:pk>/duplicate-to-matches/', views_lineup.bulk_duplicate_lineup, name='lineup-bulk-duplicate'),
     path('lineups/<int:pk>/delete/', views_lineup.LineupDeleteView.as_view(), name='lineup-delete'),
     path('lineups/<int:pk>/export-pdf/', views_lineup.export_lineup_pdf, name='lineup-export-pdf'),
+    path('lineups/<int:pk>/image.<str:image_format>', views_lineup.lineup_image, name='lineup-image'),
     
     # Lineup Player Position AJAX endpoints
     path('lineups/<int:pk>/save-positions/', views_lineup.save_lineup_positions, name='save-lineup-positions'),
     path('lineups/<int:lineup_id>/remove-player/<int:player_id>/', views_lineup.remove_player_from_lineup, name='remove-player-from-lineup'),
     
+    # Lineup revision history
+    path('lineups/<int:pk>/revisions/', views_lineup.lineup_revision_list, name='lineup-revisions'),
+    path('lineups/<int:pk>/revisions/<int:number>/diff/', views_lineup.lineup_revision_diff, name='lineup-revision-diff'),
+    path('lineups/<int:pk>/revisions/<int:number>/restore/', views_lineup.restore_lineup_revision, name='lineup-revision-restore'),
+    path('lineups/<int:pk>/undo/', views_lineup.undo_lineup_change, name='lineup-undo'),
+    
     # Formation Templates
     path('formations/', views_lineup.FormationTemplateListView.as_view(), name='formation-list'),
     path('formations/add/', views_lineup.FormationTemplateCreateView.as_view(), name='formation-add'),
+    path('formations/layouts/', views_lineup.formation_layouts, name='formation-layouts'),
     path('formations/<int:pk>/edit/', views_lineup.FormationTemplateUpdateView.as_view(), name='formation-edit'),
     path('formations/<int:pk>/delete/', views_lineup.FormationTemplateDeleteView.as_view(), name='formation-delete'),
     
@@ -8,14 +8,14 @@ from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, FormView
 from django.forms import modelformset_factory
 from django.contrib import messages
-import pandas as pd
-import datetime
 
 from .forms import (
     SignUpForm, TeamForm, PlayerForm, MatchForm, MatchScoreForm,
-    MatchAppearanceForm, PlayerSelectionForm, ExcelUploadForm
+    MatchAppearanceForm, PlayerSelectionForm, ExcelUploadForm, MatchImportForm
 )
 from .models import Team, Player, Match, MatchAppearance, UserProfile
+from . import match_import, player_import
+from .db_router import replica_reads
 
 
 class SignUpView(CreateView):
@@ -76,7 +76,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             return self.handle_no_permission()
             
         # Check if user's profile is approved
-        if hasattr(request.user, 'profile') and not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(
                 request, 
                 "Your account is pending approval. Some features may be unavailable until your account is approved."
@@ -92,32 +92,20 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context['total_matches'] = Match.objects.count()
         context['recent_matches'] = Match.objects.order_by('-date')[:5]
 
-        # Default values for unauthenticated users
-        context['is_admin'] = False
-        context['is_coach'] = False
-        context['is_player'] = False
-        context['is_approved'] = False
-        context['user_role'] = None
-        context['is_pending'] = False
-
-        # Add user role information for authenticated users with profiles
-        if hasattr(self.request.user, 'profile'):
-            context['is_admin'] = self.request.user.profile.is_admin()
-            context['is_coach'] = self.request.user.profile.is_coach()
-            context['is_player'] = self.request.user.profile.is_player()
-            context['is_approved'] = self.request.user.profile.is_approved()
-            context['user_role'] = self.request.user.profile.role
-            context['is_pending'] = self.request.user.profile.is_pending()
-
-            # For admin users, add pending approval counts
-            if self.request.user.profile.is_admin():
-                context['pending_approvals'] = UserProfile.objects.filter(status='pending').count()
-
-            # For player users, add their own match history
-            if self.request.user.profile.is_player() and self.request.user.profile.player:
-                context['player_matches'] = MatchAppearance.objects.filter(
-                    player=self.request.user.profile.player
-                ).select_related('match', 'team').order_by('-match__date')[:5]
+        # Role flags (is_admin, is_coach, ...) come from the roles context processor
+        roles = self.request.roles
+        context['user_role'] = roles.role
+        context['is_pending'] = roles.is_pending
+
+        # For admin users, add pending approval counts
+        if roles.is_admin:
+            context['pending_approvals'] = UserProfile.objects.filter(status='pending').count()
+
+        # For player users, add their own match history
+        if roles.is_player and roles.player_id:
+            context['player_matches'] = MatchAppearance.objects.filter(
+                player_id=roles.player_id
+            ).select_related('match', 'team').order_by('-match__date')[:5]
 
         return context
 
@@ -138,12 +126,7 @@ class TeamListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_create'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
+        context['can_create'] = self.request.roles.is_coach_or_admin
         return context
 
 
@@ -157,13 +140,8 @@ class TeamDetailView(LoginRequiredMixin, DetailView):
         # Get matches where this team is the Smørås team
         context['matches'] = self.object.matches.order_by('-date')
 
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_edit'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
-        context['can_delete'] = context['is_approved'] and context['is_admin']
+        context['can_edit'] = self.request.roles.is_coach_or_admin
+        context['can_delete'] = self.request.roles.is_admin
         return context
 
 
@@ -174,12 +152,12 @@ class TeamCreateView(LoginRequiredMixin, CreateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can create teams.")
             return redirect('team-list')
 
         # Only admin and coach can create teams
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to create teams.")
             return redirect('team-list')
 
@@ -193,12 +171,12 @@ class TeamUpdateView(LoginRequiredMixin, UpdateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can update teams.")
             return redirect('team-list')
 
         # Only admin and coach can update teams
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to update teams.")
             return redirect('team-list')
 
@@ -211,12 +189,12 @@ class TeamDeleteView(LoginRequiredMixin, DeleteView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has admin role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can delete teams.")
             return redirect('team-list')
 
         # Only admin can delete teams (more restrictive than create/update)
-        if not request.user.profile.is_admin():
+        if not request.roles.is_admin:
             messages.warning(request, "You don't have permission to delete teams.")
             return redirect('team-list')
 
@@ -228,18 +206,17 @@ class PlayerListView(LoginRequiredMixin, ListView):
     model = Player
     context_object_name = 'players'
 
+    def get_queryset(self):
+        # Count every player's matches in the list query instead of once per row
+        return super().get_queryset().annotate(matches_played=Count('match_appearances'))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add Excel form for admin users
         context['excel_form'] = ExcelUploadForm()
 
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_create'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
-        context['can_import'] = context['is_approved'] and context['is_admin']
+        context['can_create'] = self.request.roles.is_coach_or_admin
+        context['can_import'] = self.request.roles.is_admin
         return context
 
 
@@ -250,12 +227,12 @@ class ImportPlayersFromExcelView(LoginRequiredMixin, FormView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has admin role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can import players.")
             return redirect('player-list')
 
         # Only admin can import players from Excel
-        if not request.user.profile.is_admin():
+        if not request.roles.is_admin:
             messages.warning(request, "You don't have permission to import players from Excel.")
             return redirect('player-list')
 
@@ -263,104 +240,38 @@ class ImportPlayersFromExcelView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         excel_file = self.request.FILES['excel_file']
+        dry_run = form.cleaned_data.get('dry_run')
 
-        # Check if file is an Excel file
-        if not excel_file.name.endswith('.xlsx'):
-            messages.error(self.request, 'Please upload a valid Excel file (.xlsx)')
-            return super().form_invalid(form)
-
+        # The file is read in chunks, so large federation exports don't have to fit in memory
         try:
-            # Read Excel file
-            df = pd.read_excel(excel_file)
-
-            # Expected columns
-            required_columns = ['first_name']
-            optional_columns = ['last_name', 'position', 'date_of_birth', 'email', 'phone', 'active']
-
-            # Validate required columns
-            for col in required_columns:
-                if col not in df.columns:
-                    messages.error(self.request, f"Required column '{col}' not found in the Excel file.")
-                    return super().form_invalid(form)
-
-            # Process data and create players
-            players_created = 0
-            players_updated = 0
-            errors = 0
-
-            for _, row in df.iterrows():
-                if pd.isna(row['first_name']):
-                    continue  # Skip rows without a first name
-
-                player_data = {
-                    'first_name': row['first_name']
-                }
-
-                # Add optional fields if they exist in the file
-                for field in optional_columns:
-                    if field in df.columns and not pd.isna(row[field]):
-                        # Special handling for dates
-                        if field == 'date_of_birth' and not pd.isna(row[field]):
-                            if isinstance(row[field], datetime.datetime) or isinstance(row[field], datetime.date):
-                                player_data[field] = row[field]
-                            else:
-                                try:
-                                    # Try to parse as a date
-                                    player_data[field] = pd.to_datetime(row[field]).date()
-                                except:
-                                    # If parsing fails, skip this field
-                                    continue
-                        # Special handling for boolean values
-                        elif field == 'active':
-                            if isinstance(row[field], bool):
-                                player_data[field] = row[field]
-                            elif isinstance(row[field], str):
-                                player_data[field] = row[field].lower() in ['yes', 'true', 'y', '1']
-                            elif isinstance(row[field], (int, float)):
-                                player_data[field] = bool(row[field])
-                        else:
-                            player_data[field] = row[field]
-
-                try:
-                    # Check if player already exists (by first and last name)
-                    if 'last_name' in player_data:
-                        existing_player = Player.objects.filter(
-                            first_name__iexact=player_data['first_name'],
-                            last_name__iexact=player_data['last_name']
-                        ).first()
-                    else:
-                        existing_player = None
-
-                    if existing_player:
-                        # Update existing player
-                        for key, value in player_data.items():
-                            setattr(existing_player, key, value)
-                        existing_player.save()
-                        players_updated += 1
-                    else:
-                        # Create new player
-                        Player.objects.create(**player_data)
-                        players_created += 1
-                except Exception as e:
-                    errors += 1
-                    continue
-
-            # Display results
-            if players_created > 0:
-                messages.success(self.request, f"Successfully created {players_created} new players.")
-            if players_updated > 0:
-                messages.success(self.request, f"Successfully updated {players_updated} existing players.")
-            if errors > 0:
-                messages.warning(self.request, f"Encountered {errors} errors while processing the data.")
-
-            if players_created == 0 and players_updated == 0:
-                messages.warning(self.request, "No players were imported. Please check your Excel file format.")
-                return super().form_invalid(form)
-
+            report = player_import.import_players_streaming(excel_file, dry_run=dry_run)
+        except player_import.SpreadsheetError as e:
+            messages.error(self.request, str(e))
+            return super().form_invalid(form)
         except Exception as e:
             messages.error(self.request, f"Error processing Excel file: {str(e)}")
             return super().form_invalid(form)
 
+        if dry_run:
+            # Show what would happen and let the user upload again for real
+            return self.render_to_response(self.get_context_data(form=form, report=report))
+
+        # Display results
+        if report['created'] > 0:
+            messages.success(self.request, f"Successfully created {report['created']} new players.")
+        if report['updated'] > 0:
+            messages.success(self.request, f"Successfully updated {report['updated']} existing players.")
+        if report['error_count']:
+            details = '; '.join(f"row {error['row']}: {error['message']}" for error in report['errors'][:5])
+            messages.warning(
+                self.request,
+                f"Encountered {report['error_count']} errors while processing the data ({details})."
+            )
+
+        if report['created'] == 0 and report['updated'] == 0:
+            messages.warning(self.request, "No players were imported. Please check your Excel file format.")
+            return super().form_invalid(form)
+
         return super().form_valid(form)
 
 
@@ -371,13 +282,8 @@ class PlayerDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         context['appearances'] = self.object.match_appearances.select_related('match').order_by('-match__date')
 
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_edit'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
-        context['can_delete'] = context['is_approved'] and context['is_admin']
+        context['can_edit'] = self.request.roles.is_coach_or_admin
+        context['can_delete'] = self.request.roles.is_admin
         return context
 
 
@@ -388,12 +294,12 @@ class PlayerCreateView(LoginRequiredMixin, CreateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can create players.")
             return redirect('player-list')
 
         # Only admin and coach can create players
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to create players.")
             return redirect('player-list')
 
@@ -407,12 +313,12 @@ class PlayerUpdateView(LoginRequiredMixin, UpdateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can update players.")
             return redirect('player-list')
 
         # Only admin and coach can update players
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to update players.")
             return redirect('player-list')
 
@@ -425,12 +331,12 @@ class PlayerDeleteView(LoginRequiredMixin, DeleteView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has admin role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can delete players.")
             return redirect('player-list')
 
         # Only admin can delete players
-        if not request.user.profile.is_admin():
+        if not request.roles.is_admin:
             messages.warning(request, "You don't have permission to delete players.")
             return redirect('player-list')
 
@@ -445,32 +351,59 @@ class MatchListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_create'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
+        context['can_create'] = self.request.roles.is_coach_or_admin
         return context
 
 
+class ImportMatchesView(LoginRequiredMixin, FormView):
+    template_name = 'teammanager/import_matches.html'
+    form_class = MatchImportForm
+    success_url = reverse_lazy('match-list')
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.roles.is_approved:
+            messages.warning(request, "Your account needs to be approved before you can import matches.")
+            return redirect('match-list')
+
+        # Only admin can backfill match history
+        if not request.roles.is_admin:
+            messages.warning(request, "You don't have permission to import matches.")
+            return redirect('match-list')
+
+        return super().dispatch(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        dry_run = form.cleaned_data.get('dry_run')
+        try:
+            report = match_import.import_match_history(self.request.FILES['match_file'], dry_run=dry_run)
+        except player_import.SpreadsheetError as e:
+            messages.error(self.request, str(e))
+            return super().form_invalid(form)
+        except Exception as e:
+            messages.error(self.request, f"Error processing file: {str(e)}")
+            return super().form_invalid(form)
+
+        if not dry_run:
+            messages.success(
+                self.request,
+                f"Imported {report['matches_created']} new matches and {report['appearances_created']} appearances."
+            )
+        # Always show the reconciliation report
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+
 class MatchDetailView(LoginRequiredMixin, DetailView):
     model = Match
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Get appearances for the Smørås team
-        context['home_appearances'] = self.object.appearances.filter(team=self.object.smoras_team)
+        context['home_appearances'] = self.object.appearances.filter(team=self.object.smoras_team).select_related('player')
         # Get appearances for any other teams (external players)
-        context['away_appearances'] = self.object.appearances.exclude(team=self.object.smoras_team)
+        context['away_appearances'] = self.object.appearances.exclude(team=self.object.smoras_team).select_related('player')
         context['is_home_match'] = self.object.location_type == 'Home'
 
-        # Add user role information for the template
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
-        context['can_edit'] = context['is_approved'] and (context['is_admin'] or context['is_coach'])
+        context['can_edit'] = self.request.roles.is_coach_or_admin
         return context
 
 
@@ -481,12 +414,12 @@ class MatchCreateView(LoginRequiredMixin, CreateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can create matches.")
             return redirect('match-list')
 
         # Only admin and coach can create matches
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to create matches.")
             return redirect('match-list')
 
@@ -511,12 +444,12 @@ class MatchUpdateView(LoginRequiredMixin, UpdateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can update matches.")
             return redirect('match-list')
 
         # Only admin and coach can update matches
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to update matches.")
             return redirect('match-list')
 
@@ -529,12 +462,12 @@ class MatchDeleteView(LoginRequiredMixin, DeleteView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has admin role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can delete matches.")
             return redirect('match-list')
 
         # Only admin can delete matches
-        if not request.user.profile.is_admin():
+        if not request.roles.is_admin:
             messages.warning(request, "You don't have permission to delete matches.")
             return redirect('match-list')
 
@@ -548,12 +481,12 @@ class MatchScoreUpdateView(LoginRequiredMixin, UpdateView):
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has correct role
-        if not request.user.profile.is_approved():
+        if not request.roles.is_approved:
             messages.warning(request, "Your account needs to be approved before you can update match scores.")
             return redirect('match-list')
 
         # Both coach and admin can update match scores
-        if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+        if not request.roles.is_coach_or_admin:
             messages.warning(request, "You don't have permission to update match scores.")
             return redirect('match-list')
 
@@ -566,12 +499,12 @@ class MatchScoreUpdateView(LoginRequiredMixin, UpdateView):
 @login_required
 def add_players_to_match(request, match_id, team_id):
     # Check if user's profile is approved and has correct role
-    if not request.user.profile.is_approved():
+    if not request.roles.is_approved:
         messages.warning(request, "Your account needs to be approved before you can add players to matches.")
         return redirect('match-list')
 
     # Only admin and coach can add players to matches
-    if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+    if not request.roles.is_coach_or_admin:
         messages.warning(request, "You don't have permission to add players to matches.")
         return redirect('match-list')
 
@@ -618,12 +551,12 @@ def add_players_to_match(request, match_id, team_id):
 @login_required
 def edit_appearance_stats(request, appearance_id):
     # Check if user's profile is approved and has correct role
-    if not request.user.profile.is_approved():
+    if not request.roles.is_approved:
         messages.warning(request, "Your account needs to be approved before you can update player statistics.")
         return redirect('match-list')
 
     # Only admin and coach can edit player statistics
-    if not (request.user.profile.is_admin() or request.user.profile.is_coach()):
+    if not request.roles.is_coach_or_admin:
         messages.warning(request, "You don't have permission to update player statistics.")
         return redirect('match-list')
 
@@ -650,6 +583,7 @@ def edit_appearance_stats(request, appearance_id):
 
 
 # API Views for Chart Data
+@replica_reads
 @login_required
 def player_stats(request):
     # Get all players with their match counts
@@ -659,48 +593,42 @@ def player_stats(request):
         total_assists=Sum('match_appearances__assists')
     ).values('id', 'first_name', 'last_name', 'matches_played', 'total_goals', 'total_assists')
 
+    # The teams each player has played for and the number of matches with each team, in one query
+    teams_by_player = {}
+    player_teams = MatchAppearance.objects.values('player_id', 'team__name') \
+        .annotate(team_matches=Count('match')) \
+        .order_by('player_id', '-team_matches')
+    for row in player_teams:
+        teams_by_player.setdefault(row.pop('player_id'), []).append(row)
+
     # Create a list to store the enriched player data with team information
     enriched_players = []
-
     for player in players:
-        # For each player, get the teams they've played for and the number of matches with each team
-        player_teams = MatchAppearance.objects.filter(player_id=player['id']) \
-            .values('team__name') \
-            .annotate(team_matches=Count('match')) \
-            .order_by('-team_matches')
-
-        # Add team data to the player record
         player_with_teams = player.copy()
-        player_with_teams['teams'] = list(player_teams)
+        player_with_teams['teams'] = teams_by_player.get(player['id'], [])
         enriched_players.append(player_with_teams)
 
     return JsonResponse(enriched_players, safe=False)
 
 
+@replica_reads
 @login_required
 def match_stats(request):
-    teams = Team.objects.all()
-    stats = []
-
-    for team in teams:
-        # Get all matches where this team is the Smørås team
-        team_matches = team.matches.filter(smoras_score__isnull=False, opponent_score__isnull=False)
-
-        # Calculate wins, draws, and losses based on scores
-        wins = team_matches.filter(smoras_score__gt=F('opponent_score')).count()
-        draws = team_matches.filter(smoras_score=F('opponent_score')).count()
-        losses = team_matches.filter(smoras_score__lt=F('opponent_score')).count()
-
-        stats.append({
-            'team': team.name,
-            'wins': wins,
-            'draws': draws,
-            'losses': losses
-        })
+    # Wins, draws and losses of every team in one query (matches without a score count for none)
+    teams = Team.objects.annotate(
+        wins=Count('matches', filter=Q(matches__smoras_score__gt=F('matches__opponent_score'))),
+        draws=Count('matches', filter=Q(matches__smoras_score=F('matches__opponent_score'))),
+        losses=Count('matches', filter=Q(matches__smoras_score__lt=F('matches__opponent_score'))),
+    )
+    stats = [
+        {'team': team.name, 'wins': team.wins, 'draws': team.draws, 'losses': team.losses}
+        for team in teams
+    ]
 
     return JsonResponse(stats, safe=False)
 
 
+@replica_reads
 @login_required
 def player_matrix(request):
     """
@@ -812,13 +740,13 @@ class UserListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         # Only show users if the current user is an admin
-        if self.request.user.profile.is_admin():
-            return User.objects.all().select_related('profile').order_by('-profile__created_at')
+        if self.request.roles.is_admin:
+            return User.objects.all().select_related('profile__player').order_by('-profile__created_at')
         return User.objects.none()
 
     def dispatch(self, request, *args, **kwargs):
         # Check if user's profile is approved and has admin role
-        if not request.user.profile.is_admin():
+        if not request.roles.is_admin:
             messages.warning(request, "You don't have permission to manage users.")
             return redirect('dashboard')
 
@@ -827,17 +755,13 @@ class UserListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['pending_users'] = User.objects.filter(profile__status='pending').select_related('profile')
-        context['is_admin'] = self.request.user.profile.is_admin()
-        context['is_coach'] = self.request.user.profile.is_coach()
-        context['is_player'] = self.request.user.profile.is_player()
-        context['is_approved'] = self.request.user.profile.is_approved()
         return context
 
 
 @login_required
 def approve_user(request, pk):
     # Only admin users can approve other users
-    if not request.user.profile.is_admin():
+    if not request.roles.is_admin:
         messages.error(request, "You don't have permission to approve users.")
         return redirect('dashboard')
 
@@ -855,7 +779,7 @@ def approve_user(request, pk):
 @login_required
 def reject_user(request, pk):
     # Only admin users can reject other users
-    if not request.user.profile.is_admin():
+    if not request.roles.is_admin:
         messages.error(request, "You don't have permission to reject users.")
         return redirect('dashboard')
 
@@ -873,7 +797,7 @@ def reject_user(request, pk):
 @login_required
 def delete_user(request, pk):
     # Only admin users can delete other users
-    if not request.user.profile.is_admin():
+    if not request.roles.is_admin:
         messages.error(request, "You don't have permission to delete users.")
         return redirect('dashboard')
 
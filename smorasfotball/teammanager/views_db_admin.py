@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect
+from django.http import StreamingHttpResponse, Http404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
@@ -7,6 +8,9 @@ from django.db import connections
 from django.db.utils import OperationalError
 from django.conf import settings
 from .models import Team, Player, Match, MatchAppearance, UserProfile
+from . import data_export
+from .db_router import replica_reads
+from .roles import get_roles
 import os
 import json
 import sys
@@ -14,12 +18,7 @@ from datetime import datetime
 
 def is_admin(user):
     """Check if user is an approved admin"""
-    if not user.is_authenticated:
-        return False
-    try:
-        return user.profile.is_admin() and user.profile.is_approved()
-    except:
-        return False
+    return get_roles(user).is_admin
 
 @login_required
 def database_overview(request):
@@ -60,6 +59,31 @@ def database_overview(request):
         'db_connected': db_connected,
         'db_name': settings.DATABASES['default'].get('NAME', 'Unknown'),
         'db_host': settings.DATABASES['default'].get('HOST', 'localhost'),
+        'export_datasets': list(data_export.DATASETS),
+        'export_formats': list(data_export.FORMATS),
     }
     
-    return render(request, 'teammanager/database_overview.html', context)
\ No newline at end of file
+    return render(request, 'teammanager/database_overview.html', context)
+
+
+@replica_reads
+@login_required
+def export_data(request, dataset, export_format):
+    """Stream a dataset (players, matches, appearances, ...) as CSV, XLSX or Parquet"""
+    if not is_admin(request.user):
+        messages.error(request, "You don't have permission to export data.")
+        return redirect('dashboard')
+
+    try:
+        content = data_export.stream_export(dataset, export_format)
+    except data_export.ExportError as e:
+        if dataset in data_export.DATASETS and export_format in data_export.FORMATS:
+            # Known format whose optional dependency is missing
+            messages.error(request, str(e))
+            return redirect('database-overview')
+        raise Http404(str(e))
+
+    response = StreamingHttpResponse(content, content_type=data_export.FORMATS[export_format])
+    filename = data_export.export_filename(dataset, export_format)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
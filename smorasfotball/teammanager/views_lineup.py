@@ -1,40 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.views.generic.edit import FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.db import transaction
 from django.db.models import Count, Q
+from django.db.models.functions import Lower
 from django.core.exceptions import PermissionDenied
 import json
 import io
 import base64
+from datetime import timedelta
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 
 from .models import (
-    FormationTemplate, LineupPosition, Lineup, LineupPlayerPosition,
+    FormationTemplate, LineupPosition, Lineup, LineupPlayerPosition, LineupRevision,
     Team, Player, Match, MatchAppearance
 )
 from .forms import (
-    FormationTemplateForm, LineupPositionForm, LineupForm, LineupPlayerPositionForm
+    FormationTemplateForm, LineupPositionForm, LineupForm, LineupPlayerPositionForm,
+    BulkLineupDuplicateForm
 )
+from .formation_layouts import get_layout, get_all_layout_tables
+from .incremental_backup import record_objects
+from .lineup_revisions import (
+    ensure_baseline, record_revision, reconstruct, restore_revision, undo_target, describe_changes
+)
+from .lineup_images import (
+    IMAGE_FORMATS, PITCH_X, PITCH_BOTTOM, PITCH_WIDTH, PITCH_HEIGHT, GRASS_STRIPE_WIDTH,
+    pitch_markings, get_lineup_image, image_version, lineup_image_data
+)
+from .roles import get_roles
 
 
 def is_coach_or_admin(user):
     """Check if user is an approved coach or admin"""
-    if not user.is_authenticated:
-        return False
-    try:
-        profile = user.profile
-        return (profile.is_approved() and 
-                (profile.is_coach() or profile.is_admin()))
-    except:
-        return False
+    return get_roles(user).is_coach_or_admin
 
 
 class LineupListView(LoginRequiredMixin, ListView):
@@ -63,17 +71,6 @@ class LineupListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-        
         # Add teams for filtering
         context['teams'] = Team.objects.all()
         
@@ -92,23 +89,9 @@ class LineupDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         # Get player positions for this lineup
         context['player_positions'] = self.object.player_positions.all().select_related('player', 'position')
         
-        # Get available players for this team
-        context['available_players'] = Player.objects.filter(active=True)
-        
         # Get available positions
         context['available_positions'] = LineupPosition.objects.all()
         
@@ -134,17 +117,6 @@ class LineupCreateView(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         # Check if we're copying from a template
         template_id = self.request.GET.get('from_template')
         if template_id:
@@ -171,18 +143,12 @@ class LineupCreateView(LoginRequiredMixin, CreateView):
             try:
                 template = Lineup.objects.get(id=template_id, is_template=True)
                 
-                # Copy player positions from template
-                for position in template.player_positions.all():
-                    LineupPlayerPosition.objects.create(
-                        lineup=self.object,
-                        player=position.player if position.player.active else None,
-                        position=position.position,
-                        x_coordinate=position.x_coordinate,
-                        y_coordinate=position.y_coordinate,
-                        jersey_number=position.jersey_number,
-                        is_starter=position.is_starter,
-                        notes=position.notes
-                    )
+                # Copy player positions from template, leaving out inactive players
+                record_objects(LineupPlayerPosition.objects.bulk_create([
+                    position.copy_to(self.object)
+                    for position in template.player_positions.select_related('player')
+                    if position.player.active
+                ]))
                 
                 messages.success(self.request, f"Lineup created from template '{template.name}'.")
             except Lineup.DoesNotExist:
@@ -192,135 +158,46 @@ class LineupCreateView(LoginRequiredMixin, CreateView):
             match = form.instance.match
             team = form.instance.team
             
-            # Get all players who appeared in this match for this team
-            match_appearances = match.appearances.filter(team=team)
-            
-            # Get or create default positions based on formation
-            positions = self._get_positions_from_formation(form.instance.formation)
+            # Get all active players who appeared in this match for this team
+            match_appearances = list(
+                match.appearances.filter(team=team, player__active=True).select_related('player')
+            )
             
-            # Add each player who appeared in the match to the lineup
-            # First, determine how many players should be in the starting lineup
-            formation = form.instance.formation
-            starting_count = 11  # Default for standard football
+            # Precomputed slots for this formation and direction: GK, the formation
+            # layers, then sideline slots for substitutes
+            slots = get_layout(form.instance.formation, form.instance.direction)
             
-            # If we have a formation, use its player count to determine starters
-            if formation:
-                starting_count = formation.player_count
+            # One position lookup per role instead of one query per player
+            positions_by_role = {}
+            for position in LineupPosition.objects.order_by('id'):
+                positions_by_role.setdefault(position.position_type, position)
             
-            # Process each player
+            new_positions = []
             for idx, appearance in enumerate(match_appearances):
-                # Skip if player is not active
-                if not appearance.player.active:
-                    continue
-                    
-                # Calculate default positions (evenly distributed)
-                position_type = None
-                if idx == 0:  # First player is goalkeeper
-                    position_type = LineupPosition.objects.filter(position_type='GK').first()
+                if idx < len(slots):
+                    slot = slots[idx]
                 else:
-                    # Rotate through remaining position types for other players
-                    position_options = ['DEF', 'MID', 'FWD']
-                    position_type = LineupPosition.objects.filter(
-                        position_type=position_options[(idx - 1) % 3]
-                    ).first()
-                
-                # Calculate sensible default coordinates based on position type
-                x, y = self._get_default_coordinates(position_type, idx, len(match_appearances))
+                    # More players than slots - stack them on the last sideline slot
+                    slot = slots[-1]
                 
-                # Determine if this player is a starter based on position and index
-                # First 'starting_count' players are starters, rest are substitutes
-                is_starter = idx < starting_count
-                
-                # If it's a substitute, place them on the sideline
-                if not is_starter:
-                    # Place substitutes on the left edge of the pitch
-                    x = 1
-                    # Distribute them vertically with equal spacing
-                    sub_idx = idx - starting_count
-                    sub_spacing = 80 / max(1, match_appearances.count() - starting_count)
-                    y = 10 + (sub_idx * sub_spacing)
-                
-                # Create the player position in the lineup
-                LineupPlayerPosition.objects.create(
+                new_positions.append(LineupPlayerPosition(
                     lineup=self.object,
                     player=appearance.player,
-                    position=position_type,
-                    x_coordinate=x,
-                    y_coordinate=y,
+                    position=positions_by_role.get(slot['role']),
+                    x_coordinate=slot['x'],
+                    y_coordinate=slot['y'],
                     jersey_number=idx + 1,  # Default jersey number
-                    is_starter=is_starter,
+                    is_starter=slot['is_starter'],
                     notes=f"Added from match: {match.smoras_team} vs {match.opponent_name}"
-                )
+                ))
+            LineupPlayerPosition.objects.bulk_create(new_positions)
+            record_objects(new_positions)
             
-            messages.success(self.request, f"Lineup created with {match_appearances.count()} players from match: {match.smoras_team} vs {match.opponent_name}.")
+            messages.success(self.request, f"Lineup created with {len(new_positions)} players from match: {match.smoras_team} vs {match.opponent_name}.")
         else:
             messages.success(self.request, "Lineup created successfully.")
         
         return response
-        
-    def _get_positions_from_formation(self, formation):
-        """Get appropriate positions based on the formation"""
-        position_types = {
-            'GK': 1,  # Always 1 goalkeeper
-            'DEF': 4, # Default 4 defenders
-            'MID': 4, # Default 4 midfielders
-            'FWD': 2  # Default 2 forwards
-        }
-        
-        # If we have a formation, parse its structure
-        if formation:
-            try:
-                parts = formation.formation_structure.split('-')
-                if len(parts) >= 3:  # Typical format: 4-4-2, 4-3-3, etc.
-                    position_types['DEF'] = int(parts[0])
-                    position_types['MID'] = int(parts[1])
-                    position_types['FWD'] = int(parts[2])
-            except (ValueError, IndexError):
-                # If parsing fails, use defaults
-                pass
-                
-        return position_types
-        
-    def _get_default_coordinates(self, position_type, idx, total_players):
-        """Calculate sensible default coordinates based on position and index"""
-        if not position_type:
-            # Default to middle if no position
-            return 50, 50
-            
-        # X coordinate - based on position type
-        if position_type.position_type == 'GK':
-            x = 10  # Goalkeeper near the goal
-        elif position_type.position_type == 'DEF':
-            x = 30  # Defenders
-        elif position_type.position_type == 'MID':
-            x = 60  # Midfielders
-        elif position_type.position_type == 'FWD':
-            x = 80  # Forwards
-        else:
-            x = 50  # Default to middle
-            
-        # Y coordinate - evenly distribute players of same position type
-        base_y = 50  # Start in the middle
-        spread = min(70, total_players * 5)  # Limit the spread based on player count
-        
-        # Distribute Y based on position and index to avoid overlap
-        if position_type.position_type == 'GK':
-            y = 50  # Goalkeeper in the middle
-        else:
-            # For each position type, calculate how many we have
-            position_count = {
-                'DEF': min(4, max(3, total_players // 4)),
-                'MID': min(4, max(3, total_players // 3)),
-                'FWD': min(3, max(2, total_players // 5))
-            }[position_type.position_type]
-            
-            # Distribute Y based on position count
-            offset = spread / (position_count + 1)
-            # Position index within its category
-            pos_idx = idx % position_count
-            y = 50 - (spread / 2) + (offset * (pos_idx + 1))
-            
-        return x, y
     
     def get_success_url(self):
         return reverse('lineup-builder', kwargs={'pk': self.object.pk})
@@ -345,17 +222,6 @@ class LineupUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         context['formations'] = FormationTemplate.objects.all()
         context['editing'] = True
         
@@ -379,23 +245,7 @@ class LineupDeleteView(LoginRequiredMixin, DeleteView):
             messages.error(request, "You don't have permission to delete lineups.")
             return redirect('lineup-list')
         return super().dispatch(request, *args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-    
     def delete(self, request, *args, **kwargs):
         messages.success(request, "Lineup deleted successfully.")
         return super().delete(request, *args, **kwargs)
@@ -415,33 +265,153 @@ class LineupBuilderView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         # Get player positions for this lineup
         context['player_positions'] = self.object.player_positions.all().select_related('player', 'position')
         
-        # Get available players for this team who aren't already in the lineup
-        used_player_ids = self.object.player_positions.values_list('player_id', flat=True)
-        context['available_players'] = Player.objects.filter(active=True).exclude(id__in=used_player_ids)
+        # Available players are lazy-loaded by the builder through the
+        # player-search API instead of being embedded into the page
+        context['player_search_page_size'] = PLAYER_SEARCH_PAGE_SIZE
         
         # Get available positions
         context['available_positions'] = LineupPosition.objects.all()
         
-        # Get formation templates for quick application
-        context['formations'] = FormationTemplate.objects.all()
+        # Get formation templates for quick application, with their precomputed
+        # coordinate tables so the builder doesn't recompute the layout
+        formations = list(FormationTemplate.objects.all())
+        context['formations'] = formations
+        context['formation_layouts'] = get_all_layout_tables(formations)
         
         return context
 
 
+@login_required
+def formation_layouts(request):
+    """JSON endpoint with the precomputed coordinate tables of all formations"""
+    formations = FormationTemplate.objects.all()
+    return JsonResponse({'formations': get_all_layout_tables(formations)})
+
+
+PLAYER_SEARCH_PAGE_SIZE = 25
+PLAYER_SEARCH_MAX_PAGE_SIZE = 100
+
+
+def _encode_player_cursor(player):
+    """Opaque keyset cursor: the (lowered first name, id) of the last row"""
+    payload = json.dumps([player.first_name_lower, player.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_player_cursor(cursor):
+    try:
+        name, player_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return str(name), int(player_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _int_param(request, name, default=None, minimum=None):
+    """An integer query parameter; raises ValueError when it isn't one"""
+    value = request.GET.get(name)
+    if not value:
+        return default
+    value = int(value)
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return value
+
+
+def _name_prefix_q(term):
+    """
+    Players whose first or last name starts with a lowercased search term.
+
+    SQLite's lower() only folds ASCII letters, so the term's capitalised and
+    upper case spellings are matched against the stored names too; that finds
+    "Øystein" for "øy" on SQLite as well as on PostgreSQL.
+    """
+    q = Q(first_name_lower__startswith=term) | Q(last_name_lower__startswith=term)
+    for spelling in {term.capitalize(), term.title(), term.upper()} - {term}:
+        q |= Q(first_name__startswith=spelling) | Q(last_name__startswith=spelling)
+    return q
+
+
+@login_required
+def player_search(request):
+    """
+    JSON player picker for the lineup builder.
+
+    Query parameters:
+      q         - prefix match on first/last name (every word must match)
+      team      - only players who played for this team recently
+      days      - how far back "recently" goes (default 365)
+      exclude_lineup - leave out players already in this lineup
+      include_inactive - include inactive players (default: active only)
+      limit     - page size (default 25, max 100)
+      cursor    - keyset cursor returned as next_cursor by the previous page
+
+    Malformed or out of range numbers get a 400 response.
+    """
+    try:
+        team_id = _int_param(request, 'team')
+        exclude_lineup = _int_param(request, 'exclude_lineup')
+        since = timezone.now() - timedelta(days=_int_param(request, 'days', 365, minimum=0))
+        limit = min(_int_param(request, 'limit', PLAYER_SEARCH_PAGE_SIZE, minimum=1), PLAYER_SEARCH_MAX_PAGE_SIZE)
+    except (ValueError, OverflowError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid team, exclude_lineup, days or limit'}, status=400)
+
+    players = Player.objects.annotate(first_name_lower=Lower('first_name'), last_name_lower=Lower('last_name'))
+    
+    if request.GET.get('include_inactive', '').lower() not in ('1', 'true', 'yes'):
+        players = players.filter(active=True)
+    
+    # Every word in the query must be a prefix of the first or last name
+    for term in request.GET.get('q', '').lower().split():
+        players = players.filter(_name_prefix_q(term))
+    
+    if team_id is not None:
+        recent_player_ids = MatchAppearance.objects.filter(
+            team_id=team_id, match__date__gte=since
+        ).values('player_id')
+        players = players.filter(id__in=recent_player_ids)
+    
+    if exclude_lineup is not None:
+        players = players.exclude(
+            id__in=LineupPlayerPosition.objects.filter(lineup_id=exclude_lineup).values('player_id')
+        )
+    
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = _decode_player_cursor(cursor)
+        if position is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+        name, player_id = position
+        players = players.filter(
+            Q(first_name_lower__gt=name) | Q(first_name_lower=name, id__gt=player_id)
+        )
+    
+    # Fetch one extra row to know whether there is another page
+    page = list(
+        players.order_by('first_name_lower', 'id')
+        .only('id', 'first_name', 'last_name', 'position', 'active')[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': player.id,
+                'first_name': player.first_name,
+                'last_name': player.last_name or '',
+                'position': player.position or '',
+                'active': player.active,
+            }
+            for player in page
+        ],
+        'has_more': has_more,
+        'next_cursor': _encode_player_cursor(page[-1]) if has_more else None,
+    })
+
+
 @login_required
 def save_lineup_positions(request, pk):
     """AJAX endpoint to save player positions in a lineup"""
@@ -459,93 +429,104 @@ def save_lineup_positions(request, pk):
             positions = data.get('positions', []) or data.get('playerPositions', [])
             direction = data.get('direction')
             
-            # Update direction if specified
-            if direction:
-                print(f"[Save] Updating direction to {direction}")
-                lineup.direction = direction
-                lineup.save(update_fields=['direction'])
+            # The baseline, the changes and their revision are one transaction
+            with transaction.atomic():
+                # Make sure the state before this first change is kept in the history
+                ensure_baseline(lineup, request.user)
+            
+                # Update direction if specified
+                if direction:
+                    print(f"[Save] Updating direction to {direction}")
+                    lineup.direction = direction
+                    lineup.save(update_fields=['direction'])
             
-            print(f"[Save] Received {len(positions)} player positions to save")
+                print(f"[Save] Received {len(positions)} player positions to save")
             
-            # Log the position data being received
-            for pos in positions:
-                print(f"[Save] Player {pos.get('player_id')}: x={pos.get('x')}, y={pos.get('y')}, "
-                      f"position_id={pos.get('position_id')}, jersey={pos.get('jersey_number')}")
+                # Log the position data being received
+                for pos in positions:
+                    print(f"[Save] Player {pos.get('player_id')}: x={pos.get('x')}, y={pos.get('y')}, "
+                          f"position_id={pos.get('position_id')}, jersey={pos.get('jersey_number')}")
             
-            # Track which players have been processed to handle deletions
-            processed_player_ids = []
+                # Track which players have been processed to handle deletions
+                processed_player_ids = []
             
-            # Process each position
-            for pos in positions:
-                try:
-                    player_id = pos.get('player_id')
-                    if not player_id:
-                        print(f"Warning: Missing player_id in position data: {pos}")
-                        continue
+                # Process each position
+                for pos in positions:
+                    try:
+                        player_id = pos.get('player_id')
+                        if not player_id:
+                            print(f"Warning: Missing player_id in position data: {pos}")
+                            continue
                         
-                    position_id = pos.get('position_id')
-                    x = pos.get('x')
-                    y = pos.get('y')
-                    is_starter = pos.get('is_starter', True)
-                    jersey_number = pos.get('jersey_number')
-                    notes = pos.get('notes', '')
+                        position_id = pos.get('position_id')
+                        x = pos.get('x')
+                        y = pos.get('y')
+                        is_starter = pos.get('is_starter', True)
+                        jersey_number = pos.get('jersey_number')
+                        notes = pos.get('notes', '')
                     
-                    # Ensure we have valid coordinates
-                    if x is None or y is None:
-                        print(f"Warning: Missing coordinates for player {player_id}: x={x}, y={y}")
-                        continue
+                        # Ensure we have valid coordinates
+                        if x is None or y is None:
+                            print(f"Warning: Missing coordinates for player {player_id}: x={x}, y={y}")
+                            continue
                         
-                    # Validate coordinate values
-                    x = max(0, min(100, float(x)))
-                    y = max(0, min(100, float(y)))
+                        # Validate coordinate values
+                        x = max(0, min(100, float(x)))
+                        y = max(0, min(100, float(y)))
                     
-                    processed_player_ids.append(int(player_id))
+                        processed_player_ids.append(int(player_id))
                     
-                    # Check if this position already exists
-                    try:
-                        player_position = LineupPlayerPosition.objects.get(
-                            lineup=lineup,
-                            player_id=player_id
-                        )
-                        # Update existing position
-                        player_position.position_id = position_id
-                        player_position.x_coordinate = x
-                        player_position.y_coordinate = y
-                        player_position.is_starter = is_starter
-                        player_position.jersey_number = jersey_number
-                        player_position.notes = notes
-                        player_position.save()
-                        print(f"Updated position for player {player_id} at coordinates ({x}, {y})")
-                    except LineupPlayerPosition.DoesNotExist:
-                        # Create new position
-                        LineupPlayerPosition.objects.create(
-                            lineup=lineup,
-                            player_id=player_id,
-                            position_id=position_id,
-                            x_coordinate=x,
-                            y_coordinate=y,
-                            is_starter=is_starter,
-                            jersey_number=jersey_number,
-                            notes=notes
-                        )
-                        print(f"Created new position for player {player_id} at coordinates ({x}, {y})")
-                except Exception as e:
-                    print(f"Error processing position for player {pos.get('player_id')}: {str(e)}")
+                        # A savepoint, so a position that fails to save doesn't abort the whole transaction
+                        with transaction.atomic():
+                            # Check if this position already exists
+                            try:
+                                player_position = LineupPlayerPosition.objects.get(
+                                    lineup=lineup,
+                                    player_id=player_id
+                                )
+                                # Update existing position
+                                player_position.position_id = position_id
+                                player_position.x_coordinate = x
+                                player_position.y_coordinate = y
+                                player_position.is_starter = is_starter
+                                player_position.jersey_number = jersey_number
+                                player_position.notes = notes
+                                player_position.save()
+                                print(f"Updated position for player {player_id} at coordinates ({x}, {y})")
+                            except LineupPlayerPosition.DoesNotExist:
+                                # Create new position
+                                LineupPlayerPosition.objects.create(
+                                    lineup=lineup,
+                                    player_id=player_id,
+                                    position_id=position_id,
+                                    x_coordinate=x,
+                                    y_coordinate=y,
+                                    is_starter=is_starter,
+                                    jersey_number=jersey_number,
+                                    notes=notes
+                                )
+                                print(f"Created new position for player {player_id} at coordinates ({x}, {y})")
+                    except Exception as e:
+                        print(f"Error processing position for player {pos.get('player_id')}: {str(e)}")
+            
+                # Clear any positions for players who were removed from the lineup
+                if processed_player_ids:
+                    removed = LineupPlayerPosition.objects.filter(lineup=lineup).exclude(player_id__in=processed_player_ids).delete()[0]
+                    if removed > 0:
+                        print(f"Removed {removed} positions for players no longer in the lineup")
             
-            # Clear any positions for players who were removed from the lineup
-            if processed_player_ids:
-                removed = LineupPlayerPosition.objects.filter(lineup=lineup).exclude(player_id__in=processed_player_ids).delete()[0]
-                if removed > 0:
-                    print(f"Removed {removed} positions for players no longer in the lineup")
+                # Verify that positions were saved
+                position_count = LineupPlayerPosition.objects.filter(lineup=lineup).count()
+                print(f"Lineup {pk} now has {position_count} player positions")
             
-            # Verify that positions were saved
-            position_count = LineupPlayerPosition.objects.filter(lineup=lineup).count()
-            print(f"Lineup {pk} now has {position_count} player positions")
+                # Record what changed (nothing is stored when the save was a no-op)
+                revision = record_revision(lineup, request.user)
             
             return JsonResponse({
                 'status': 'success', 
                 'message': 'Lineup saved successfully',
-                'position_count': position_count
+                'position_count': position_count,
+                'revision': revision.number if revision else None
             })
         
         except Exception as e:
@@ -566,7 +547,10 @@ def remove_player_from_lineup(request, lineup_id, player_id):
         try:
             lineup = get_object_or_404(Lineup, pk=lineup_id)
             position = get_object_or_404(LineupPlayerPosition, lineup=lineup, player_id=player_id)
-            position.delete()
+            with transaction.atomic():
+                ensure_baseline(lineup, request.user)
+                position.delete()
+                record_revision(lineup, request.user)
             
             return JsonResponse({'status': 'success', 'message': 'Player removed from lineup'})
         except Exception as e:
@@ -575,6 +559,105 @@ def remove_player_from_lineup(request, lineup_id, player_id):
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
 
+def _revision_json(revision):
+    data = revision.data
+    return {
+        'number': revision.number,
+        'is_snapshot': revision.is_snapshot,
+        'restored_from': data.get('f'),
+        'players_changed': len(data.get('p', data.get('u', []))),
+        'players_removed': len(data.get('r', [])),
+        'created_by': revision.created_by.username if revision.created_by else None,
+        'created_at': revision.created_at.isoformat(),
+        'updated_at': revision.updated_at.isoformat(),
+    }
+
+
+@login_required
+def lineup_revision_list(request, pk):
+    """List the revision history of a lineup (newest first)"""
+    lineup = get_object_or_404(Lineup, pk=pk)
+    revisions = lineup.revisions.select_related('created_by').order_by('-number')
+    return JsonResponse({
+        'lineup': lineup.id,
+        'undo_target': undo_target(lineup),
+        'revisions': [_revision_json(revision) for revision in revisions],
+    })
+
+
+@login_required
+def lineup_revision_diff(request, pk, number):
+    """Show what changed in a revision (or between it and ?against=<number>)"""
+    lineup = get_object_or_404(Lineup, pk=pk)
+    get_object_or_404(LineupRevision, lineup=lineup, number=number)
+    
+    try:
+        against = int(request.GET.get('against', number - 1))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid revision number'}, status=400)
+    
+    try:
+        new_state = reconstruct(lineup, number)
+        if against >= 1:
+            old_state = reconstruct(lineup, against)
+        else:
+            old_state = {'direction': new_state['direction'], 'positions': {}}
+    except LineupRevision.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Revision not found'}, status=404)
+    
+    return JsonResponse({
+        'lineup': lineup.id,
+        'from': against if against >= 1 else None,
+        'to': number,
+        'changes': describe_changes(old_state, new_state),
+    })
+
+
+@login_required
+def restore_lineup_revision(request, pk, number):
+    """AJAX endpoint to restore a lineup to an earlier revision"""
+    if not is_coach_or_admin(request.user):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    lineup = get_object_or_404(Lineup, pk=pk)
+    try:
+        revision = restore_revision(lineup, number, request.user)
+    except LineupRevision.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Revision not found'}, status=404)
+    
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Lineup restored to revision {number}',
+        'revision': revision.number if revision else None,
+    })
+
+
+@login_required
+def undo_lineup_change(request, pk):
+    """AJAX endpoint to undo the most recent change to a lineup"""
+    if not is_coach_or_admin(request.user):
+        return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    
+    lineup = get_object_or_404(Lineup, pk=pk)
+    target = undo_target(lineup)
+    if target is None:
+        return JsonResponse({'status': 'error', 'message': 'Nothing to undo'}, status=400)
+    
+    revision = restore_revision(lineup, target, request.user)
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Lineup restored to revision {target}',
+        'restored': target,
+        'revision': revision.number if revision else None,
+    })
+
+
 @login_required
 def duplicate_lineup(request, pk):
     """Create a copy of an existing lineup"""
@@ -591,6 +674,76 @@ def duplicate_lineup(request, pk):
     return redirect('lineup-builder', pk=new_lineup.pk)
 
 
+@login_required
+def bulk_duplicate_lineup(request, pk):
+    """Copy a lineup onto many matches at once (e.g. a whole season from a template)"""
+    if not is_coach_or_admin(request.user):
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'error', 'message': 'Permission denied'}, status=403)
+        messages.error(request, "You don't have permission to duplicate lineups.")
+        return redirect('lineup-list')
+
+    lineup = get_object_or_404(Lineup.objects.select_related('team'), pk=pk)
+
+    if request.method == 'POST':
+        form = BulkLineupDuplicateForm(lineup, request.POST)
+        if form.is_valid():
+            summary = lineup.duplicate_to_matches(
+                form.cleaned_data['matches'],
+                skip_inactive_players=form.cleaned_data['skip_inactive_players'],
+                skip_existing=form.cleaned_data['skip_existing'],
+                created_by=request.user
+            )
+
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'status': 'success',
+                    'lineups_created': summary['lineups_created'],
+                    'positions_created': summary['positions_created'],
+                    'lineup_ids': [new_lineup.id for new_lineup in summary['lineups']],
+                    'skipped_players': [str(player) for player in summary['skipped_players']],
+                    'skipped_matches': [match.id for match in summary['skipped_matches']],
+                })
+
+            messages.success(
+                request,
+                f"Created {summary['lineups_created']} lineups with {summary['positions_created']} "
+                f"player positions from '{lineup.name}'."
+            )
+            if summary['skipped_players']:
+                skipped = ', '.join(str(player) for player in summary['skipped_players'])
+                messages.info(request, f"Skipped inactive players: {skipped}.")
+            if summary['skipped_matches']:
+                messages.info(request, f"Skipped {len(summary['skipped_matches'])} matches that already had a lineup.")
+            return redirect('lineup-list')
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    else:
+        form = BulkLineupDuplicateForm(lineup)
+
+    context = {
+        'lineup': lineup,
+        'form': form,
+    }
+    return render(request, 'teammanager/lineup_bulk_duplicate.html', context)
+
+
+def _draw_pdf_pitch_markings(p, pitch_x, pitch_y, pitch_width, pitch_height):
+    """Draw the white pitch markings onto a PDF canvas"""
+    p.setStrokeColor(colors.white)
+    p.setFillColor(colors.white)
+    for kind, *args in pitch_markings(pitch_x, pitch_y, pitch_width, pitch_height):
+        if kind == 'line':
+            p.line(*args)
+        elif kind == 'rect':
+            *rect, filled = args
+            p.rect(*rect, fill=1 if filled else 0, stroke=0 if filled else 1)
+        elif kind == 'circle':
+            *circle, filled = args
+            p.circle(*circle, stroke=1, fill=1 if filled else 0)
+
+
 @login_required
 def export_lineup_pdf(request, pk):
     """Export a lineup as PDF with both directions (first and second period)"""
@@ -636,10 +789,11 @@ def export_lineup_pdf(request, pk):
     # IMPORTANT: Pitch orientation: Left = Goalkeeper side (x=0), Right = Striker side (x=100%)
     # This matches the orientation in the lineup builder: GK on left, Strikers on right
     # Leave more space at the bottom for text
-    pitch_width = width - 150  # Slightly narrower pitch
-    pitch_height = height - 180  # More space at bottom
-    pitch_x = 50  # Left side of pitch
-    pitch_y = 70  # Bottom of pitch - increased to leave more space
+    # The geometry is shared with the SVG/PNG lineup images
+    pitch_width = PITCH_WIDTH  # Slightly narrower pitch
+    pitch_height = PITCH_HEIGHT  # More space at bottom
+    pitch_x = PITCH_X  # Left side of pitch
+    pitch_y = PITCH_BOTTOM  # Bottom of pitch - increased to leave more space
     
     # Draw realistic grass pattern
     p.setStrokeColor(colors.darkgreen)
@@ -648,52 +802,12 @@ def export_lineup_pdf(request, pk):
     
     # Add striped pattern for grass effect
     p.setStrokeColor(colors.Color(0, 0.5, 0, 0.1))  # Very light green
-    stripe_width = 20
+    stripe_width = GRASS_STRIPE_WIDTH
     for i in range(0, int(pitch_height), stripe_width * 2):
         p.rect(pitch_x, pitch_y + i, pitch_width, stripe_width, fill=True, stroke=False)
     
     # Draw pitch markings
-    p.setStrokeColor(colors.white)
-    p.setFillColor(colors.white)
-    
-    # Pitch outline
-    p.rect(pitch_x, pitch_y, pitch_width, pitch_height, fill=0)
-    
-    # Center line
-    p.line(pitch_x + pitch_width/2, pitch_y, pitch_x + pitch_width/2, pitch_y + pitch_height)
-    
-    # Center circle
-    p.circle(pitch_x + pitch_width/2, pitch_y + pitch_height/2, 50, stroke=1, fill=0)
-    p.circle(pitch_x + pitch_width/2, pitch_y + pitch_height/2, 5, fill=1)
-    
-    # Penalty spots
-    p.circle(pitch_x + 60, pitch_y + pitch_height/2, 3, fill=1)
-    p.circle(pitch_x + pitch_width - 60, pitch_y + pitch_height/2, 3, fill=1)
-    
-    # Goal areas (6-yard boxes)
-    goal_width = 40
-    goal_height = 120
-    # Goalkeeper side (left) goal area
-    p.rect(pitch_x, pitch_y + (pitch_height - goal_height)/2, goal_width, goal_height, fill=0)
-    # Striker side (right) goal area
-    p.rect(pitch_x + pitch_width - goal_width, pitch_y + (pitch_height - goal_height)/2, goal_width, goal_height, fill=0)
-    
-    # Penalty areas (18-yard boxes)
-    penalty_width = 80
-    penalty_height = 220
-    # Goalkeeper side (left) penalty area
-    p.rect(pitch_x, pitch_y + (pitch_height - penalty_height)/2, penalty_width, penalty_height, fill=0)
-    # Striker side (right) penalty area
-    p.rect(pitch_x + pitch_width - penalty_width, pitch_y + (pitch_height - penalty_height)/2, penalty_width, penalty_height, fill=0)
-    
-    # Draw goals
-    p.setFillColor(colors.white)
-    goal_post_width = 5
-    goal_post_depth = 8
-    # Goalkeeper side (left) goal
-    p.rect(pitch_x - goal_post_depth, pitch_y + (pitch_height - 80)/2, goal_post_depth, 80, fill=1, stroke=0)
-    # Striker side (right) goal
-    p.rect(pitch_x + pitch_width, pitch_y + (pitch_height - 80)/2, goal_post_depth, 80, fill=1, stroke=0)
+    _draw_pdf_pitch_markings(p, pitch_x, pitch_y, pitch_width, pitch_height)
     
     # Get player positions from database, including related data
     player_positions = lineup.player_positions.all().select_related('player', 'position')
@@ -932,37 +1046,7 @@ def export_lineup_pdf(request, pk):
         p.rect(pitch_x, pitch_y + i, pitch_width, stripe_width, fill=True, stroke=False)
     
     # Draw pitch markings
-    p.setStrokeColor(colors.white)
-    p.setFillColor(colors.white)
-    
-    # Pitch outline
-    p.rect(pitch_x, pitch_y, pitch_width, pitch_height, fill=0)
-    
-    # Center line
-    p.line(pitch_x + pitch_width/2, pitch_y, pitch_x + pitch_width/2, pitch_y + pitch_height)
-    
-    # Center circle
-    p.circle(pitch_x + pitch_width/2, pitch_y + pitch_height/2, 50, stroke=1, fill=0)
-    p.circle(pitch_x + pitch_width/2, pitch_y + pitch_height/2, 5, fill=1)
-    
-    # Penalty spots
-    p.circle(pitch_x + 60, pitch_y + pitch_height/2, 3, fill=1)
-    p.circle(pitch_x + pitch_width - 60, pitch_y + pitch_height/2, 3, fill=1)
-    
-    # Goal areas (6-yard boxes)
-    # For second period: right side is goalkeeper side, left side is striker side
-    p.rect(pitch_x, pitch_y + (pitch_height - goal_height)/2, goal_width, goal_height, fill=0)
-    p.rect(pitch_x + pitch_width - goal_width, pitch_y + (pitch_height - goal_height)/2, goal_width, goal_height, fill=0)
-    
-    # Penalty areas (18-yard boxes)
-    p.rect(pitch_x, pitch_y + (pitch_height - penalty_height)/2, penalty_width, penalty_height, fill=0)
-    p.rect(pitch_x + pitch_width - penalty_width, pitch_y + (pitch_height - penalty_height)/2, penalty_width, penalty_height, fill=0)
-    
-    # Draw goals
-    p.setFillColor(colors.white)
-    # For second period: left side goal for strikers, right side goal for goalkeeper
-    p.rect(pitch_x - goal_post_depth, pitch_y + (pitch_height - 80)/2, goal_post_depth, 80, fill=1, stroke=0)
-    p.rect(pitch_x + pitch_width, pitch_y + (pitch_height - 80)/2, goal_post_depth, 80, fill=1, stroke=0)
+    _draw_pdf_pitch_markings(p, pitch_x, pitch_y, pitch_width, pitch_height)
     
     # Draw each positioned player with flipped x-coordinates for second period
     for player in players_info:
@@ -1086,6 +1170,40 @@ def export_lineup_pdf(request, pk):
     return response
 
 
+@login_required
+def lineup_image(request, pk, image_format):
+    """
+    Render a lineup as an SVG or PNG image for sharing.
+
+    ``?direction=LR|RL`` picks the playing direction (defaults to the lineup's
+    own). Images are cached per lineup version and served with an ETag, so
+    repeated views of a shared link are answered from the cache or with 304.
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise Http404("Unsupported image format")
+
+    lineup = get_object_or_404(Lineup.objects.select_related('team', 'match', 'formation'), pk=pk)
+    direction = request.GET.get('direction', lineup.direction)
+    if direction not in ('LR', 'RL'):
+        direction = lineup.direction
+
+    data = lineup_image_data(lineup, direction)
+    version = image_version(data)
+    etag = f'"{version}"'
+
+    # Render (or fetch from the cache) only when the response carries the image
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content = get_lineup_image(lineup, image_format, data, version)
+        response = HttpResponse(content, content_type=IMAGE_FORMATS[image_format])
+        filename = f"lineup_{lineup.name.replace(' ', '_')}_{direction}.{image_format}"
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['ETag'] = etag
+    # Viewers must be logged in, so only browsers may keep a copy - and revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 class FormationTemplateListView(LoginRequiredMixin, ListView):
     model = FormationTemplate
     template_name = 'teammanager/formation_list.html'
@@ -1097,22 +1215,6 @@ class FormationTemplateListView(LoginRequiredMixin, ListView):
             return redirect('lineup-list')
         return super().dispatch(request, *args, **kwargs)
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-
 
 class FormationTemplateCreateView(LoginRequiredMixin, CreateView):
     model = FormationTemplate
@@ -1125,23 +1227,7 @@ class FormationTemplateCreateView(LoginRequiredMixin, CreateView):
             messages.error(request, "You don't have permission to create formations.")
             return redirect('formation-list')
         return super().dispatch(request, *args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-    
     def form_valid(self, form):
         messages.success(self.request, "Formation template created successfully.")
         return super().form_valid(form)
@@ -1162,17 +1248,6 @@ class FormationTemplateUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         context['editing'] = True
         
         return context
@@ -1192,23 +1267,7 @@ class FormationTemplateDeleteView(LoginRequiredMixin, DeleteView):
             messages.error(request, "You don't have permission to delete formations.")
             return redirect('formation-list')
         return super().dispatch(request, *args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-    
     def delete(self, request, *args, **kwargs):
         messages.success(request, "Formation template deleted successfully.")
         return super().delete(request, *args, **kwargs)
@@ -1225,22 +1284,6 @@ class LineupPositionListView(LoginRequiredMixin, ListView):
             return redirect('lineup-list')
         return super().dispatch(request, *args, **kwargs)
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-
 
 class LineupPositionCreateView(LoginRequiredMixin, CreateView):
     model = LineupPosition
@@ -1253,23 +1296,7 @@ class LineupPositionCreateView(LoginRequiredMixin, CreateView):
             messages.error(request, "You don't have permission to create positions.")
             return redirect('position-list')
         return super().dispatch(request, *args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-    
     def form_valid(self, form):
         messages.success(self.request, "Position created successfully.")
         return super().form_valid(form)
@@ -1290,17 +1317,6 @@ class LineupPositionUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
         context['editing'] = True
         
         return context
@@ -1320,23 +1336,7 @@ class LineupPositionDeleteView(LoginRequiredMixin, DeleteView):
             messages.error(request, "You don't have permission to delete positions.")
             return redirect('position-list')
         return super().dispatch(request, *args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
         
-        # Pass common user role flags to template
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['is_admin'] = profile.is_admin() and profile.is_approved()
-                context['is_coach'] = profile.is_coach() and profile.is_approved() 
-                context['is_player'] = profile.is_player() and profile.is_approved()
-                context['is_approved'] = profile.is_approved()
-            except:
-                pass
-                
-        return context
-    
     def delete(self, request, *args, **kwargs):
         messages.success(request, "Position deleted successfully.")
         return super().delete(request, *args, **kwargs)
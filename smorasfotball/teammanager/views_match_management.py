@@ -22,12 +22,13 @@ from .models import (
 from .forms import (
     MatchSessionForm, PlayerSelectionSessionForm, SubstitutionForm
 )
+from .roles import get_roles
 from .views_lineup import is_coach_or_admin
 
 
 def is_approved_user(user):
     """Check if user is an approved user (any role)"""
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.is_approved()
+    return get_roles(user).is_approved
 
 
 @login_required
@@ -63,10 +64,12 @@ def match_session_detail(request, pk):
     match_session = get_object_or_404(MatchSession, pk=pk)
     
     # Get all players for this session
-    playing_times = PlayingTime.objects.filter(match_session=match_session)
+    playing_times = PlayingTime.objects.filter(match_session=match_session).select_related('player')
     
     # Get all substitutions for this session
-    substitutions = PlayerSubstitution.objects.filter(match_session=match_session).order_by('minute')
+    substitutions = PlayerSubstitution.objects.filter(
+        match_session=match_session
+    ).select_related('player_in', 'player_out').order_by('minute')
     
     # Calculate current game time if session is active
     current_game_time = None
@@ -359,7 +362,7 @@ def match_session_players(request, pk):
             return redirect('match-session-detail', pk=match_session.pk)
     else:
         # Check if we already have players for this session
-        existing_players = PlayingTime.objects.filter(match_session=match_session)
+        existing_players = PlayingTime.objects.filter(match_session=match_session).select_related('player')
         
         if existing_players.exists():
             # Pre-select existing players
@@ -438,7 +441,7 @@ def match_session_start(request, pk):
     match_session.save()
     
     # Update all players in this match
-    playing_times = PlayingTime.objects.filter(match_session=match_session)
+    playing_times = PlayingTime.objects.filter(match_session=match_session).select_related('player')
     
     # First, update players on pitch
     for pt in playing_times.filter(is_on_pitch=True):
@@ -503,7 +506,7 @@ def match_session_stop(request, pk):
         team = match.smoras_team
         
         # Get all players who participated in this match session
-        for playing_time in PlayingTime.objects.filter(match_session=match_session):
+        for playing_time in PlayingTime.objects.filter(match_session=match_session).select_related('player'):
             # Get or create a match appearance record
             appearance, created = MatchAppearance.objects.get_or_create(
                 player=playing_time.player,
@@ -719,8 +722,8 @@ def match_session_pitch_view(request, pk):
     match_session = get_object_or_404(MatchSession, pk=pk)
     
     # Get playing time records
-    on_pitch = PlayingTime.objects.filter(match_session=match_session, is_on_pitch=True)
-    on_bench = PlayingTime.objects.filter(match_session=match_session, is_on_pitch=False)
+    on_pitch = PlayingTime.objects.filter(match_session=match_session, is_on_pitch=True).select_related('player')
+    on_bench = PlayingTime.objects.filter(match_session=match_session, is_on_pitch=False).select_related('player')
     
     # Calculate game time and next substitution if match is active
     current_game_time = None
@@ -816,7 +819,7 @@ def get_sub_recommendations(request, session_pk):
         
         # Calculate current playing times
         now = timezone.now()
-        playing_times = PlayingTime.objects.filter(match_session=match_session)
+        playing_times = PlayingTime.objects.filter(match_session=match_session).select_related('player')
         
         # Players currently on pitch
         players_on_pitch = []
@@ -966,7 +969,7 @@ def update_playing_times(request, session_pk):
         
         # Calculate current playing times without saving to database
         now = timezone.now()
-        playing_times = PlayingTime.objects.filter(match_session=match_session)
+        playing_times = PlayingTime.objects.filter(match_session=match_session).select_related('player')
         
         # Match statistics
         next_sub_countdown = None
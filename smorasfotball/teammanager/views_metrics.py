@@ -0,0 +1,40 @@
+import base64
+import binascii
+
+from django.contrib.auth import authenticate
+from django.http import HttpResponse
+from django.views.decorators.cache import never_cache
+
+from . import metrics
+from .models import MatchSession
+
+
+def _superuser(request):
+    """The superuser making the request: logged in, or by HTTP basic auth as Prometheus scrapes"""
+    if request.user.is_authenticated:
+        return request.user if request.user.is_superuser else None
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    user = authenticate(request, username=username, password=password)
+    return user if user is not None and user.is_superuser else None
+
+
+@never_cache
+def metrics_view(request):
+    """Site metrics in the Prometheus text format, for superusers"""
+    if _superuser(request) is None:
+        response = HttpResponse('Superuser credentials required\n', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Basic realm="metrics"'
+        return response
+
+    gauges = {
+        'active_match_sessions': (
+            'Match sessions currently being played', MatchSession.objects.filter(is_active=True).count()
+        ),
+    }
+    return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
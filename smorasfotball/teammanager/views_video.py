@@ -11,21 +11,13 @@ from django.db.models import Count, Q
 from .models import Match, MatchSession, Player
 from .models_video import VideoClip, HighlightReel, HighlightClipAssociation
 from .forms import VideoClipForm, HighlightReelForm
+from .roles import get_roles
 
 # Permission helpers
 def can_edit_videos(user):
     """Check if user can edit videos (admin, coach)"""
-    if not user.is_authenticated:
-        return False
-    
-    if user.is_superuser:
-        return True
-    
-    profile = getattr(user, 'profile', None)
-    if not profile:
-        return False
-    
-    return profile.is_admin() or profile.is_coach()
+    roles = get_roles(user)
+    return roles.is_superuser or roles.is_coach_or_admin
 
 def can_view_videos(user):
     """Check if user can view videos (authenticated)"""
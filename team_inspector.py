@@ -8,8 +8,6 @@ between the log reports and the actual database content.
 
 import os
 import sys
-import json
-from collections import defaultdict
 from pathlib import Path
 
 # Add Django project to path
@@ -24,6 +22,7 @@ try:
     from django.conf import settings
     from django.contrib.auth.models import User
     from teammanager.models import Team, Player, Match, MatchAppearance
+    from teammanager import backup_stream
 except ImportError:
     print("Error: Django could not be imported. Make sure Django is installed.")
     sys.exit(1)
@@ -40,25 +39,21 @@ def check_deployment_db_json():
         print(f"Error: {deployment_db} not found")
         return {}
     
-    # Load and parse the JSON file
+    # Scan the JSON file one object at a time
     try:
-        with open(deployment_db, 'r') as f:
-            content = f.read()
-            data = json.loads(content)
+        model_counts = backup_stream.model_counts(deployment_db)
         
-        # Count model types
-        model_counts = defaultdict(int)
-        for item in data:
-            model_counts[item.get('model', 'unknown')] += 1
-        
-        print(f"JSON file size: {len(content)} bytes")
-        print(f"Total records: {len(data)}")
+        print(f"JSON file size: {deployment_db.stat().st_size} bytes")
+        print(f"Total records: {sum(model_counts.values())}")
         print("\nModel counts:")
         for model, count in sorted(model_counts.items()):
             print(f"  - {model}: {count}")
         
         # Specifically look for team records
-        team_records = [item for item in data if item.get('model') == 'teammanager.team']
+        team_records = [
+            item for item in backup_stream.iter_backup_objects(deployment_db)
+            if item.get('model') == 'teammanager.team'
+        ]
         print(f"\nTeam records in JSON: {len(team_records)}")
         for team in team_records:
             print(f"  - {team.get('fields', {}).get('name')} (ID: {team.get('pk')})")
@@ -98,18 +93,14 @@ def fix_deployment_json_if_needed():
         print(f"Error: Failed to create fresh backup at {fresh_backup}")
         return False
     
-    # Parse the fresh backup
+    # Count team records in the fresh backup without loading it whole
     try:
-        with open(fresh_backup, 'r') as f:
-            data = json.loads(f.read())
-        
-        # Count team records in fresh backup
-        team_records = [item for item in data if item.get('model') == 'teammanager.team']
-        print(f"Team records in fresh backup: {len(team_records)}")
+        team_count = backup_stream.model_counts(fresh_backup).get('teammanager.team', 0)
+        print(f"Team records in fresh backup: {team_count}")
         
         # If team counts don't match, use the fresh backup
-        if len(team_records) != db_team_count:
-            print(f"Warning: Team count mismatch between fresh backup ({len(team_records)}) and database ({db_team_count})")
+        if team_count != db_team_count:
+            print(f"Warning: Team count mismatch between fresh backup ({team_count}) and database ({db_team_count})")
             return False
         
         # Update the deployment_db.json file